@@ -4,7 +4,9 @@ from .models import (
     Role, Profile, 
     Department, Program,
     Course, CourseOffering, OfferingTeacher, ClassTime,
-    Enrollment, FavoriteCourse, CreditSummary
+    Enrollment, FavoriteCourse, WaitlistEntry, AllocationRound, CoursePreference, CreditSummary,
+    CatalogChange, EnrollmentEvent, EventCheckpoint, OfferingSearchDocument, CourseSimilarity, Classroom, ClassroomOccupancy, TeacherOccupancy,
+    Job,
 )
 
 # ===== 使用者相關 =====
@@ -99,7 +101,85 @@ class FavoriteCourseAdmin(admin.ModelAdmin):
     list_display = ['student', 'offering', 'created_at']
     search_fields = ['student__username', 'offering__course__course_name']
 
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['student', 'offering', 'status', 'joined_at']
+    list_filter = ['status', 'offering__academic_year', 'offering__semester']
+    search_fields = ['student__username', 'student__profile__real_name', 'offering__course__course_name']
+
+@admin.register(AllocationRound)
+class AllocationRoundAdmin(admin.ModelAdmin):
+    list_display = ['academic_year', 'semester', 'opens_at', 'closes_at', 'status', 'allocated_at']
+    list_filter = ['status']
+    readonly_fields = ['seed', 'allocated_at']
+
+@admin.register(CoursePreference)
+class CoursePreferenceAdmin(admin.ModelAdmin):
+    list_display = ['student', 'offering', 'rank', 'result']
+    list_filter = ['result', 'allocation_round']
+    search_fields = ['student__username', 'student__profile__real_name', 'offering__course__course_name']
+
 @admin.register(CreditSummary)
 class CreditSummaryAdmin(admin.ModelAdmin):
     list_display = ['student', 'total_credits', 'passed_credits', 'gpa']
-    search_fields = ['student__username', 'student__profile__real_name']
\ No newline at end of file
+    search_fields = ['student__username', 'student__profile__real_name']
+
+
+# ===== 目錄同步 =====
+
+@admin.register(CatalogChange)
+class CatalogChangeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'offering_id', 'action', 'changed_at']
+    list_filter = ['action']
+
+
+@admin.register(EnrollmentEvent)
+class EnrollmentEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'student_id', 'offering_id', 'created_at']
+    list_filter = ['kind']
+
+
+@admin.register(EventCheckpoint)
+class EventCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'position', 'updated_at']
+
+
+@admin.register(OfferingSearchDocument)
+class OfferingSearchDocumentAdmin(admin.ModelAdmin):
+    list_display = ['offering_id', 'academic_year', 'semester', 'course_type', 'teacher_names', 'current_students', 'max_students', 'updated_at']
+    list_filter = ['academic_year', 'semester', 'course_type']
+    search_fields = ['search_text']
+
+
+@admin.register(CourseSimilarity)
+class CourseSimilarityAdmin(admin.ModelAdmin):
+    list_display = ['course', 'similar_course', 'score', 'computed_at']
+    search_fields = ['course__course_code', 'course__course_name']
+
+
+@admin.register(Classroom)
+class ClassroomAdmin(admin.ModelAdmin):
+    list_display = ['name', 'building', 'capacity', 'is_active']
+    list_filter = ['building', 'is_active']
+    list_editable = ['capacity', 'is_active']
+    search_fields = ['name', 'building']
+
+
+@admin.register(ClassroomOccupancy)
+class ClassroomOccupancyAdmin(admin.ModelAdmin):
+    list_display = ['classroom', 'academic_year', 'semester', 'updated_at']
+    list_filter = ['academic_year', 'semester']
+
+
+@admin.register(TeacherOccupancy)
+class TeacherOccupancyAdmin(admin.ModelAdmin):
+    list_display = ['teacher', 'academic_year', 'semester', 'updated_at']
+    list_filter = ['academic_year', 'semester']
+    search_fields = ['teacher__username', 'teacher__profile__real_name']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['result', 'error', 'attempts', 'started_at', 'finished_at']
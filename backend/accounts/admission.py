@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+選課排隊（虛擬等候室）
+開放選課瞬間大量請求同時進來時，只讓設定數量的請求同時執行選課、退選，
+其餘的回傳 503 + Retry-After 與排隊順位，避免資料庫連線被佔滿
+
+以號碼牌維持先來後到：
+- 第一次進來的請求領一張號碼牌（遞增的序號，簽章後放在 cookie 與 X-Queue-Token，重試時帶回來）
+- 號碼 <= released 的才可以嘗試進入，進入時 active 計數不能超過上限；每完成一個請求 released 加 1
+- 有空位但輪到的號碼牌沒有回來（使用者離開）時，由後面的請求把 released 往前推，不會卡住
+- 號碼牌綁定使用者，且用過即失效（已使用的號碼記錄在計數中，TTL 內重送或分享給別人都無效），下一次選課重新排隊
+
+計數存放位置可透過 settings.ADMISSION_COUNTER_STORE 替換（見 counters.py）：
+單一 worker 或測試時用 LocalCounterStore，多個 worker 用 CacheCounterStore 搭配共用的快取
+"""
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+
+from . import counters
+
+TOKEN_HEADER = 'HTTP_X_QUEUE_TOKEN'
+TOKEN_COOKIE = 'queue_token'
+
+# 計數項目（每個排隊名稱各一組）
+ISSUED = 'issued'  # 最後發出的號碼
+RELEASED = 'released'  # 號碼 <= released 的可以進入
+ACTIVE = 'active'  # 正在執行的請求數
+ADMITTED = 'admitted'
+REJECTED = 'rejected'
+WAIT_MS = 'wait_ms'  # 進入前等待時間合計
+SERVICE_MS = 'service_ms'  # 執行時間合計
+COUNTERS = (ISSUED, RELEASED, ACTIVE, ADMITTED, REJECTED, WAIT_MS, SERVICE_MS)
+
+
+def get_store():
+    """取得設定中的計數存放位置"""
+    return counters.get_store(settings.ADMISSION_COUNTER_STORE, settings.ADMISSION_COUNTER_OPTIONS)
+
+
+class WaitingRoom:
+    """一個排隊名稱（例如 enrollment）的號碼牌與計數"""
+
+    def __init__(self, name, store=None):
+        self.name = name
+        self.store = store or get_store()
+        self.limit = settings.ADMISSION_MAX_CONCURRENT
+
+    def _key(self, counter):
+        return f'admission:{self.name}:{counter}'
+
+    def _incr(self, counter, delta=1):
+        return self.store.incr(self._key(counter), delta)
+
+    def _get(self, *counters):
+        values = self.store.get_many([self._key(counter) for counter in counters])
+        return [values[self._key(counter)] for counter in counters]
+
+    # ----- 號碼牌 -----
+
+    def issue(self, user_key=None):
+        """發一張號碼牌（綁定 user_key），回傳 (號碼, 簽章後的 token)"""
+        ticket = self._incr(ISSUED)
+        token = signing.dumps(
+            {'ticket': ticket, 'issued_at': time.time(), 'user': user_key}, salt=f'admission:{self.name}'
+        )
+        return ticket, token
+
+    def read_token(self, token, user_key=None):
+        """驗證 token，回傳 (號碼, 發出時間)；無效、過期、不是這位使用者的或已使用過時回傳 None"""
+        try:
+            data = signing.loads(token, salt=f'admission:{self.name}', max_age=settings.ADMISSION_TOKEN_TTL)
+            ticket, issued_at = data['ticket'], data['issued_at']
+            if data.get('user') != user_key:
+                return None
+        except (signing.BadSignature, KeyError, TypeError):
+            return None
+        if self._get(self._used(ticket))[0]:
+            return None
+        return ticket, issued_at
+
+    def _used(self, ticket):
+        return f'used:{ticket}'
+
+    def use(self, ticket):
+        """標示號碼牌已使用；同一張號碼牌同時被使用時只有一個會回傳 True"""
+        key = self._key(self._used(ticket))
+        return self.store.incr(key, timeout=settings.ADMISSION_TOKEN_TTL) == 1
+
+    # ----- 進入與離開 -----
+
+    def try_enter(self, ticket):
+        """輪到這個號碼且有空位時佔用一個位置並回傳 True"""
+        released, active = self._get(RELEASED, ACTIVE)
+        if ticket > released:
+            if active >= self.limit:
+                return False
+            # 有空位但前面的號碼沒有回來：released 往前推到這個號碼（最多推空位數）
+            released = self._incr(RELEASED, min(self.limit - active, ticket - released))
+            if ticket > released:
+                return False
+
+        if self._incr(ACTIVE) > self.limit:
+            self._incr(ACTIVE, -1)
+            return False
+        return True
+
+    def abandon(self):
+        """進入後發現號碼牌已被使用：歸還位置（不讓下一個號碼進入，也不計入統計）"""
+        self._incr(ACTIVE, -1)
+
+    def leave(self, waited, elapsed):
+        """請求結束：釋放位置、讓下一個號碼進入，並記錄等待與執行時間"""
+        self._incr(ACTIVE, -1)
+        issued, released = self._get(ISSUED, RELEASED)
+        if released < issued:  # 沒有人排隊時不往前推，之後來的請求仍依號碼進入
+            self._incr(RELEASED)
+        self._incr(ADMITTED)
+        self._incr(WAIT_MS, int(waited * 1000))
+        self._incr(SERVICE_MS, int(elapsed * 1000))
+
+    def reject(self, ticket):
+        """沒有進入：回傳 (排隊順位, 建議幾秒後重試)"""
+        self._incr(REJECTED)
+        released, admitted, service_ms = self._get(RELEASED, ADMITTED, SERVICE_MS)
+        position = max(1, ticket - released)
+        average_service = service_ms / admitted / 1000 if admitted else 1.0
+        retry_after = math.ceil(position * average_service / max(1, self.limit))
+        return position, min(max(1, retry_after), settings.ADMISSION_MAX_RETRY_AFTER)
+
+    def metrics(self):
+        """目前排隊狀況：排隊人數、執行中、累計進入 / 拒絕次數與平均等待、執行時間"""
+        values = dict(zip(COUNTERS, self._get(*COUNTERS)))
+        admitted = values[ADMITTED]
+        return {
+            'queue': self.name,
+            'max_concurrent': self.limit,
+            'active': values[ACTIVE],
+            'queue_depth': max(0, values[ISSUED] - values[RELEASED]),
+            'issued': values[ISSUED],
+            'released': values[RELEASED],
+            'admitted': admitted,
+            'rejected': values[REJECTED],
+            'avg_wait_ms': round(values[WAIT_MS] / admitted, 1) if admitted else 0,
+            'avg_service_ms': round(values[SERVICE_MS] / admitted, 1) if admitted else 0,
+        }
+
+
+def _set_token_cookie(response, token):
+    response.set_cookie(
+        TOKEN_COOKIE, token, max_age=settings.ADMISSION_TOKEN_TTL, httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE, secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+def admission_control(name):
+    """
+    view 裝飾器（放在 @api_view 外層）：經過排隊才執行 view
+    ADMISSION_ENABLED 為 False 時直接執行
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not settings.ADMISSION_ENABLED:
+                return view(request, *args, **kwargs)
+
+            room = WaitingRoom(name)
+            user_key = request.user.pk if request.user.is_authenticated else None
+            token = request.META.get(TOKEN_HEADER) or request.COOKIES.get(TOKEN_COOKIE)
+            entry = room.read_token(token, user_key) if token else None
+            if entry is None:
+                ticket, token = room.issue(user_key)
+                issued_at = time.time()
+            else:
+                ticket, issued_at = entry
+
+            entered = room.try_enter(ticket)
+            if entered and not room.use(ticket):
+                # 同一張號碼牌同時重送：只有一個請求可以使用，其餘重新排隊
+                room.abandon()
+                ticket, token = room.issue(user_key)
+                entered = False
+            if not entered:
+                position, retry_after = room.reject(ticket)
+                response = JsonResponse({
+                    'error': f'目前選課人數眾多，您排在第 {position} 位，請於 {retry_after} 秒後重試',
+                    'queue_token': token,
+                    'position': position,
+                    'retry_after': retry_after,
+                }, status=503)
+                response['Retry-After'] = str(retry_after)
+                response['X-Queue-Token'] = token
+                _set_token_cookie(response, token)
+                return response
+
+            started = time.time()
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                room.leave(started - issued_at, time.time() - started)
+            # 號碼牌用過即失效（已記錄為使用過），清除 cookie
+            if TOKEN_COOKIE in request.COOKIES:
+                response.delete_cookie(TOKEN_COOKIE, samesite=settings.SESSION_COOKIE_SAMESITE)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+志願分發（AllocationRound）的志願填寫
+學期有志願分發時，分發完成前不開放一般選課（enroll_course），學生改為在填寫期間送出志願序；
+截止後由 python manage.py allocate_seats 批次分發（見 lottery.py）
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import AllocationRound, CourseOffering, CoursePreference
+
+
+class AllocationError(Exception):
+    """志願內容不正確或不在填寫期間（由 view 轉成 400 回應）"""
+
+
+def pending_round(academic_year, semester):
+    """這學期尚未分發的志願分發；沒有時回傳 None（一般選課）"""
+    return AllocationRound.objects.filter(
+        academic_year=academic_year, semester=semester, status='open'
+    ).first()
+
+
+def window_display(allocation_round):
+    opens_at = allocation_round.opens_at.strftime('%Y-%m-%d %H:%M')
+    closes_at = allocation_round.closes_at.strftime('%Y-%m-%d %H:%M')
+    return f'{opens_at} ~ {closes_at}'
+
+
+def submit_preferences(allocation_round, student, offering_ids):
+    """以新的志願序（offering_ids 依優先順序）取代學生原本的志願，回傳志願數"""
+    if not allocation_round.is_accepting():
+        raise AllocationError(f'志願填寫時間為 {window_display(allocation_round)}')
+
+    try:
+        offering_ids = [int(offering_id) for offering_id in offering_ids]
+    except (TypeError, ValueError):
+        raise AllocationError('offering_ids 必須是開課 ID 列表')
+    if len(set(offering_ids)) != len(offering_ids):
+        raise AllocationError('志願中有重複的開課')
+    if len(offering_ids) > settings.ALLOCATION_MAX_PREFERENCES:
+        raise AllocationError(f'最多填寫 {settings.ALLOCATION_MAX_PREFERENCES} 個志願')
+
+    valid_ids = set(CourseOffering.objects.filter(
+        id__in=offering_ids,
+        academic_year=allocation_round.academic_year,
+        semester=allocation_round.semester,
+    ).exclude(status='closed').values_list('id', flat=True))
+    invalid_ids = [offering_id for offering_id in offering_ids if offering_id not in valid_ids]
+    if invalid_ids:
+        raise AllocationError(f'這些開課不在本學期或已停開：{invalid_ids}')
+
+    with transaction.atomic():
+        CoursePreference.objects.filter(allocation_round=allocation_round, student=student).delete()
+        CoursePreference.objects.bulk_create([
+            CoursePreference(allocation_round=allocation_round, student=student, offering_id=offering_id, rank=rank)
+            for rank, offering_id in enumerate(offering_ids, start=1)
+        ])
+    return len(offering_ids)
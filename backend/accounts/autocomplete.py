@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+搜尋框自動完成（typeahead）
+在 process 記憶體中建立課程名稱、課程代碼、英文名稱、教師姓名的索引，每次按鍵不查資料庫：
+- 前綴比對：所有詞條（及其中每個英文單字開頭）排序後以二分搜尋找出前綴相符的範圍；
+  三個字以內的短前綴符合的詞條太多，建立索引時就先算好各前綴的前幾名
+- 中間比對：字元 bigram 倒排索引取交集後再確認子字串，輸入「結構」也能找到「資料結構」
+
+伺服器啟動時建立（見 backend/wsgi.py、asgi.py），之後每 AUTOCOMPLETE_REBUILD_INTERVAL 秒在背景執行緒
+比對文字版本號（存在資料庫，所有 worker 共用；選課只改變名額，不會變動），
+版本變動或索引超過 AUTOCOMPLETE_MAX_AGE 秒時重建，重建完成前仍以舊索引回應
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from .catalog_cache import get_text_version
+
+# 同分時依類型排序：課程名稱 > 課程代碼 > 教師 > 英文名稱
+KIND_ORDER = {'course_name': 0, 'course_code': 1, 'teacher': 2, 'course_name_en': 3}
+
+MAX_LIMIT = 20
+SHORT_PREFIX = 3
+
+
+def normalize(text):
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def _bigrams(text):
+    text = text.replace(' ', '')
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class Entry:
+    __slots__ = ('text', 'kind', 'key', 'weight', 'course_code')
+
+    def __init__(self, text, kind, weight, course_code=None):
+        self.text = text
+        self.kind = kind
+        self.key = normalize(text)
+        self.weight = weight
+        self.course_code = course_code
+
+    def as_dict(self):
+        data = {'text': self.text, 'type': self.kind}
+        if self.course_code:
+            data['course_code'] = self.course_code
+        return data
+
+
+class AutocompleteIndex:
+    """唯讀索引；重建時產生新的物件再整個替換，查詢不需要加鎖"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+        prefix_keys = []
+        self.grams = defaultdict(set)
+        for i, entry in enumerate(entries):
+            prefix_keys.append((entry.key, i))
+            # 英文名稱的每個單字開頭也可前綴比對（例如 "struct" → "Data Structures"）
+            for pos, char in enumerate(entry.key):
+                if char == ' ':
+                    prefix_keys.append((entry.key[pos + 1:], i))
+            for gram in _bigrams(entry.key):
+                self.grams[gram].add(i)
+
+        # 很短的前綴（例如只打一個字母）符合的詞條太多，建立時先算好前幾名
+        short = defaultdict(list)
+        for key, i in prefix_keys:
+            rank = self._rank(i, 0 if key == self.entries[i].key else 1)
+            for n in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                short[key[:n]].append(rank)
+        self.short_prefix = {prefix: heapq.nsmallest(MAX_LIMIT * 2, ranks) for prefix, ranks in short.items()}
+
+        prefix_keys.sort()
+        self.prefix_keys = [key for key, _ in prefix_keys]
+        self.prefix_ids = [i for _, i in prefix_keys]
+
+    def _rank(self, i, match_class):
+        """排序鍵：比對方式、熱門程度、類型、長度（越小越前面）"""
+        entry = self.entries[i]
+        return (match_class, -entry.weight, KIND_ORDER.get(entry.kind, 9), len(entry.key), i)
+
+    def search(self, query, limit=10):
+        limit = min(limit, MAX_LIMIT)
+        query = normalize(query)
+        if not query:
+            return []
+
+        candidates = {}
+
+        # 前綴比對（詞條開頭為 0，單字開頭為 1）
+        if len(query) <= SHORT_PREFIX:
+            for rank in self.short_prefix.get(query, ()):
+                i = rank[-1]
+                candidates[i] = min(candidates.get(i, 9), rank[0])
+        else:
+            start = bisect_left(self.prefix_keys, query)
+            for pos in range(start, len(self.prefix_keys)):
+                if not self.prefix_keys[pos].startswith(query):
+                    break
+                i = self.prefix_ids[pos]
+                match_class = 0 if self.entries[i].key.startswith(query) else 1
+                candidates[i] = min(candidates.get(i, 9), match_class)
+
+        # 前綴結果不足時再找中間比對
+        if len(candidates) < limit and len(query.replace(' ', '')) >= 2:
+            gram_sets = sorted((self.grams.get(gram, set()) for gram in _bigrams(query)), key=len)
+            matched = set.intersection(*gram_sets) if gram_sets else set()
+            for i in matched:
+                if i not in candidates and query in self.entries[i].key:
+                    candidates[i] = 2
+
+        ranked = heapq.nsmallest(limit * 2, candidates, key=lambda i: self._rank(i, candidates[i]))
+
+        results, seen = [], set()
+        for i in ranked:
+            entry = self.entries[i]
+            if (entry.kind, entry.key) in seen:
+                continue
+            seen.add((entry.kind, entry.key))
+            results.append(entry.as_dict())
+            if len(results) >= limit:
+                break
+        return results
+
+
+def build_entries():
+    """從資料庫讀出詞條；權重為目前選課人數（熱門的課程與教師排前面）"""
+    from .models import Course, Profile
+
+    entries = []
+    courses = Course.objects.annotate(
+        popularity=Coalesce(Sum('offerings__current_students'), 0),
+        offering_count=Count('offerings'),
+    ).filter(offering_count__gt=0).values_list(
+        'course_code', 'course_name', 'course_name_en', 'popularity'
+    )
+    for code, name, name_en, popularity in courses:
+        entries.append(Entry(name, 'course_name', popularity, code))
+        entries.append(Entry(code, 'course_code', popularity, code))
+        if name_en:
+            entries.append(Entry(name_en, 'course_name_en', popularity, code))
+
+    teachers = Profile.objects.filter(
+        user__teaching_offerings__isnull=False
+    ).annotate(
+        popularity=Coalesce(Sum('user__teaching_offerings__offering__current_students'), 0)
+    ).values_list('real_name', 'popularity')
+    for real_name, popularity in teachers:
+        if real_name:
+            entries.append(Entry(real_name, 'teacher', popularity))
+
+    return entries
+
+
+_index = None
+_index_version = None
+_built_at = 0.0
+_checked_at = 0.0
+_lock = threading.Lock()
+_rebuilding = False
+
+
+def rebuild(version=None):
+    """重建索引並替換；回傳新的索引"""
+    global _index, _index_version, _built_at
+    if version is None:
+        version = get_text_version()
+    started = time.perf_counter()
+    index = AutocompleteIndex(build_entries())
+    with _lock:
+        _index, _index_version, _built_at = index, version, time.monotonic()
+    print(f"自動完成索引已建立: {len(index.entries)} 個詞條，耗時 {(time.perf_counter() - started) * 1000:.0f} ms")
+    return index
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    from django.db import close_old_connections
+    try:
+        rebuild(version)
+    except Exception as e:
+        print(f"自動完成索引重建錯誤: {str(e)}")
+    finally:
+        close_old_connections()
+        with _lock:
+            _rebuilding = False
+
+
+def _refresh_in_background():
+    """文字版本變動或索引過舊時重建（版本號存在資料庫，在背景執行緒查詢）"""
+    global _rebuilding
+    from django.db import close_old_connections
+    try:
+        version = get_text_version()
+        if version != _index_version or time.monotonic() - _built_at >= settings.AUTOCOMPLETE_MAX_AGE:
+            rebuild(version)
+    except Exception as e:
+        print(f"自動完成索引重建錯誤: {str(e)}")
+    finally:
+        close_old_connections()
+        with _lock:
+            _rebuilding = False
+
+
+def get_index():
+    """取得目前的索引；每 AUTOCOMPLETE_REBUILD_INTERVAL 秒在背景檢查是否需要重建，尚未建立過時同步建立"""
+    global _rebuilding, _checked_at
+    index = _index
+    if index is None:
+        return rebuild()
+
+    now = time.monotonic()
+    if now - _checked_at >= settings.AUTOCOMPLETE_REBUILD_INTERVAL:
+        with _lock:
+            start = not _rebuilding
+            if start:
+                _rebuilding, _checked_at = True, now
+        if start:
+            threading.Thread(target=_refresh_in_background, name='autocomplete-refresh', daemon=True).start()
+    return index
+
+
+def search(query, limit=10):
+    return get_index().search(query, limit)
+
+
+def warm_up():
+    """伺服器啟動時在背景先建立索引，第一個請求不必等待"""
+    global _rebuilding
+    with _lock:
+        if _index is not None or _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(
+        target=_rebuild_in_background, args=(None,), name='autocomplete-warm-up', daemon=True
+    ).start()
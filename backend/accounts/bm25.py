@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+BM25 相關度排序（search_courses 的 sort=relevance）
+以課程名稱（中英）、代碼、課程描述、英文描述建立倒排索引，依 BM25 計算每門課程的相關度
+
+索引存成檔案（settings.BM25_INDEX_PATH），各 worker 以 mmap 唯讀開啟：
+啟動時不必重新讀資料庫建索引，作業系統也只需在記憶體保留一份
+
+檔案格式（little-endian，各區段以 8 bytes 對齊）：
+    標頭：magic、文字版本、文件數、詞彙數、平均長度、各區段位移
+    doc_ids      int64  × 文件數      課程 ID
+    doc_lens     uint32 × 文件數      文件長度（詞數）
+    term_offsets uint32 × (詞彙數+1)  詞彙在 term_blob 的位移（詞彙依 UTF-8 位元組排序）
+    post_offsets uint32 × (詞彙數+1)  詞彙在 postings 的位移
+    term_blob    UTF-8 詞彙串接
+    post_docs    uint32 × 總筆數      文件索引
+    post_tfs     uint32 × 總筆數      詞頻
+
+文字版本（見 catalog_cache.py）與索引檔標頭記錄的版本不同時（至多每 BM25_REBUILD_INTERVAL 秒檢查一次；
+選課只改變名額，不會觸發）在背景重建檔案，其他 worker 發現檔案更新時重新 mmap；重建完成前沿用舊索引
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, FloatField, Value, When
+
+from .catalog_cache import get_text_version
+from .search_index import tokenize
+
+MAGIC = b'BM25IDX1'
+HEADER = struct.Struct('<8sQIId7Q')
+
+K1 = 1.2
+B = 0.75
+NAME_BOOST = 3  # 課程名稱的詞頻加權（名稱中出現的詞比描述中出現的重要）
+
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+
+# ===== 建立索引檔 =====
+
+def _course_terms(course):
+    names = tokenize(f'{course.course_name} {course.course_name_en or ""}').split()
+    other = tokenize(
+        f'{course.course_code} {course.old_code or ""} {course.description} {course.description_en}'
+    ).split()
+    return Counter(names * NAME_BOOST + other)
+
+
+def build_index_file(path=None, text_version=None):
+    """
+    從資料庫讀出有開課的課程，寫入索引檔（先寫暫存檔再替換，讀取中的 worker 不受影響）
+    text_version: 寫入標頭的文字版本；應在讀取課程之前取得，建立期間的異動會在下次檢查時重建
+    """
+    from .models import Course
+
+    path = str(path or settings.BM25_INDEX_PATH)
+    version = get_text_version() if text_version is None else text_version
+
+    courses = Course.objects.filter(offerings__isnull=False).distinct().order_by('id').only(
+        'id', 'course_code', 'course_name', 'course_name_en', 'old_code', 'description', 'description_en'
+    )
+
+    doc_ids = array('q')
+    doc_lens = array('I')
+    postings = {}
+    for course in courses:
+        terms = _course_terms(course)
+        doc_index = len(doc_ids)
+        doc_ids.append(course.id)
+        doc_lens.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings.setdefault(term.encode('utf-8'), []).append((doc_index, tf))
+
+    terms = sorted(postings)
+    term_offsets = array('I', [0])
+    post_offsets = array('I', [0])
+    post_docs = array('I')
+    post_tfs = array('I')
+    blob = bytearray()
+    for term in terms:
+        blob += term
+        term_offsets.append(len(blob))
+        for doc_index, tf in postings[term]:
+            post_docs.append(doc_index)
+            post_tfs.append(tf)
+        post_offsets.append(len(post_docs))
+
+    sections = [doc_ids, doc_lens, term_offsets, post_offsets, bytes(blob), post_docs, post_tfs]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        position = _align(position)
+        offsets.append(position)
+        position += len(section) * (section.itemsize if isinstance(section, array) else 1)
+
+    avgdl = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+    header = HEADER.pack(MAGIC, version, len(doc_ids), len(terms), avgdl, *offsets)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for offset, section in zip(offsets, sections):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(section.tobytes() if isinstance(section, array) else section)
+    os.replace(tmp_path, path)
+    return len(doc_ids), len(terms)
+
+
+# ===== 讀取索引檔 =====
+
+class BM25Index:
+    """以 mmap 開啟的唯讀索引"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+
+        magic, self.version, self.n_docs, self.n_terms, self.avgdl, *offsets = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'不是 BM25 索引檔: {path}')
+
+        def typed(section, fmt, count):
+            start = offsets[section]
+            return view[start:start + count * struct.calcsize(fmt)].cast(fmt)
+
+        self.doc_ids = typed(0, 'q', self.n_docs)
+        self.doc_lens = typed(1, 'I', self.n_docs)
+        self.term_offsets = typed(2, 'I', self.n_terms + 1)
+        self.post_offsets = typed(3, 'I', self.n_terms + 1)
+        self.term_blob = view[offsets[4]:offsets[4] + self.term_offsets[self.n_terms]]
+        total = self.post_offsets[self.n_terms]
+        self.post_docs = typed(5, 'I', total)
+        self.post_tfs = typed(6, 'I', total)
+
+    def _term(self, i):
+        return bytes(self.term_blob[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def _find(self, term):
+        """二分搜尋詞彙，回傳詞彙編號或 None"""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._term(lo) == term:
+            return lo
+        return None
+
+    def score(self, keyword):
+        """回傳 {課程 ID: BM25 分數}（任一詞符合即列入，分數越高越相關）"""
+        scores = {}
+        if not self.n_docs:
+            return scores
+
+        for term in set(tokenize(keyword).split()):
+            i = self._find(term.encode('utf-8'))
+            if i is None:
+                continue
+            start, end = self.post_offsets[i], self.post_offsets[i + 1]
+            df = end - start
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            for pos in range(start, end):
+                doc_index = self.post_docs[pos]
+                tf = self.post_tfs[pos]
+                norm = K1 * (1 - B + B * self.doc_lens[doc_index] / self.avgdl)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        return {self.doc_ids[doc_index]: score for doc_index, score in scores.items()}
+
+
+# ===== 每個 worker 的索引 =====
+
+_index = None
+_index_mtime = None
+_last_checked = 0.0
+_last_rebuild = 0.0
+_rebuilding = False
+_lock = threading.Lock()
+
+
+def _load():
+    """(重新) mmap 索引檔；檔案不存在時回傳 False"""
+    global _index, _index_mtime
+    path = str(settings.BM25_INDEX_PATH)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if mtime != _index_mtime:
+        _index = BM25Index(path)
+        _index_mtime = mtime
+    return True
+
+
+def _rebuild_in_background(check_version=False):
+    """
+    check_version 時先比對文字版本號與索引檔標頭記錄的版本，相同就不重建
+    （版本號存在資料庫，因此在背景執行緒查詢）
+    """
+    global _rebuilding, _last_rebuild
+    from django.db import close_old_connections
+    try:
+        text_version = get_text_version()
+        if check_version and _index is not None and _index.version == text_version:
+            return
+        started = time.perf_counter()
+        docs, terms = build_index_file(text_version=text_version)
+        with _lock:
+            _load()
+        print(f"BM25 索引已重建: {docs} 門課程、{terms} 個詞彙，耗時 {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"BM25 索引重建錯誤: {str(e)}")
+    finally:
+        close_old_connections()
+        with _lock:
+            _rebuilding = False
+            _last_rebuild = time.monotonic()
+
+
+def _start_rebuild(check_version=False):
+    global _rebuilding
+    if _rebuilding:
+        return
+    _rebuilding = True
+    threading.Thread(
+        target=_rebuild_in_background, args=(check_version,), name='bm25-rebuild', daemon=True
+    ).start()
+
+
+def get_index():
+    """
+    取得索引；不查資料庫（版本比對在背景執行緒），因此同步與 async view 都可呼叫
+    尚無索引檔時在背景建立並回傳 None（呼叫端改用全文索引排序）
+    """
+    global _last_checked
+    now = time.monotonic()
+
+    with _lock:
+        if _index is None or now - _last_checked >= settings.BM25_RELOAD_INTERVAL:
+            _last_checked = now
+            if not _load():
+                _start_rebuild()
+                return None
+            if now - _last_rebuild >= settings.BM25_REBUILD_INTERVAL:
+                _start_rebuild(check_version=True)
+
+        return _index
+
+
+def warm_up():
+    """伺服器啟動時先 mmap 索引檔（檔案不存在時在背景建立）"""
+    try:
+        get_index()
+    except Exception as e:
+        print(f"BM25 索引載入錯誤: {str(e)}")
+
+
+# ===== 查詢 =====
+
+def apply_relevance(queryset, keyword):
+    """
+    篩選與關鍵字相關的開課並標上 relevance_rank（負的 BM25 分數，越小越相關）
+    沒有關鍵字時全部為 0；索引尚未建立時改用全文索引篩選（relevance_rank 同樣為 0）
+    """
+    from . import search_index
+
+    if not keyword:
+        return queryset.annotate(relevance_rank=Value(0.0, output_field=FloatField()))
+
+    index = get_index()
+    if index is None:
+        return search_index.apply_keyword_search(queryset, keyword).annotate(
+            relevance_rank=Value(0.0, output_field=FloatField())
+        )
+
+    # 不在這裡截取前幾名：學年度、學期等條件是在 queryset 上篩選的，
+    # 先截取會讓符合條件但全域排名較後的課程消失
+    scores = index.score(keyword)
+    if not scores:
+        return queryset.none().annotate(relevance_rank=Value(0.0, output_field=FloatField()))
+
+    return queryset.filter(course_id__in=list(scores)).annotate(
+        relevance_rank=Case(
+            *[When(course_id=course_id, then=Value(-round(score, 6))) for course_id, score in scores.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
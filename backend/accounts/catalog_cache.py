@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+課程目錄快取
+快取鍵包含「目錄版本號」與「名額版本號」，課程資料異動時遞增目錄版本號、選課退選只改變名額時遞增名額版本號，
+讓舊快取自然失效；分面數量只用目錄版本號，不因選課而失效
+另有「文字版本號」：只在搜尋用的文字（課程名稱、代碼、描述、授課教師）異動時遞增，BM25 與自動完成索引依此重建
+快取內容在寫入時就先壓縮好，命中時直接回傳壓縮後的位元組，不再耗費 CPU
+
+快取內容存在各 process 的快取中，版本號則存在資料庫（CacheVersion）：
+任何一個 worker 遞增版本號，其他 worker 的下一個請求就會改用新的快取鍵，不會繼續回傳舊的內容
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .compression import choose_encoding, compress, decompress, supported_encodings
+from .models import CacheVersion
+
+CATALOG_VERSION_KEY = 'catalog:version'
+SEAT_VERSION_KEY = 'catalog:seat_version'
+TEXT_VERSION_KEY = 'catalog:text_version'
+FAVORITES_VERSION_KEY = 'favorites:version:{user_id}'
+
+
+def _initial_version():
+    # 以時間戳初始化，避免版本號被清除後重新從 1 開始而撞到舊的快取鍵
+    return int(time.time() * 1000)
+
+
+def get_versions(*keys):
+    """一次讀取多個版本號（一次查詢），不存在的先建立"""
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'value'))
+    for key in keys:
+        if key not in versions:
+            versions[key] = CacheVersion.objects.get_or_create(key=key, defaults={'value': _initial_version()})[0].value
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    versions = {key: value async for key, value in CacheVersion.objects.filter(key__in=keys).values_list('key', 'value')}
+    for key in keys:
+        if key not in versions:
+            version, _ = await CacheVersion.objects.aget_or_create(key=key, defaults={'value': _initial_version()})
+            versions[key] = version.value
+    return [versions[key] for key in keys]
+
+
+def _get_version(key):
+    return get_versions(key)[0]
+
+
+async def _aget_version(key):
+    return (await aget_versions(key))[0]
+
+
+def _bump_version(key):
+    # UPDATE ... SET value = value + 1 為原子操作，同時遞增不會互相蓋掉
+    if not CacheVersion.objects.filter(key=key).update(value=F('value') + 1):
+        CacheVersion.objects.get_or_create(key=key, defaults={'value': _initial_version()})
+        CacheVersion.objects.filter(key=key).update(value=F('value') + 1)
+
+
+def get_catalog_version():
+    """取得目前的目錄版本號"""
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+async def aget_catalog_version():
+    return await _aget_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """課程、開課、教師、時段等資料異動時呼叫"""
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_seat_version():
+    """取得目前的名額版本號"""
+    return _get_version(SEAT_VERSION_KEY)
+
+
+def bump_seat_version():
+    """選課、退選、分發等只改變開課人數與狀態時呼叫"""
+    _bump_version(SEAT_VERSION_KEY)
+
+
+def get_text_version():
+    """取得目前的文字版本號"""
+    return _get_version(TEXT_VERSION_KEY)
+
+
+def bump_text_version():
+    """搜尋索引的文字異動時呼叫（見 signals.py）"""
+    _bump_version(TEXT_VERSION_KEY)
+
+
+def get_favorites_version(user_id):
+    """取得某位使用者的收藏版本號（影響 is_favorited 欄位）"""
+    return _get_version(FAVORITES_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_favorites_version(user_id):
+    _bump_version(FAVORITES_VERSION_KEY.format(user_id=user_id))
+
+
+def _digest_key(request, namespace, catalog_version, user_part=None):
+    params = sorted(
+        (key, value)
+        for key in request.GET.keys()
+        for value in request.GET.getlist(key)
+    )
+    parts = [namespace, str(catalog_version), repr(params)]
+    if user_part is not None:
+        parts.append(user_part)
+
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return f'catalog:{namespace}:{digest}'
+
+
+def build_cache_key(request, namespace, per_user=False):
+    """依路徑參數、目錄版本（以及使用者收藏版本）組出快取鍵"""
+    user_part = None
+    if per_user:
+        if request.user.is_authenticated:
+            user_part = f'u{request.user.id}:{get_favorites_version(request.user.id)}'
+        else:
+            user_part = 'anon'
+    catalog_version, seat_version = get_versions(CATALOG_VERSION_KEY, SEAT_VERSION_KEY)
+    return _digest_key(request, namespace, f'{catalog_version}.{seat_version}', user_part)
+
+
+def _precompress(body):
+    """預先壓縮；太小的內容不值得壓縮，直接存原文"""
+    if len(body) < settings.API_COMPRESSION_MIN_SIZE:
+        return {'identity': body}
+    return {encoding: compress(body, encoding) for encoding in supported_encodings()}
+
+
+def _response_from_entry(request, entry, per_user):
+    encoding = None
+    if 'identity' in entry:
+        content = entry['identity']
+    else:
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding in entry:
+            content = entry[encoding]
+        else:
+            # 客戶端不接受任何壓縮：從已存的壓縮內容還原（極少發生）
+            encoding, stored = next(iter(entry.items()))
+            content = decompress(stored, encoding)
+            encoding = None
+
+    response = HttpResponse(content, content_type='application/json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(content))
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie') if per_user else ('Accept-Encoding',))
+    return response
+
+
+def cached_catalog_response(request, namespace, build_payload, per_user=False):
+    """
+    以快取回傳目錄類 JSON 回應
+    build_payload: 快取未命中時呼叫，回傳可序列化的資料
+    per_user: 回應內容是否因使用者不同而不同（例如 is_favorited）
+    """
+    key = build_cache_key(request, namespace, per_user)
+    entry = cache.get(key)
+
+    if entry is None:
+        body = JSONRenderer().render(build_payload())
+        entry = _precompress(body)
+        cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+
+    return _response_from_entry(request, entry, per_user)
+
+
+# ===== 非同步版本（views_async 使用）=====
+
+async def abuild_cache_key(request, namespace, user, per_user=False):
+    """build_cache_key 的非同步版本；user 由呼叫端以 await request.auser() 取得"""
+    user_part = None
+    if per_user:
+        if user.is_authenticated:
+            favorites_version = await _aget_version(FAVORITES_VERSION_KEY.format(user_id=user.id))
+            user_part = f'u{user.id}:{favorites_version}'
+        else:
+            user_part = 'anon'
+    catalog_version, seat_version = await aget_versions(CATALOG_VERSION_KEY, SEAT_VERSION_KEY)
+    return _digest_key(request, namespace, f'{catalog_version}.{seat_version}', user_part)
+
+
+async def acached_catalog_response(request, namespace, build_payload, user, per_user=False):
+    """
+    cached_catalog_response 的非同步版本
+    build_payload: 回傳 awaitable 的函式；快取鍵與內容格式與同步版本相同，兩者共用快取
+    """
+    key = await abuild_cache_key(request, namespace, user, per_user)
+    entry = await cache.aget(key)
+
+    if entry is None:
+        body = JSONRenderer().render(await build_payload())
+        entry = _precompress(body)
+        await cache.aset(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+
+    return _response_from_entry(request, entry, per_user)
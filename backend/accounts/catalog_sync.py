@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+目錄增量同步
+開課相關資料異動時寫入 CatalogChange，客戶端以版本號（或時間戳）取得
+之後新增、更新、刪除的開課，不必重新下載整個學期的課程目錄
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import CatalogChange, CourseOffering
+
+
+def record_offering_changes(offering_ids, action='upsert'):
+    """寫入異動紀錄（一次寫入多筆）"""
+    offering_ids = [offering_id for offering_id in offering_ids if offering_id]
+    if not offering_ids:
+        return
+    CatalogChange.objects.bulk_create([
+        CatalogChange(offering_id=offering_id, action=action)
+        for offering_id in offering_ids
+    ])
+
+
+def current_version():
+    """
+    目前可以交給客戶端的目錄版本號（沒有任何異動時為 0）
+    id 依取號順序而非提交順序：較早取號的交易可能較晚提交，若直接回傳最大的 id，
+    客戶端下次以它同步時會永遠漏掉那筆；因此只算建立超過 CATALOG_CHANGE_SETTLE_SECONDS 秒的紀錄，
+    較新的異動留到下一次同步
+    """
+    settled = timezone.now() - timedelta(seconds=settings.CATALOG_CHANGE_SETTLE_SECONDS)
+    return CatalogChange.objects.filter(changed_at__lte=settled).aggregate(version=Max('id'))['version'] or 0
+
+
+def needs_full_resync(since_version):
+    """客戶端的版本號早於保留的最舊紀錄（已被清除）時，必須重新下載完整目錄"""
+    oldest = CatalogChange.objects.aggregate(oldest=Min('id'))['oldest']
+    return oldest is not None and since_version < oldest - 1
+
+
+def collect_changes(since_version=None, since=None, up_to_version=None):
+    """
+    彙整異動：回傳 (upsert 的開課 ID 集合, delete 的開課 ID 集合)
+    同一門開課有多筆紀錄時以最後一筆動作為準
+    since: 以時間戳查詢時，另外納入 CourseOffering / Course 的 updated_at
+    """
+    changes = CatalogChange.objects.all()
+    if since_version is not None:
+        changes = changes.filter(id__gt=since_version)
+    if since is not None:
+        changes = changes.filter(changed_at__gt=since)
+    if up_to_version is not None:
+        changes = changes.filter(id__lte=up_to_version)
+
+    latest_action = {}
+    for offering_id, action in changes.order_by('id').values_list('offering_id', 'action'):
+        latest_action[offering_id] = action
+
+    if since is not None:
+        updated_ids = CourseOffering.objects.filter(
+            Q(updated_at__gt=since) | Q(course__updated_at__gt=since)
+        ).values_list('id', flat=True)
+        for offering_id in updated_ids:
+            latest_action.setdefault(offering_id, 'upsert')
+
+    upserts = {offering_id for offering_id, action in latest_action.items() if action == 'upsert'}
+    deletes = {offering_id for offering_id, action in latest_action.items() if action == 'delete'}
+    return upserts, deletes
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+回應壓縮工具
+依 Accept-Encoding 協商 brotli / gzip，供壓縮中間件與目錄快取共用
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件，未安裝時只提供 gzip
+    brotli = None
+
+
+def supported_encodings():
+    """伺服器端可用的編碼（依偏好排序）"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，回傳 {編碼: q 值}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """選出客戶端可接受、伺服器也支援的最佳編碼；都不行時回傳 None"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding):
+    """以指定編碼壓縮位元組內容"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        # mtime=0 讓相同內容得到相同輸出，方便快取與 ETag
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    raise ValueError(f'不支援的編碼: {encoding}')
+
+
+def decompress(body, encoding):
+    """還原壓縮內容（給不接受壓縮的客戶端使用）"""
+    if encoding == 'br':
+        return brotli.decompress(body)
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    raise ValueError(f'不支援的編碼: {encoding}')
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+建立、修改開課時的時段衝突檢查（教室、教師）
+查教室使用時段與教師授課時段（見 room_occupancy.py、teacher_occupancy.py），一次回傳所有衝突
+"""
+from .models import Classroom
+from . import room_occupancy, teacher_occupancy
+from .timeslots import class_time_mask
+
+
+def check_class_time(classroom, teachers, academic_year, semester, weekday, start_period, end_period,
+                     exclude_offering_id=None):
+    """
+    回傳衝突列表，每筆含 type（'classroom' 或 'teacher'）與 message；沒有衝突時為空列表
+    exclude_offering_id: 修改開課時排除它自己原本的時段
+    """
+    mask = class_time_mask(weekday, start_period, end_period)
+    conflicts = []
+
+    room = Classroom.objects.filter(name=(classroom or '').strip()).first()
+    ct = room_occupancy.find_conflict(room, academic_year, semester, mask, exclude_offering_id)
+    if ct:
+        conflicts.append({
+            'type': 'classroom',
+            'classroom': room.name,
+            'offering_id': ct.offering_id,
+            'message': f'教室 {room.name} 在星期{ct.weekday} 第{ct.start_period}-{ct.end_period}節已有課程「{ct.offering.course.course_name}」',
+        })
+
+    for conflict in teacher_occupancy.find_conflicts(teachers, academic_year, semester, mask, exclude_offering_id):
+        conflicts.append({
+            'type': 'teacher',
+            **conflict,
+            'message': (
+                f"{conflict['teacher_name']} 老師在星期{conflict['weekday']} "
+                f"第{conflict['start_period']}-{conflict['end_period']}節已有課程「{conflict['course_name']}」"
+            ),
+        })
+    return conflicts
+
+
+def conflict_response_data(conflicts):
+    """衝突時的回應內容：error 為所有訊息合併（前端直接顯示），conflicts 為明細"""
+    return {
+        'error': '；'.join(conflict['message'] for conflict in conflicts),
+        'conflicts': conflicts,
+    }
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+原子計數的存放位置（選課排隊 admission.py、流量限制 throttling.py 使用）
+只需要 incr：不存在的 key 先以 initial 建立（可設定 timeout 秒後過期），再加上 delta 並回傳新的值；
+流量限制另需 update：讀取目前的值、計算新的值後寫回，整段不會與其他請求交錯
+
+- LocalCounterStore：同一個 process 內的計數（單一 worker 或測試時使用）
+- CacheCounterStore：Django cache 的 incr，多個 worker 需搭配共用的快取（Redis、Memcached 的 incr 為原子操作）
+"""
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalCounterStore:
+    """同一個 process 內的計數"""
+
+    def __init__(self, max_entries=100000, **options):
+        self._lock = threading.Lock()
+        self._values = {}  # key -> (值, 過期時間或 None)
+        self.max_entries = max_entries
+
+    def _alive(self, key, now):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            return None
+        return entry
+
+    def incr(self, key, delta=1, initial=0, timeout=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._alive(key, now)
+            if entry is None:
+                if len(self._values) >= self.max_entries:
+                    self._prune(now)
+                entry = (initial, now + timeout if timeout else None)
+            self._values[key] = (entry[0] + delta, entry[1])
+            return entry[0] + delta
+
+    def update(self, key, func, timeout=None):
+        """func(目前的值或 None) -> (新的值或 None 表示不寫入, 回傳值)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._alive(key, now)
+            value, result = func(None if entry is None else entry[0])
+            if value is not None:
+                if entry is None and len(self._values) >= self.max_entries:
+                    self._prune(now)
+                self._values[key] = (value, now + timeout if timeout else None)
+            return result
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return {key: (self._alive(key, now) or (0, None))[0] for key in keys}
+
+    def _prune(self, now):
+        for key in [key for key, (_, expires) in self._values.items() if expires is not None and expires <= now]:
+            del self._values[key]
+
+
+class CacheCounterStore:
+    """以 Django cache 的 incr 計數"""
+
+    def __init__(self, alias='default', **options):
+        self.cache = caches[alias]
+
+    def incr(self, key, delta=1, initial=0, timeout=None):
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # add 為原子操作：同時建立時只有一個會成功，其餘的 incr 接續在後
+            self.cache.add(key, initial, timeout=timeout)
+            return self.cache.incr(key, delta)
+
+    def update(self, key, func, timeout=None, lock_timeout=1, attempts=50):
+        """以 cache.add 建立短暫的鎖（add 為原子操作），鎖住期間讀取、計算、寫回；
+        持有鎖的 worker 中斷時鎖在 lock_timeout 秒後過期"""
+        lock_key = f'{key}:lock'
+        for _ in range(attempts):
+            if self.cache.add(lock_key, 1, timeout=lock_timeout):
+                break
+            time.sleep(0.002)
+        else:
+            raise TimeoutError(f'無法取得計數鎖：{key}')
+        try:
+            value, result = func(self.cache.get(key))
+            if value is not None:
+                self.cache.set(key, value, timeout=timeout)
+            return result
+        finally:
+            self.cache.delete(lock_key)
+
+    def get_many(self, keys):
+        values = self.cache.get_many(keys)
+        return {key: values.get(key, 0) for key in keys}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path, options):
+    """依設定的類別路徑取得計數存放位置（每個 process 每種設定一個）"""
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = import_string(path)(**options)
+    return store
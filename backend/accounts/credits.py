@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+學生學分統計（CreditSummary）
+由選課事件（enrollment_events.py）增量更新：只重算這批事件涉及的學生；
+首次部署或大量匯入後以 rebuild_credit_summaries 全部重算
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CreditSummary, Enrollment
+
+GRADE_POINTS = {
+    'A+': Decimal('4.3'), 'A': Decimal('4.0'), 'A-': Decimal('3.7'),
+    'B+': Decimal('3.3'), 'B': Decimal('3.0'), 'B-': Decimal('2.7'),
+    'C+': Decimal('2.3'), 'C': Decimal('2.0'), 'C-': Decimal('1.7'),
+    'D': Decimal('1.0'), 'F': Decimal('0'),
+}
+
+# 課程類別 -> CreditSummary 欄位
+CREDIT_FIELDS = {
+    'required': 'required_credits',
+    'elective': 'elective_credits',
+    'general_required': 'general_credits',
+    'general_elective': 'general_credits',
+}
+
+SUMMARY_FIELDS = [
+    'total_credits', 'required_credits', 'elective_credits', 'general_credits',
+    'passed_credits', 'failed_credits', 'gpa', 'updated_at',
+]
+
+
+def _compute(student_ids):
+    """學生 ID -> 學分統計欄位（已通過的課程計入各類學分，GPA 以學分加權）"""
+    totals = {
+        student_id: dict.fromkeys(SUMMARY_FIELDS[:-2], 0) | {'_points': Decimal(0), '_graded': 0}
+        for student_id in student_ids
+    }
+    for student_id, status, grade, course_type, credits in Enrollment.objects.filter(
+        student_id__in=student_ids, status__in=['passed', 'failed']
+    ).values_list('student_id', 'status', 'grade', 'offering__course__course_type', 'offering__course__credits'):
+        summary = totals[student_id]
+        credits = credits or 0
+        if status == 'passed':
+            summary['passed_credits'] += credits
+            if course_type in CREDIT_FIELDS:
+                summary[CREDIT_FIELDS[course_type]] += credits
+                summary['total_credits'] += credits
+        else:
+            summary['failed_credits'] += credits
+        if grade in GRADE_POINTS:
+            summary['_points'] += GRADE_POINTS[grade] * credits
+            summary['_graded'] += credits
+
+    for summary in totals.values():
+        points, graded = summary.pop('_points'), summary.pop('_graded')
+        summary['gpa'] = (points / graded).quantize(Decimal('0.01')) if graded else Decimal('0.00')
+    return totals
+
+
+def sync_students(student_ids):
+    """重算這些學生的學分統計（已刪除的學生略過）"""
+    student_ids = set(User.objects.filter(id__in={s for s in student_ids if s}).values_list('id', flat=True))
+    if not student_ids:
+        return
+    totals = _compute(student_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {summary.student_id: summary for summary in CreditSummary.objects.filter(student_id__in=student_ids)}
+        for student_id, summary in existing.items():
+            for field, value in totals[student_id].items():
+                setattr(summary, field, value)
+            summary.updated_at = now
+        CreditSummary.objects.bulk_update(list(existing.values()), SUMMARY_FIELDS, batch_size=500)
+        CreditSummary.objects.bulk_create([
+            CreditSummary(student_id=student_id, **totals[student_id])
+            for student_id in student_ids - existing.keys()
+        ], batch_size=500)
+
+
+def consume_events(events):
+    """選課事件 consumer（settings.ENROLLMENT_EVENT_CONSUMERS）：重算事件涉及的學生"""
+    sync_students({event.student_id for event in events})
+
+
+def rebuild(progress=None):
+    """重算所有修過課的學生，回傳筆數；progress(done, total) 回報進度（背景工作使用）"""
+    student_ids = list(Enrollment.objects.values_list('student_id', flat=True).distinct())
+    for start in range(0, len(student_ids), 500):
+        sync_students(student_ids[start:start + 500])
+        if progress:
+            progress(min(start + 500, len(student_ids)), len(student_ids))
+    return len(student_ids)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+選課事件 outbox
+選課紀錄異動（選課、退選、候補遞補、志願分發、登錄成績）時在同一個交易寫入 EnrollmentEvent，
+跟著選課變動的資料（學分統計、名額推播、統計分析、通知）依序處理事件即可增量更新，
+不必重新掃描整個 Enrollment 資料表
+
+- 一般的 save / delete 由 signals.py 寫入事件；bulk 操作（lottery.py）需自行呼叫 record_events
+- consumer 在 settings.ENROLLMENT_EVENT_CONSUMERS 註冊（名稱 -> 處理函式），
+  處理函式收到一批依 id 排序的事件；處理結果與進度（EventCheckpoint）在同一個交易寫入，
+  失敗時整批重來，不會漏掉或重複處理（外部副作用如通知需自行容許重送）
+- 只處理建立超過 ENROLLMENT_EVENT_SETTLE_SECONDS 秒的事件：事件 id 依取號順序，
+  較早取號的交易可能較晚提交，稍等一下才不會被後面的進度跳過
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EnrollmentEvent, EventCheckpoint
+
+
+def event_kind(previous, enrollment):
+    """
+    依異動前後的選課紀錄判斷事件種類，沒有需要通知的異動時回傳 None
+    previous: 異動前的 (status, grade, score)，新紀錄為 None
+    """
+    status = enrollment.status
+    if previous is None:
+        previous = ('dropped', None, None)
+    previous_status, previous_grade, previous_score = previous
+
+    if status != previous_status:
+        if status in ('enrolled', 'dropped'):
+            return status
+        return 'graded'
+    if status != 'dropped' and (enrollment.grade, enrollment.score) != (previous_grade, previous_score):
+        return 'graded'
+    return None
+
+
+def record_events(kind, pairs):
+    """寫入事件（一次寫入多筆），pairs 為 (學生 ID, 開課 ID)"""
+    EnrollmentEvent.objects.bulk_create([
+        EnrollmentEvent(kind=kind, student_id=student_id, offering_id=offering_id)
+        for student_id, offering_id in pairs
+    ])
+
+
+def get_consumers():
+    """settings 中註冊的 consumer：{名稱: 處理函式}"""
+    return {name: import_string(path) for name, path in settings.ENROLLMENT_EVENT_CONSUMERS.items()}
+
+
+def run_consumer(name, handler, batch_size=None):
+    """
+    從進度之後依序處理事件，每批一個交易，處理到沒有新事件為止
+    回傳 (處理的事件數, 處理到的事件 id)
+    """
+    batch_size = batch_size or settings.ENROLLMENT_EVENT_BATCH_SIZE
+    processed = 0
+    while True:
+        settled = timezone.now() - timedelta(seconds=settings.ENROLLMENT_EVENT_SETTLE_SECONDS)
+        with transaction.atomic():
+            EventCheckpoint.objects.get_or_create(name=name)
+            # 鎖住進度：同一個 consumer 同時只有一個 process 在處理
+            checkpoint = EventCheckpoint.objects.select_for_update().get(name=name)
+            events = list(EnrollmentEvent.objects.filter(
+                id__gt=checkpoint.position, created_at__lte=settled
+            ).order_by('id')[:batch_size])
+            if not events:
+                return processed, checkpoint.position
+
+            handler(events)
+            checkpoint.position = events[-1].id
+            checkpoint.save(update_fields=['position', 'updated_at'])
+
+        processed += len(events)
+        if len(events) < batch_size:
+            return processed, checkpoint.position
+
+
+def prune(keep_days):
+    """清除所有 consumer 都已處理、且超過保留天數的事件，回傳清除筆數"""
+    names = list(settings.ENROLLMENT_EVENT_CONSUMERS)
+    positions = dict(EventCheckpoint.objects.filter(name__in=names).values_list('name', 'position'))
+    if len(positions) < len(names):
+        return 0  # 還有 consumer 沒有處理過
+    processed = min(positions.values(), default=None)
+    if processed is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted, _ = EnrollmentEvent.objects.filter(id__lte=processed, created_at__lt=cutoff).delete()
+    return deleted
+
+
+def backlog():
+    """每個 consumer 尚未處理的事件數"""
+    positions = dict(EventCheckpoint.objects.values_list('name', 'position'))
+    return {
+        name: EnrollmentEvent.objects.filter(id__gt=positions.get(name, 0)).count()
+        for name in settings.ENROLLMENT_EVENT_CONSUMERS
+    }
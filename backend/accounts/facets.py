@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+課程搜尋的分面數量（search_courses 的 facets=1）
+回答「改選這個系所／類別／年級／星期，會有幾門課」
+
+系所、課程類別、年級、星期既是篩選條件也是分面：計算某一分面的數量時要套用其他分面的篩選、
+但不套用它自己（否則只會看到已選的那一個值）。做法是只套用非分面條件（學年度、學期、節次、關鍵字），
+對開課搜尋文件做一次分組統計（依系所、類別、年級、有課的星期組合分組），再在 Python 中依各分面加總；
+分組數遠少於開課數，因此不論有幾個分面值都只需要一次查詢
+
+結果以篩選條件與目錄版本號為快取鍵，換頁、換排序、不同使用者都共用同一份
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+
+from .catalog_cache import CATALOG_VERSION_KEY, FAVORITES_VERSION_KEY, aget_versions, get_versions
+from .models import ClassTime, Course, Department
+from .timeslots import DAYS_PER_WEEK, weekdays_expression
+
+FACETS = ('department', 'course_type', 'grade_level', 'weekdays')
+
+COURSE_TYPE_LABELS = dict(Course.COURSE_TYPE_CHOICES)
+WEEKDAY_LABELS = dict(ClassTime.WEEKDAY_CHOICES)
+
+
+def weekday_bits(weekdays):
+    """篩選用的星期（'1'～'7'）轉成與 weekdays_expression 相同的 7 位元值"""
+    bits = 0
+    for weekday in weekdays:
+        weekday = int(weekday)
+        if 1 <= weekday <= DAYS_PER_WEEK:
+            bits |= 1 << (weekday - 1)
+    return bits
+
+
+class FacetQuery:
+    """
+    documents: 只套用非分面條件的 OfferingSearchDocument queryset
+    selected: 目前選定的分面值，例如 {'department': '資訊工程系', 'weekdays': 0b0000101}
+    key_parts: 決定結果的所有篩選條件（組成快取鍵）
+    user_id: 結果依使用者的選課紀錄而不同時（free_slots_only）的使用者，快取鍵另含他的收藏版本號
+    """
+
+    def __init__(self, documents, selected, key_parts, user_id=None):
+        self.documents = documents
+        self.selected = selected
+        self.key_parts = key_parts
+        self.user_id = user_id
+
+    def _version_keys(self):
+        keys = [CATALOG_VERSION_KEY]
+        if self.user_id is not None:
+            keys.append(FAVORITES_VERSION_KEY.format(user_id=self.user_id))
+        return keys
+
+    def _cache_key(self, versions):
+        digest = hashlib.md5(repr((versions, self.user_id, self.key_parts)).encode('utf-8')).hexdigest()
+        return f'catalog:search_facets:{digest}'
+
+    def _grouped(self):
+        return self.documents.annotate(
+            department_name=Subquery(Department.objects.filter(id=OuterRef('department_id')).values('name')[:1]),
+            weekday_bits=weekdays_expression(),
+        ).values(
+            'department_name', 'course_type', 'grade_level', 'weekday_bits'
+        ).annotate(count=Count('pk')).order_by()
+
+    def counts(self):
+        key = self._cache_key(get_versions(*self._version_keys()))
+        facets = cache.get(key)
+        if facets is None:
+            facets = marginalise(list(self._grouped()), self.selected)
+            cache.set(key, facets, settings.CATALOG_CACHE_TIMEOUT)
+        return facets
+
+    async def acounts(self):
+        key = self._cache_key(await aget_versions(*self._version_keys()))
+        facets = await cache.aget(key)
+        if facets is None:
+            facets = marginalise([row async for row in self._grouped()], self.selected)
+            await cache.aset(key, facets, settings.CATALOG_CACHE_TIMEOUT)
+        return facets
+
+
+def _matches(row, facet, value):
+    if facet == 'department':
+        return row['department_name'] == value
+    if facet == 'weekdays':
+        return bool(row['weekday_bits'] & value)
+    return row[facet] == value
+
+
+def marginalise(rows, selected):
+    """由分組結果算出各分面每個值的數量（各分面套用其他分面已選的條件）"""
+    totals = {facet: {} for facet in FACETS}
+    for row in rows:
+        matched = {facet: _matches(row, facet, value) for facet, value in selected.items()}
+        for facet in FACETS:
+            if not all(ok for other, ok in matched.items() if other != facet):
+                continue
+            if facet == 'weekdays':
+                values = [day for day in range(1, DAYS_PER_WEEK + 1) if row['weekday_bits'] & (1 << (day - 1))]
+            elif facet == 'department':
+                values = [row['department_name']] if row['department_name'] else []
+            else:
+                values = [row[facet]]
+            for value in values:
+                totals[facet][value] = totals[facet].get(value, 0) + row['count']
+
+    return {
+        'department': [
+            {'value': name, 'count': count}
+            for name, count in sorted(totals['department'].items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'course_type': [
+            {'value': value, 'label': COURSE_TYPE_LABELS.get(value, value), 'count': count}
+            for value, count in sorted(totals['course_type'].items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'grade_level': [
+            {'value': value, 'count': count}
+            for value, count in sorted(totals['grade_level'].items())
+        ],
+        'weekdays': [
+            {'value': str(day), 'label': WEEKDAY_LABELS[str(day)], 'count': count}
+            for day, count in sorted(totals['weekdays'].items())
+        ],
+    }
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Idempotency-Key：用戶端逾時重送選課、退選、收藏切換時，重播第一次的結果而不是再做一次
+（收藏切換重送會把狀態切回去）
+
+- 同一位使用者、同一個 Key、同一個請求（方法、路徑、內容相同）在 IDEMPOTENCY_TTL 秒內重送時，
+  直接回傳第一次的狀態碼與內容，並帶 Idempotent-Replayed: true
+- 第一次的請求還在處理時重送：409；同一個 Key 用在不同的請求：422
+- 結果存在獨立的快取（settings.IDEMPOTENCY_CACHE，只存摘要、狀態碼與回應內容），過期自動清除；
+  5xx 不保存，重送時會重新執行
+- 未登入或沒有帶 Key 時照常執行
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+PENDING = 'pending'
+
+
+def _fingerprint(request):
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f'{request.method} {request.get_full_path()}\n'.encode())
+    digest.update(json.dumps(request.data, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    """view 裝飾器（放在 @api_view 內層）"""
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        idempotency_key = request.META.get(HEADER, '').strip()
+        if not idempotency_key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(idempotency_key) > settings.IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({'error': f'Idempotency-Key 最長 {settings.IDEMPOTENCY_KEY_MAX_LENGTH} 個字元'}, status=400)
+
+        cache_key = 'idempotency:{}:{}'.format(
+            request.user.pk, hashlib.blake2b(idempotency_key.encode(), digest_size=16).hexdigest()
+        )
+        fingerprint = _fingerprint(request)
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+
+        # 先佔用 Key（add 為原子操作），同時重送的請求只有一個會執行
+        if not cache.add(cache_key, (fingerprint, PENDING, None), timeout=settings.IDEMPOTENCY_TTL):
+            stored = cache.get(cache_key)
+            if stored is not None:
+                stored_fingerprint, status, data = stored
+                if stored_fingerprint != fingerprint:
+                    return Response({'error': '這個 Idempotency-Key 已用於其他請求'}, status=422)
+                if status == PENDING:
+                    return Response({'error': '相同的請求正在處理中，請稍後再試'}, status=409)
+                response = Response(data, status=status)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            # 剛好過期：當作新的請求
+            cache.add(cache_key, (fingerprint, PENDING, None), timeout=settings.IDEMPOTENCY_TTL)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+        else:
+            cache.set(cache_key, (fingerprint, response.status_code, response.data), timeout=settings.IDEMPOTENCY_TTL)
+        return response
+    return wrapped
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+背景工作的處理函式（在 settings.JOB_HANDLERS 註冊，見 jobs.py）
+handler(params, progress)：params 為建立工作時的參數，回傳可轉成 JSON 的結果
+"""
+import csv
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import credits, jobs, passwords, seat_counts
+from .jobs import JobError
+from .models import Enrollment, Profile, Role
+
+
+def create_accounts(params, progress):
+    """
+    大量建立學生、教師帳號（密碼雜湊是主要耗時）
+    params: {'accounts': [{role, real_name, student_id / teacher_id, department, grade, office, title, email}]}
+    帳號為學號或教師編號，密碼為預設密碼，首次登入須修改；已存在或資料不完整的略過
+    """
+    rows = params.get('accounts') or []
+    if not isinstance(rows, list):
+        raise JobError('accounts 必須是陣列')
+    roles = {role.name: role for role in Role.objects.all()}
+    created, skipped = [], []
+    for i, row in enumerate(rows, start=1):
+        role_name = row.get('role')
+        username = str((row.get('student_id') if role_name == 'student' else row.get('teacher_id')) or '').strip()
+        if role_name not in ('student', 'teacher') or not username:
+            skipped.append({'row': i, 'username': username, 'reason': '缺少角色或學號 / 教師編號'})
+        elif User.objects.filter(username=username).exists():
+            skipped.append({'row': i, 'username': username, 'reason': '帳號已存在'})
+        else:
+            with transaction.atomic():
+                user = User.objects.create_user(username=username, password=username)
+                profile = Profile.objects.create(
+                    user=user,
+                    real_name=row.get('real_name') or username,
+                    email=row.get('email') or None,
+                    student_id=username if role_name == 'student' else None,
+                    teacher_id=username if role_name == 'teacher' else None,
+                    department=row.get('department') or None,
+                    grade=row.get('grade') or None,
+                    office=row.get('office') or None,
+                    title=row.get('title') or None,
+                )
+                if role_name not in roles:
+                    roles[role_name] = Role.objects.get_or_create(name=role_name)[0]
+                profile.roles.add(roles[role_name])
+            created.append(username)
+        progress(i, len(rows), f'已處理 {i} / {len(rows)} 筆')
+    return {'created': len(created), 'usernames': created, 'skipped': skipped}
+
+
+def reset_passwords(params, progress):
+    """大量重設為預設密碼（超級管理員略過），params: {'user_ids': [...]}"""
+    user_ids = params.get('user_ids') or []
+    users = list(User.objects.filter(id__in=user_ids, is_superuser=False).select_related('profile'))
+    for i, user in enumerate(users, start=1):
+        passwords.reset_to_default(user)
+        progress(i, len(users), f'已重設 {i} / {len(users)} 位')
+    return {'reset': len(users), 'skipped': len(set(user_ids)) - len(users)}
+
+
+def recompute_credits(params, progress):
+    """重算學分統計，params: {'student_ids': [...]}（未指定時全部重算）"""
+    if params.get('student_ids') is None:
+        return {'students': credits.rebuild(progress)}
+    credits.sync_students(params['student_ids'])
+    return {'students': len(params['student_ids'])}
+
+
+def export_enrollments(params, progress):
+    """
+    匯出某學期的選課名單（CSV，存到 JOB_EXPORT_DIR），params: {'academic_year', 'semester', 'offering_id'（選填）}
+    結果的 file 可由 GET jobs/<id>/download/ 下載
+    """
+    academic_year, semester = params.get('academic_year'), params.get('semester')
+    if not academic_year or not semester:
+        raise JobError('缺少學年度或學期')
+    enrollments = Enrollment.objects.filter(
+        offering__academic_year=academic_year, offering__semester=semester
+    ).exclude(status='dropped')
+    if params.get('offering_id'):
+        enrollments = enrollments.filter(offering_id=params['offering_id'])
+    total = enrollments.count()
+
+    os.makedirs(settings.JOB_EXPORT_DIR, exist_ok=True)
+    filename = f"enrollments_{academic_year}_{semester}_{timezone.now():%Y%m%d%H%M%S}.csv"
+    rows = enrollments.order_by('offering_id', 'student__username').values_list(
+        'offering_id', 'offering__course__course_code', 'offering__course__course_name',
+        'student__username', 'student__profile__real_name', 'student__profile__department',
+        'status', 'grade', 'score', 'enrolled_at',
+    )
+    with open(os.path.join(settings.JOB_EXPORT_DIR, filename), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['開課 ID', '課程代碼', '課程名稱', '學號', '姓名', '科系', '狀態', '等第成績', '百分制成績', '選課時間'])
+        for i, row in enumerate(rows.iterator(chunk_size=2000), start=1):
+            writer.writerow(row[:-1] + (timezone.localtime(row[-1]).strftime('%Y-%m-%d %H:%M:%S'),))
+            if i % 2000 == 0:
+                progress(i, total, f'已匯出 {i} / {total} 筆')
+    return {'file': filename, 'rows': total}
+
+
+def reconcile_seats(params, progress):
+    """
+    校正開課人數與狀態，結果為差異報告
+    params: {'academic_year', 'semester', 'dry_run'（選填）, 'repeat_every'（選填，秒）}
+    有 repeat_every 時完成後排入下一次，成為定期執行的工作（已經排入時沿用，重複提交不會變成多條排程）
+    """
+    if not params.get('academic_year') or not params.get('semester'):
+        raise JobError('缺少學年度或學期')
+    report = seat_counts.reconcile(params['academic_year'], params['semester'], dry_run=bool(params.get('dry_run')))
+    if params.get('repeat_every'):
+        next_job = jobs.submit(
+            'reconcile_seats', params, run_after=timezone.now() + timedelta(seconds=int(params['repeat_every'])),
+            dedupe=True,
+        )
+        report['next_job_id'] = next_job.id
+    return report
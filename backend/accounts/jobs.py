@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+背景工作
+耗時的管理操作（大量建立帳號、重設密碼、重算學分、匯出）不在 request 中執行：
+view 以 submit 建立 Job 後立即回傳 202，run_jobs 指令在背景執行，前端以 GET jobs/<id>/ 查詢進度與結果
+
+- 工作種類在 settings.JOB_HANDLERS 註冊（種類 -> 處理函式），
+  處理函式 handler(params, progress) 回傳可轉成 JSON 的結果，以 progress(done, total, message) 回報進度
+- 處理函式拋出 JobError 時直接失敗（參數錯誤等重試也沒用的情況）；
+  其他例外在 max_attempts 次以內重新排隊，等待時間每次加倍
+- 多個 worker 以條件式 UPDATE 搶工作，同一個工作只會有一個 worker 執行；
+  run_jobs 的主迴圈每 JOB_HEARTBEAT_INTERVAL 秒為執行中的工作寫入心跳（與處理函式是否回報進度無關），
+  超過 JOB_STALE_SECONDS 秒沒有心跳也沒有進度時視為 worker 中斷，重新排隊
+"""
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+from .models import Job
+
+
+class JobError(Exception):
+    """工作參數錯誤或無法完成，不重試"""
+    pass
+
+
+def submit(kind, params=None, user=None, max_attempts=None, run_after=None, dedupe=False):
+    """
+    建立背景工作，回傳 Job；run_after 指定最早的執行時間（排程）
+    dedupe: 已有相同種類與參數、尚未執行的工作時直接回傳它，不重複建立（定期工作使用）
+    """
+    if kind not in settings.JOB_HANDLERS:
+        raise JobError(f'不支援的工作種類：{kind}')
+    if dedupe:
+        pending = Job.objects.filter(kind=kind, params=params or {}, status='queued').order_by('run_after').first()
+        if pending is not None:
+            return pending
+    return Job.objects.create(
+        kind=kind,
+        params=params or {},
+        created_by=user if user is not None and user.is_authenticated else None,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def job_data(job):
+    """工作狀態（API 回傳格式）"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def accepted_response(job, message='已加入背景工作'):
+    """view 建立工作後的回應（202），前端以 job.id 查詢進度"""
+    return Response({'message': message, 'job': job_data(job)}, status=202)
+
+
+class Progress:
+    """回報進度：百分比變動或距離上次超過 JOB_HEARTBEAT_INTERVAL 秒時才寫入（兼作 worker 存活的訊號）"""
+
+    def __init__(self, job):
+        self.job = job
+        self.percent = job.progress
+        self.written_at = time.monotonic()
+
+    def __call__(self, done, total=None, message=''):
+        percent = min(99, int(done * 100 / total)) if total else self.percent
+        message = str(message)[:200]
+        if percent == self.percent and message == self.job.message \
+                and time.monotonic() - self.written_at < settings.JOB_HEARTBEAT_INTERVAL:
+            return
+        self.percent = self.job.progress = percent
+        self.job.message = message
+        self.written_at = time.monotonic()
+        Job.objects.filter(id=self.job.id).update(progress=percent, message=message, updated_at=timezone.now())
+
+
+def heartbeat(job_ids):
+    """
+    worker 主迴圈定期呼叫：更新執行中工作的存活時間，回傳筆數
+    不回報進度的處理函式（例如 reconcile_seats）執行再久也不會被當成中斷而重複執行
+    """
+    if not job_ids:
+        return 0
+    return Job.objects.filter(id__in=job_ids, status='running').update(updated_at=timezone.now())
+
+
+def requeue_stale():
+    """執行中但太久沒有心跳或進度的工作（worker 中斷）：重新排隊或標示失敗，回傳筆數"""
+    stale = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    count = 0
+    for job in Job.objects.filter(status='running', updated_at__lt=stale):
+        if job.attempts < job.max_attempts:
+            count += Job.objects.filter(id=job.id, status='running', updated_at=job.updated_at).update(
+                status='queued', error='worker 中斷，重新排隊', updated_at=timezone.now()
+            )
+        else:
+            count += Job.objects.filter(id=job.id, status='running', updated_at=job.updated_at).update(
+                status='failed', error='worker 中斷', finished_at=timezone.now(), updated_at=timezone.now()
+            )
+    return count
+
+
+def claim():
+    """取得下一個可執行的工作並標示為執行中；沒有時回傳 None"""
+    now = timezone.now()
+    candidates = Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id')
+    for job in candidates[:10]:
+        # 條件式 UPDATE：其他 worker 先搶到時影響 0 筆
+        claimed = Job.objects.filter(id=job.id, status='queued').update(
+            status='running', attempts=job.attempts + 1, started_at=now, updated_at=now
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def execute(job):
+    """執行一個已標示為執行中的工作並寫入結果"""
+    try:
+        handler = import_string(settings.JOB_HANDLERS[job.kind])
+        result = handler(job.params, Progress(job))
+    except Exception as e:
+        retry = not isinstance(e, (JobError, KeyError, ImportError)) and job.attempts < job.max_attempts
+        if not isinstance(e, JobError):
+            print(f"背景工作 #{job.id} {job.kind} 錯誤: {str(e)}")
+            traceback.print_exc()
+        now = timezone.now()
+        if retry:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(id=job.id).update(
+                status='queued', error=str(e), run_after=now + timedelta(seconds=delay), updated_at=now
+            )
+        else:
+            Job.objects.filter(id=job.id).update(status='failed', error=str(e), finished_at=now, updated_at=now)
+    else:
+        now = timezone.now()
+        Job.objects.filter(id=job.id).update(
+            status='succeeded', progress=100, result=result, error='', finished_at=now, updated_at=now
+        )
+    finally:
+        # worker thread 各自使用資料庫連線，結束時關閉過期的連線
+        close_old_connections()
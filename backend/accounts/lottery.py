@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+志願分發的批次分發（allocate_seats 使用）
+以隨機序列獨裁（random serial dictatorship）分配名額：
+- 先依優先順序排出所有學生：年級高者優先，同年級抽籤（亂數種子記錄在 AllocationRound，可重現）
+- 依序輪到每位學生時，依志願序取得所有仍可選的志願；
+  衝堂（位元遮罩 AND，見 timeslots.py）、同一門課程已分到其他班、名額已滿的志願略過
+- 後面的學生無法影響前面學生分到的結果，照實填寫志願序就是最好的策略
+結果以 bulk 操作一次寫入選課紀錄與開課人數（不觸發訊號，最後統一更新目錄、搜尋文件與選課事件）
+
+只有批次工作會 import 這個模組，web worker 不需要載入 numpy
+"""
+import secrets
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import search_documents
+from .allocation import AllocationError
+from .catalog_cache import bump_favorites_version, bump_seat_version
+from .catalog_sync import record_offering_changes
+from .enrollment_events import record_events
+from .models import CourseOffering, CoursePreference, Enrollment, OfferingSearchDocument, Profile
+from .pubsub import publish_seat_change
+
+
+def serial_dictatorship(pref_student, pref_offering, priority, seats, offering_course, offering_slots, student_slots,
+                        taken_courses):
+    """
+    pref_student / pref_offering: 每個志願的學生與開課索引，需依 (學生, 志願序) 排序
+    priority: 每位學生的選課順位（0 最先）
+    seats: 每門開課剩餘名額
+    offering_course: 每門開課所屬課程的索引
+    offering_slots / student_slots: (星期一～四, 星期五～日) 兩個 uint64 陣列，學生的是已選課程佔用的時段
+    taken_courses: 學生已修、已選的課程，(學生索引, 課程索引) 兩欄的陣列
+    回傳每個志願是否分到名額（bool 陣列）
+    """
+    n_students = len(priority)
+    seats = seats.tolist()
+    offering_course = offering_course.tolist()
+    offering_lo, offering_hi = (slots.tolist() for slots in offering_slots)
+    student_lo, student_hi = (slots.tolist() for slots in student_slots)
+    pref_offering = pref_offering.tolist()
+    taken = set(map(tuple, taken_courses.tolist()))
+
+    assigned = np.zeros(len(pref_offering), dtype=bool)
+    student_ids = np.arange(n_students)
+    start = np.searchsorted(pref_student, student_ids).tolist()
+    end = np.searchsorted(pref_student, student_ids, side='right').tolist()
+
+    for student in np.argsort(priority, kind='stable').tolist():
+        lo, hi = student_lo[student], student_hi[student]
+        for pref in range(start[student], end[student]):
+            offering = pref_offering[pref]
+            course = offering_course[offering]
+            if (seats[offering] <= 0 or lo & offering_lo[offering] or hi & offering_hi[offering]
+                    or (student, course) in taken):
+                continue
+            assigned[pref] = True
+            seats[offering] -= 1
+            lo |= offering_lo[offering]
+            hi |= offering_hi[offering]
+            taken.add((student, course))
+
+    return assigned
+
+
+def _index(values):
+    values = sorted(set(values))
+    return values, {value: i for i, value in enumerate(values)}
+
+
+def allocate(allocation_round, seed=None):
+    """執行分發並寫入結果，回傳統計資料"""
+    if allocation_round.status != 'open':
+        raise AllocationError('這學期已經分發過')
+    if seed is None:
+        seed = secrets.randbits(63)
+
+    with transaction.atomic():
+        preferences = list(CoursePreference.objects.filter(
+            allocation_round=allocation_round
+        ).order_by('student_id', 'rank').values_list('id', 'student_id', 'offering_id'))
+
+        student_list, student_index = _index(student_id for _, student_id, _ in preferences)
+        offering_list, offering_index = _index(offering_id for _, _, offering_id in preferences)
+
+        # 鎖住分發的開課，名額不會和分發期間的其他異動交錯
+        offerings = {
+            offering.id: offering
+            for offering in CourseOffering.objects.select_for_update().filter(id__in=offering_list)
+        }
+        course_list, course_index = _index(offering.course_id for offering in offerings.values())
+        offering_course = np.array([course_index[offerings[o].course_id] for o in offering_list], dtype=np.int64)
+        seats = np.array(
+            [max(0, offerings[o].max_students - offerings[o].current_students) for o in offering_list], dtype=np.int64
+        )
+        offering_lo = np.zeros(len(offering_list), dtype=np.uint64)
+        offering_hi = np.zeros(len(offering_list), dtype=np.uint64)
+        for offering_id, slots_mon_thu, slots_fri_sun in OfferingSearchDocument.objects.filter(
+            offering_id__in=offering_list
+        ).values_list('offering_id', 'slots_mon_thu', 'slots_fri_sun'):
+            offering_lo[offering_index[offering_id]] = slots_mon_thu
+            offering_hi[offering_index[offering_id]] = slots_fri_sun
+
+        # 學生這學期已選課程佔用的時段，以及已修、已選的課程
+        student_lo = np.zeros(len(student_list), dtype=np.uint64)
+        student_hi = np.zeros(len(student_list), dtype=np.uint64)
+        taken_courses = []
+        for student_id, course_id, status, slots_mon_thu, slots_fri_sun in Enrollment.objects.filter(
+            student_id__in=student_list,
+            offering__academic_year=allocation_round.academic_year,
+            offering__semester=allocation_round.semester,
+        ).exclude(status='dropped').values_list(
+            'student_id', 'offering__course_id', 'status',
+            'offering__search_document__slots_mon_thu', 'offering__search_document__slots_fri_sun'
+        ):
+            s = student_index[student_id]
+            if status == 'enrolled':
+                student_lo[s] |= np.uint64(slots_mon_thu or 0)
+                student_hi[s] |= np.uint64(slots_fri_sun or 0)
+            if course_id in course_index:
+                taken_courses.append((s, course_index[course_id]))
+
+        # 優先順序：年級高者優先，同年級依抽籤
+        grades = dict(Profile.objects.filter(user_id__in=student_list).values_list('user_id', 'grade'))
+        lottery = np.random.default_rng(seed).permutation(len(student_list))
+        order = np.lexsort((lottery, -np.array([grades.get(s) or 0 for s in student_list])))
+        priority = np.empty(len(student_list), dtype=np.int64)
+        priority[order] = np.arange(len(student_list))
+
+        assigned = serial_dictatorship(
+            np.array([student_index[s] for _, s, _ in preferences], dtype=np.int64),
+            np.array([offering_index[o] for _, _, o in preferences], dtype=np.int64),
+            priority, seats, offering_course,
+            (offering_lo, offering_hi), (student_lo, student_hi),
+            np.array(taken_courses, dtype=np.int64).reshape(-1, 2),
+        )
+
+        won = [preferences[i] for i in np.nonzero(assigned)[0]]
+        _write_enrollments([(student_id, offering_id) for _, student_id, offering_id in won])
+        won_ids = [preference_id for preference_id, _, _ in won]
+        CoursePreference.objects.filter(id__in=won_ids).update(result='assigned')
+        CoursePreference.objects.filter(allocation_round=allocation_round).exclude(
+            id__in=won_ids
+        ).update(result='rejected')
+
+        # 開課人數一次更新
+        now = timezone.now()
+        counts = np.bincount(
+            np.array([offering_index[offering_id] for _, _, offering_id in won], dtype=np.int64),
+            minlength=len(offering_list)
+        )
+        changed = []
+        for i, offering_id in enumerate(offering_list):
+            if counts[i]:
+                offering = offerings[offering_id]
+                offering.current_students += int(counts[i])
+                if offering.current_students >= offering.max_students:
+                    offering.status = 'full'
+                offering.updated_at = now
+                changed.append(offering)
+        CourseOffering.objects.bulk_update(changed, ['current_students', 'status', 'updated_at'], batch_size=500)
+
+        allocation_round.status = 'allocated'
+        allocation_round.seed = seed
+        allocation_round.allocated_at = now
+        allocation_round.save(update_fields=['status', 'seed', 'allocated_at'])
+
+        # bulk 操作不觸發訊號：統一更新目錄異動紀錄、搜尋文件與快取版本，交易提交後推播名額
+        changed_ids = [offering.id for offering in changed]
+        record_offering_changes(changed_ids, 'upsert')
+        search_documents.sync_documents(changed_ids)
+        for offering in changed:
+            publish_seat_change(offering)
+
+    for student_id in {student_id for _, student_id, _ in won}:
+        bump_favorites_version(student_id)
+    bump_seat_version()
+
+    return {
+        'seed': seed,
+        'students': len(student_list),
+        'preferences': len(preferences),
+        'assigned': len(won),
+        'offerings': len(changed),
+        'full': sum(1 for offering in changed if offering.status == 'full'),
+    }
+
+
+def _write_enrollments(pairs):
+    """寫入分發結果：退選過的沿用原本那筆（unique_together），其餘一次新增"""
+    if not pairs:
+        return
+    now = timezone.now()
+    pairs = set(pairs)
+    existing = {
+        (enrollment.student_id, enrollment.offering_id): enrollment
+        for enrollment in Enrollment.objects.filter(
+            student_id__in={student_id for student_id, _ in pairs},
+            offering_id__in={offering_id for _, offering_id in pairs},
+            status='dropped',
+        )
+        if (enrollment.student_id, enrollment.offering_id) in pairs
+    }
+    for enrollment in existing.values():
+        enrollment.status = 'enrolled'
+        enrollment.grade = None
+        enrollment.score = None
+        enrollment.enrolled_at = now
+        enrollment.updated_at = now
+    Enrollment.objects.bulk_update(
+        list(existing.values()), ['status', 'grade', 'score', 'enrolled_at', 'updated_at'], batch_size=500
+    )
+    Enrollment.objects.bulk_create([
+        Enrollment(student_id=student_id, offering_id=offering_id, status='enrolled')
+        for student_id, offering_id in pairs - existing.keys()
+    ], batch_size=500)
+    record_events('enrolled', pairs)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+志願分發：填寫截止後依志願序批次分發名額（見 accounts/lottery.py）
+分發後該學期恢復一般選課（額滿的課程可以候補）
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts import lottery
+from accounts.allocation import AllocationError, pending_round
+
+
+class Command(BaseCommand):
+    help = '志願分發：依志願序批次分發名額'
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help='學年度，例如 114')
+        parser.add_argument('semester', help='學期（1 或 2）')
+        parser.add_argument('--seed', type=int, help='抽籤亂數種子（預設隨機，分發後記錄在志願分發資料中）')
+        parser.add_argument('--force', action='store_true', help='填寫期間尚未截止也直接分發')
+
+    def handle(self, *args, **options):
+        allocation_round = pending_round(options['academic_year'], options['semester'])
+        if allocation_round is None:
+            raise CommandError('這學期沒有待分發的志願分發')
+        if timezone.now() < allocation_round.closes_at and not options['force']:
+            raise CommandError(f'志願填寫尚未截止（{allocation_round.closes_at:%Y-%m-%d %H:%M}），確定要分發請加上 --force')
+
+        try:
+            result = lottery.allocate(allocation_round, seed=options['seed'])
+        except AllocationError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已分發：{result['students']} 位學生、{result['preferences']} 個志願，分到 {result['assigned']} 個名額，"
+            f"{result['offerings']} 門開課有異動（{result['full']} 門額滿），亂數種子 {result['seed']}"
+        ))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+比較課程目錄 API 在 WSGI（同步 view）與 ASGI（async view）下的並行吞吐量
+
+先分別啟動兩個伺服器，例如：
+    gunicorn backend.wsgi:application -w 2 -b 127.0.0.1:8000
+    uvicorn backend.asgi:application --workers 2 --port 8001
+再執行：
+    python manage.py bench_catalog --wsgi-url http://127.0.0.1:8000 --asgi-url http://127.0.0.1:8001
+"""
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+# 端點名稱: (WSGI 路徑, ASGI 路徑)
+ENDPOINTS = {
+    'search': ('/api/courses/search/', '/api/async/courses/search/'),
+    'filter-options': ('/api/courses/filter-options/', '/api/async/courses/filter-options/'),
+    'enrolled': ('/api/courses/enrolled/', '/api/async/courses/enrolled/'),
+    'favorites': ('/api/courses/favorites/', '/api/async/courses/favorites/'),
+}
+
+
+def _percentile(sorted_values, ratio):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * ratio))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = '比較 WSGI 與 ASGI 下課程目錄 API 的並行吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', help='WSGI 伺服器位址，例如 http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='ASGI 伺服器位址，例如 http://127.0.0.1:8001')
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='search', help='測試的端點（預設 search）')
+        parser.add_argument('--query', default='', help='附加的查詢字串，例如 "keyword=程式&semester=1"')
+        parser.add_argument('--requests', type=int, default=500, help='總請求數（預設 500）')
+        parser.add_argument('--concurrency', type=int, default=50, help='同時發出的請求數（預設 50）')
+        parser.add_argument('--session-cookie', default='', help='sessionid，測試需登入的端點時使用')
+        parser.add_argument('--cache-miss', action='store_true', help='每個請求加上不同參數，略過目錄快取以測試資料庫查詢')
+        parser.add_argument('--timeout', type=float, default=30.0, help='單一請求逾時秒數（預設 30）')
+
+    def handle(self, *args, **options):
+        targets = []
+        wsgi_path, asgi_path = ENDPOINTS[options['endpoint']]
+        if options['wsgi_url']:
+            targets.append(('WSGI', options['wsgi_url'].rstrip('/') + wsgi_path))
+        if options['asgi_url']:
+            targets.append(('ASGI', options['asgi_url'].rstrip('/') + asgi_path))
+        if not targets:
+            raise CommandError('請至少提供 --wsgi-url 或 --asgi-url')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests 與 --concurrency 必須大於 0')
+
+        self.stdout.write(
+            f"端點: {options['endpoint']}，請求數: {options['requests']}，並行數: {options['concurrency']}"
+            f"{'，略過快取' if options['cache_miss'] else ''}"
+        )
+        for label, url in targets:
+            self._report(label, url, self._run(url, options))
+
+    def _run(self, base_url, options):
+        headers = {'Accept': 'application/json'}
+        if options['session_cookie']:
+            headers['Cookie'] = f"sessionid={options['session_cookie']}"
+
+        def fetch(i):
+            params = [options['query']] if options['query'] else []
+            if options['cache_miss']:
+                params.append(f'_bench={i}')
+            url = base_url + ('?' + '&'.join(params) if params else '')
+
+            started = time.perf_counter()
+            try:
+                request = urllib.request.Request(url, headers=headers)
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        return results, elapsed
+
+    def _report(self, label, url, run):
+        results, elapsed = run
+        latencies = sorted(latency for ok, latency in results if ok)
+        errors = len(results) - len(latencies)
+
+        self.stdout.write(f'\n[{label}] {url}')
+        self.stdout.write(f'  吞吐量: {len(latencies) / elapsed:.1f} req/s（總耗時 {elapsed:.2f} 秒）')
+        self.stdout.write(
+            f'  延遲: p50 {_percentile(latencies, 0.5) * 1000:.1f} ms，'
+            f'p95 {_percentile(latencies, 0.95) * 1000:.1f} ms，'
+            f'p99 {_percentile(latencies, 0.99) * 1000:.1f} ms'
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'  失敗: {errors} 筆'))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+建立 BM25 相關度索引檔（settings.BM25_INDEX_PATH）
+伺服器執行中也會在目錄異動後自動重建，部署時先建好可讓 worker 啟動後立即使用
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import bm25
+
+
+class Command(BaseCommand):
+    help = '建立 BM25 相關度索引檔（search_courses 的 sort=relevance 使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='索引檔路徑（預設 settings.BM25_INDEX_PATH）')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.BM25_INDEX_PATH
+        docs, terms = bm25.build_index_file(path)
+        self.stdout.write(self.style.SUCCESS(f'已建立 BM25 索引：{docs} 門課程、{terms} 個詞彙 → {path}'))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+批次計算相似課程（TF-IDF + 餘弦相似度，需要 numpy / scipy）
+課程資料大量更新後執行，或以排程每日執行一次
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '批次計算相似課程（寫入 CourseSimilarity）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='每門課程保留幾門相似課程（預設 20）')
+        parser.add_argument('--min-score', type=float, default=0.05, help='相似度下限（預設 0.05）')
+
+    def handle(self, *args, **options):
+        from accounts.similarity import compute_similar_courses
+
+        started = time.perf_counter()
+        courses, rows = compute_similar_courses(top_n=options['top'], min_score=options['min_score'])
+        self.stdout.write(self.style.SUCCESS(
+            f'已計算 {courses} 門課程的相似課程，共 {rows} 筆，耗時 {time.perf_counter() - started:.2f} 秒'
+        ))
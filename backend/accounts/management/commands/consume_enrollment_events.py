@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+處理選課事件（見 accounts/enrollment_events.py）
+各 consumer 從自己的進度之後分批處理；以排程定期執行，或加上 --loop 常駐執行
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import enrollment_events
+
+
+class Command(BaseCommand):
+    help = '處理選課事件（EnrollmentEvent）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', action='append', help='只處理指定的 consumer（可重複，預設全部）')
+        parser.add_argument('--batch-size', type=int, help='每批處理幾筆事件（預設 ENROLLMENT_EVENT_BATCH_SIZE）')
+        parser.add_argument('--loop', action='store_true', help='常駐執行，每隔 --interval 秒處理一次')
+        parser.add_argument('--interval', type=float, default=5, help='常駐執行時的間隔秒數（預設 5）')
+        parser.add_argument('--prune-days', type=int, help='處理完後清除所有 consumer 都已處理、超過幾天的事件')
+
+    def handle(self, *args, **options):
+        consumers = enrollment_events.get_consumers()
+        if options['consumer']:
+            unknown = set(options['consumer']) - consumers.keys()
+            if unknown:
+                raise CommandError(f"未註冊的 consumer：{'、'.join(sorted(unknown))}")
+            consumers = {name: consumers[name] for name in options['consumer']}
+
+        while True:
+            for name, handler in consumers.items():
+                processed, position = enrollment_events.run_consumer(name, handler, options['batch_size'])
+                if processed or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(f'{name}：處理 {processed} 筆事件（處理到 #{position}）'))
+            if options['prune_days'] is not None:
+                deleted = enrollment_events.prune(options['prune_days'])
+                if deleted:
+                    self.stdout.write(f'已清除 {deleted} 筆已處理的事件')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+清除過舊的目錄異動紀錄
+版本號早於保留範圍的客戶端會收到 full_resync=True，重新下載完整目錄
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import CatalogChange
+
+
+class Command(BaseCommand):
+    help = '清除過舊的目錄異動紀錄（CatalogChange）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=7, help='保留最近幾天的紀錄（預設 7 天）')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['keep_days'])
+        deleted, _ = CatalogChange.objects.filter(changed_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'已清除 {deleted} 筆異動紀錄（{cutoff:%Y-%m-%d %H:%M} 之前）'))
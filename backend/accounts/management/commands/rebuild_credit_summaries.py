@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+重建學生學分統計（CreditSummary）
+平常由選課事件（consume_enrollment_events）更新，首次部署、大量匯入成績後執行
+"""
+from django.core.management.base import BaseCommand
+
+from accounts import credits
+
+
+class Command(BaseCommand):
+    help = '重建學生學分統計（CreditSummary）'
+
+    def handle(self, *args, **options):
+        count = credits.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'已重建學分統計：{count} 位學生'))
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+重建教室使用時段（ClassroomOccupancy）
+平常由訊號更新，首次部署、大量匯入（未觸發訊號）後執行
+"""
+from django.core.management.base import BaseCommand
+
+from accounts import room_occupancy
+
+
+class Command(BaseCommand):
+    help = '重建教室使用時段（ClassroomOccupancy）'
+
+    def handle(self, *args, **options):
+        count = room_occupancy.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'已重建教室使用時段：{count} 間教室'))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+重建開課搜尋文件（OfferingSearchDocument）
+平常由訊號逐筆更新，首次部署、大量匯入（未觸發訊號）或調整文件欄位後執行
+"""
+from django.core.management.base import BaseCommand
+
+from accounts import search_documents
+
+
+class Command(BaseCommand):
+    help = '重建開課搜尋文件（OfferingSearchDocument）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批處理的開課數（預設 500）')
+
+    def handle(self, *args, **options):
+        count = search_documents.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'已重建開課搜尋文件：{count} 門開課'))
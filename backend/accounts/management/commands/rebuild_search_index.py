@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+重建課程全文搜尋索引
+平常由訊號逐筆更新，首次部署、大量匯入（未觸發訊號）或調整切詞方式後執行
+"""
+from django.core.management.base import BaseCommand
+
+from accounts import search_index
+
+
+class Command(BaseCommand):
+    help = '重建課程全文搜尋索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批處理的開課數（預設 500）')
+
+    def handle(self, *args, **options):
+        kind = search_index.backend()
+        if kind is None:
+            self.stdout.write(self.style.WARNING('目前的資料庫不支援全文索引，關鍵字搜尋使用 icontains'))
+            return
+
+        count = search_index.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'已重建全文索引（{kind}）：{count} 門開課'))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+校正開課人數與狀態（見 accounts/seat_counts.py）
+建議以排程定期執行（例如選課期間每 10 分鐘），或由背景工作 reconcile_seats 執行
+"""
+from django.core.management.base import BaseCommand
+
+from accounts import seat_counts
+
+
+class Command(BaseCommand):
+    help = '以實際選課紀錄校正開課人數（current_students）與狀態'
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help='學年度，例如 114')
+        parser.add_argument('semester', help='學期（1 或 2）')
+        parser.add_argument('--dry-run', action='store_true', help='只列出差異，不寫入')
+
+    def handle(self, *args, **options):
+        report = seat_counts.reconcile(options['academic_year'], options['semester'], dry_run=options['dry_run'])
+        for change in report['changes']:
+            self.stdout.write(
+                f"開課 {change['offering_id']} {change['course_name']}："
+                f"人數 {change['current_students']} -> {change['actual_students']}，"
+                f"狀態 {change['status']} -> {change['actual_status']}"
+                + (f"，候補遞補 {change['promoted']} 人" if change['promoted'] else '')
+            )
+        verb = '發現' if report['dry_run'] else '已校正'
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['academic_year']}-{report['semester']} 共 {report['offerings']} 門開課，"
+            f"{verb} {report['drifted']} 門人數不一致（合計差 {report['total_drift']} 人）、{report['status_changed']} 門狀態不一致，"
+            f"候補遞補 {report['promoted']} 人"
+        ))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+背景工作 worker（見 accounts/jobs.py）
+常駐執行，以 thread pool 同時執行最多 --workers 個工作；可以在多台機器各跑一個
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import jobs
+
+
+class Command(BaseCommand):
+    help = '執行背景工作（Job）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS, help='同時執行的工作數（預設 JOB_WORKERS）')
+        parser.add_argument('--poll-interval', type=float, default=2, help='沒有工作時幾秒檢查一次（預設 2）')
+        parser.add_argument('--once', action='store_true', help='執行完目前可執行的工作後結束')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.stdout.write(f'背景工作 worker 啟動（{workers} 個 thread）')
+        running = {}  # future -> 工作 ID
+        last_stale_check = 0
+        last_heartbeat = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job') as pool:
+            try:
+                while True:
+                    if time.monotonic() - last_stale_check > settings.JOB_STALE_SECONDS / 2:
+                        requeued = jobs.requeue_stale()
+                        if requeued:
+                            self.stdout.write(f'{requeued} 個中斷的工作已重新排隊')
+                        last_stale_check = time.monotonic()
+
+                    # 心跳由主迴圈寫入，處理函式不回報進度時也不會被其他 worker 重新排隊
+                    if running and time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT_INTERVAL:
+                        jobs.heartbeat(list(running.values()))
+                        last_heartbeat = time.monotonic()
+
+                    while len(running) < workers:
+                        job = jobs.claim()
+                        if job is None:
+                            break
+                        self.stdout.write(f'開始 #{job.id} {job.kind}（第 {job.attempts} 次）')
+                        running[pool.submit(jobs.execute, job)] = job.id
+
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+                        future.result()
+            except KeyboardInterrupt:
+                self.stdout.write('停止中，等待執行中的工作完成…')
+
+        self.stdout.write(self.style.SUCCESS('背景工作 worker 結束'))
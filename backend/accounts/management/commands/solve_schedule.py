@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+學期自動排課（與 /api/courses/schedule/propose/ 相同，但可指定較長的時間限制）
+預設只輸出方案；加上 --apply 時檢查衝突後直接寫入，--output 可把方案存成 JSON 檔
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import scheduling
+
+
+class Command(BaseCommand):
+    help = '學期自動排課：安排上課時段與教室'
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help='學年度，例如 114')
+        parser.add_argument('semester', help='學期（1 或 2）')
+        parser.add_argument('--offering', type=int, action='append', dest='offering_ids', help='只重排這些開課（可重複指定）')
+        parser.add_argument('--room', action='append', dest='rooms', help='可用教室（可重複指定，預設為所有可排課的教室）')
+        parser.add_argument('--time-limit', type=float, default=30.0, help='搜尋時間上限（秒，預設 30）')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='方案輸出的 JSON 檔')
+        parser.add_argument('--apply', action='store_true', help='直接套用方案')
+
+    def handle(self, *args, **options):
+        try:
+            problem = scheduling.load_problem(
+                options['academic_year'], options['semester'], options['offering_ids'], options['rooms']
+            )
+        except scheduling.ScheduleError as e:
+            raise CommandError(str(e))
+
+        result = scheduling.solve(problem, time_limit=options['time_limit'], seed=options['seed'])
+        plan = scheduling.plan_to_json(problem, result)
+
+        changed = [entry for entry in plan['assignments'] if entry['changed']]
+        for entry in changed:
+            self.stdout.write(
+                f"  {entry['course']}: 星期{entry['weekday']} 第{entry['start_period']}-{entry['end_period']}節 @ {entry['classroom']}"
+            )
+        for entry in plan['unassigned']:
+            self.stdout.write(self.style.WARNING(f"  無法排入 {entry['course']}（{entry['reason']}）"))
+        self.stdout.write(
+            f"已排 {len(plan['assignments'])} 門（變動 {len(changed)} 門）、無法排入 {len(plan['unassigned'])} 門，"
+            f"成本 {plan['cost']}，搜尋 {plan['iterations']} 次"
+        )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(plan, f, ensure_ascii=False, indent=2)
+
+        if options['apply']:
+            updated, conflicts = scheduling.apply_plan(options['academic_year'], options['semester'], changed)
+            if conflicts:
+                raise CommandError(f'方案與目前的課表衝突：{conflicts}')
+            self.stdout.write(self.style.SUCCESS(f'已套用排課方案：{updated} 門開課'))
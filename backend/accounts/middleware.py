@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+自訂中間件
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .compression import choose_encoding, compress
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    API JSON 回應壓縮（brotli 優先，其次 gzip）
+    只處理超過門檻大小的 API 回應；已帶 Content-Encoding（例如快取中預先壓縮的內容）
+    或串流回應則直接放行
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        if not request.path.startswith(settings.API_COMPRESSION_PATH_PREFIX):
+            return response
+
+        if 'application/json' not in response.get('Content-Type', ''):
+            return response
+
+        if len(response.content) < settings.API_COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+
+        # 與 Django GZipMiddleware 相同：壓縮後改為弱 ETag
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+
+        response['Content-Encoding'] = encoding
+        return response
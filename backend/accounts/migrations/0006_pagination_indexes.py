@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_profile_avatar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courseoffering',
+            index=models.Index(fields=['created_at'], name='accounts_co_created_b59460_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseoffering',
+            index=models.Index(fields=['academic_year', 'semester', 'current_students'], name='accounts_co_academi_c53da2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['created_at'], name='accounts_pr_created_4522d8_idx'),
+        ),
+    ]
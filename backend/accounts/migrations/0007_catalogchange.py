@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offering_id', models.BigIntegerField(verbose_name='開課 ID')),
+                ('action', models.CharField(choices=[('upsert', '新增/更新'), ('delete', '刪除')], max_length=10, verbose_name='動作')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='異動時間')),
+            ],
+            options={
+                'verbose_name': '目錄異動紀錄',
+                'verbose_name_plural': '目錄異動紀錄',
+                'ordering': ['id'],
+            },
+        ),
+    ]
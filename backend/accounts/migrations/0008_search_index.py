@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+課程全文搜尋索引表（見 accounts/search_index.py）
+SQLite 建立 FTS5 虛擬表，PostgreSQL 建立 tsvector 表與 GIN 索引，其他資料庫不建立
+建立後執行 python manage.py rebuild_search_index 寫入既有資料
+"""
+from django.db import migrations
+
+SQLITE_TABLE = 'accounts_offering_fts'
+POSTGRES_TABLE = 'accounts_offering_search'
+
+
+def create_index_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+            f"USING fts5(name, code, teachers, description, tokenize = 'unicode61')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} '
+            f'(offering_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin '
+            f'ON {POSTGRES_TABLE} USING GIN (document)'
+        )
+
+
+def drop_index_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {POSTGRES_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_catalogchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index_table, drop_index_table),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferingSearchDocument',
+            fields=[
+                ('offering', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='accounts.courseoffering', verbose_name='開課')),
+                ('academic_year', models.CharField(max_length=10, verbose_name='學年度')),
+                ('semester', models.CharField(max_length=1, verbose_name='學期')),
+                ('department_id', models.BigIntegerField(verbose_name='開課系所 ID')),
+                ('course_type', models.CharField(max_length=20, verbose_name='課程類別')),
+                ('grade_level', models.IntegerField(verbose_name='建議修課年級')),
+                ('credits', models.IntegerField(verbose_name='學分數')),
+                ('slots_mon_thu', models.BigIntegerField(default=0, verbose_name='時段（星期一～四）')),
+                ('slots_fri_sun', models.BigIntegerField(default=0, verbose_name='時段（星期五～日）')),
+                ('teacher_names', models.CharField(blank=True, max_length=500, verbose_name='授課教師')),
+                ('max_students', models.IntegerField(default=0, verbose_name='人數上限')),
+                ('current_students', models.IntegerField(default=0, verbose_name='目前人數')),
+                ('status', models.CharField(max_length=10, verbose_name='開課狀態')),
+                ('search_text', models.TextField(blank=True, verbose_name='搜尋文字')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '開課搜尋文件',
+                'verbose_name_plural': '開課搜尋文件',
+                'indexes': [models.Index(fields=['academic_year', 'semester', 'department_id'], name='accounts_of_academi_4fcb59_idx'), models.Index(fields=['academic_year', 'semester', 'course_type'], name='accounts_of_academi_5f12ca_idx'), models.Index(fields=['academic_year', 'semester', 'grade_level'], name='accounts_of_academi_b6a998_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_offeringsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='相似度')),
+                ('computed_at', models.DateTimeField(auto_now_add=True, verbose_name='計算時間')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_courses', to='accounts.course', verbose_name='課程')),
+                ('similar_course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.course', verbose_name='相似課程')),
+            ],
+            options={
+                'verbose_name': '相似課程',
+                'verbose_name_plural': '相似課程',
+                'ordering': ['course', '-score'],
+                'indexes': [models.Index(fields=['course', '-score'], name='accounts_co_course__56272f_idx')],
+                'unique_together': {('course', 'similar_course')},
+            },
+        ),
+    ]
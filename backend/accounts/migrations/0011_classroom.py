@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_classrooms(apps, schema_editor):
+    """由既有上課時段的上課地點文字建立教室資料並連結（教室使用時段由 rebuild_room_occupancy 建立）"""
+    Classroom = apps.get_model('accounts', 'Classroom')
+    ClassTime = apps.get_model('accounts', 'ClassTime')
+
+    names = {name.strip() for name in ClassTime.objects.values_list('classroom', flat=True) if name and name.strip()}
+    Classroom.objects.bulk_create([Classroom(name=name) for name in sorted(names)], ignore_conflicts=True)
+    rooms = dict(Classroom.objects.values_list('name', 'id'))
+
+    class_times = list(ClassTime.objects.only('id', 'classroom'))
+    for ct in class_times:
+        ct.room_id = rooms.get((ct.classroom or '').strip())
+    ClassTime.objects.bulk_update(class_times, ['room'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_coursesimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Classroom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='教室名稱')),
+                ('building', models.CharField(blank=True, max_length=50, verbose_name='大樓')),
+                ('capacity', models.IntegerField(default=0, verbose_name='容納人數')),
+                ('is_active', models.BooleanField(default=True, verbose_name='可排課')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '教室',
+                'verbose_name_plural': '教室',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='classtime',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='class_times', to='accounts.classroom', verbose_name='教室'),
+        ),
+        migrations.CreateModel(
+            name='ClassroomOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=10, verbose_name='學年度')),
+                ('semester', models.CharField(max_length=1, verbose_name='學期')),
+                ('slots_mon_thu', models.BigIntegerField(default=0, verbose_name='時段（星期一～四）')),
+                ('slots_fri_sun', models.BigIntegerField(default=0, verbose_name='時段（星期五～日）')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancies', to='accounts.classroom', verbose_name='教室')),
+            ],
+            options={
+                'verbose_name': '教室使用時段',
+                'verbose_name_plural': '教室使用時段',
+                'indexes': [models.Index(fields=['academic_year', 'semester'], name='accounts_cl_academi_cdb5c7_idx')],
+                'unique_together': {('classroom', 'academic_year', 'semester')},
+            },
+        ),
+        migrations.RunPython(link_classrooms, migrations.RunPython.noop),
+    ]
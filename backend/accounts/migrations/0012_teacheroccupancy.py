@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_classroom'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=10, verbose_name='學年度')),
+                ('semester', models.CharField(max_length=1, verbose_name='學期')),
+                ('slots_mon_thu', models.BigIntegerField(default=0, verbose_name='時段（星期一～四）')),
+                ('slots_fri_sun', models.BigIntegerField(default=0, verbose_name='時段（星期五～日）')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='teaching_occupancies', to=settings.AUTH_USER_MODEL, verbose_name='教師')),
+            ],
+            options={
+                'verbose_name': '教師授課時段',
+                'verbose_name_plural': '教師授課時段',
+                'indexes': [models.Index(fields=['academic_year', 'semester'], name='accounts_te_academi_a90dfb_idx')],
+                'unique_together': {('teacher', 'academic_year', 'semester')},
+            },
+        ),
+    ]
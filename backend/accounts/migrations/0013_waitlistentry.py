@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_teacheroccupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', '候補中'), ('promoted', '已遞補'), ('cancelled', '已取消')], default='waiting', max_length=10, verbose_name='狀態')),
+                ('joined_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='加入候補時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('offering', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='accounts.courseoffering', verbose_name='開課')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL, verbose_name='學生')),
+            ],
+            options={
+                'verbose_name': '候補名單',
+                'verbose_name_plural': '候補名單',
+                'ordering': ['joined_at', 'id'],
+                'indexes': [models.Index(fields=['offering', 'status', 'joined_at'], name='accounts_wa_offerin_bdf5b7_idx')],
+                'unique_together': {('student', 'offering')},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_waitlistentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationRound',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=10, verbose_name='學年度')),
+                ('semester', models.CharField(choices=[('1', '上學期'), ('2', '下學期')], max_length=1, verbose_name='學期')),
+                ('opens_at', models.DateTimeField(verbose_name='開始填寫時間')),
+                ('closes_at', models.DateTimeField(verbose_name='截止時間')),
+                ('status', models.CharField(choices=[('open', '志願填寫中'), ('allocated', '已分發')], default='open', max_length=10, verbose_name='狀態')),
+                ('seed', models.BigIntegerField(blank=True, null=True, verbose_name='抽籤亂數種子')),
+                ('allocated_at', models.DateTimeField(blank=True, null=True, verbose_name='分發時間')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '志願分發',
+                'verbose_name_plural': '志願分發',
+                'unique_together': {('academic_year', 'semester')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CoursePreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='志願序')),
+                ('result', models.CharField(choices=[('pending', '待分發'), ('assigned', '已分發'), ('rejected', '未分發')], default='pending', max_length=10, verbose_name='分發結果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('allocation_round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferences', to='accounts.allocationround', verbose_name='志願分發')),
+                ('offering', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferences', to='accounts.courseoffering', verbose_name='開課')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_preferences', to=settings.AUTH_USER_MODEL, verbose_name='學生')),
+            ],
+            options={
+                'verbose_name': '選課志願',
+                'verbose_name_plural': '選課志願',
+                'ordering': ['student', 'rank'],
+                'unique_together': {('allocation_round', 'student', 'offering')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_allocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('enrolled', '選課'), ('dropped', '退選'), ('graded', '成績'), ('deleted', '刪除')], max_length=10, verbose_name='事件')),
+                ('student_id', models.BigIntegerField(verbose_name='學生 ID')),
+                ('offering_id', models.BigIntegerField(verbose_name='開課 ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='時間')),
+            ],
+            options={
+                'verbose_name': '選課事件',
+                'verbose_name_plural': '選課事件',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='名稱')),
+                ('position', models.BigIntegerField(default=0, verbose_name='已處理到')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '選課事件處理進度',
+                'verbose_name_plural': '選課事件處理進度',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_enrollment_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='種類')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='參數')),
+                ('status', models.CharField(choices=[('queued', '排隊中'), ('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗')], default='queued', max_length=10, verbose_name='狀態')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='進度（%）')),
+                ('message', models.CharField(blank=True, max_length=200, verbose_name='進度說明')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='結果')),
+                ('error', models.TextField(blank=True, verbose_name='錯誤訊息')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='已執行次數')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='最多執行次數')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='可執行時間')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='結束時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='建立者')),
+            ],
+            options={
+                'verbose_name': '背景工作',
+                'verbose_name_plural': '背景工作',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='accounts_jo_status_b1c0d6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:53
+
+import accounts.pagination
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courseoffering',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('max_students'), '-', models.F('current_students')), models.F('id'), name='accounts_co_remaining_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['real_name', 'id'], name='accounts_pr_name_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(accounts.pagination.BlankIfNull('student_id'), models.F('id'), name='accounts_pr_student_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(accounts.pagination.BlankIfNull('teacher_id'), models.F('id'), name='accounts_pr_teacher_sort_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_sort_expression_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='名稱')),
+                ('value', models.BigIntegerField(verbose_name='版本號')),
+            ],
+            options={
+                'verbose_name': '快取版本號',
+                'verbose_name_plural': '快取版本號',
+            },
+        ),
+    ]
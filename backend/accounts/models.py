@@ -1,5 +1,9 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from .pagination import BlankIfNull
 
 # ===== 使用者相關 =====
 
@@ -52,6 +56,13 @@ class Profile(models.Model):
     class Meta:
         verbose_name = "個人資料"
         verbose_name_plural = "個人資料"
+        indexes = [
+            models.Index(fields=['created_at']),
+            # 列表排序（pagination.py 的 STUDENT_SORT_KEYS、TEACHER_SORT_KEYS）：運算式需與排序相同才能使用索引
+            models.Index(fields=['real_name', 'id'], name='accounts_pr_name_sort_idx'),
+            models.Index(BlankIfNull('student_id'), F('id'), name='accounts_pr_student_sort_idx'),
+            models.Index(BlankIfNull('teacher_id'), F('id'), name='accounts_pr_teacher_sort_idx'),
+        ]
 
 
 # ===== 基礎資料 =====
@@ -84,6 +95,32 @@ class Program(models.Model):
         verbose_name_plural = "學制"
 
 
+class Classroom(models.Model):
+    """教室"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="教室名稱")
+    building = models.CharField(max_length=50, blank=True, verbose_name="大樓")
+    capacity = models.IntegerField(default=0, verbose_name="容納人數")  # 0 表示尚未設定
+    is_active = models.BooleanField(default=True, verbose_name="可排課")
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    def __str__(self):
+        return self.name
+    
+    @classmethod
+    def for_name(cls, name):
+        """依上課地點文字取得教室（沒有的教室自動建立）；空白時回傳 None"""
+        name = (name or '').strip()
+        if not name:
+            return None
+        return cls.objects.get_or_create(name=name)[0]
+    
+    class Meta:
+        verbose_name = "教室"
+        verbose_name_plural = "教室"
+        ordering = ['name']
+
+
 # ===== 課程相關 =====
 
 class Course(models.Model):
@@ -191,6 +228,10 @@ class CourseOffering(models.Model):
         indexes = [
             models.Index(fields=['academic_year', 'semester']),
             models.Index(fields=['department']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['academic_year', 'semester', 'current_students']),
+            # 剩餘名額排序（pagination.py 的 remaining_seats）
+            models.Index(F('max_students') - F('current_students'), F('id'), name='accounts_co_remaining_sort_idx'),
         ]
 
 
@@ -237,6 +278,7 @@ class ClassTime(models.Model):
     start_period = models.IntegerField(verbose_name="開始節次")
     end_period = models.IntegerField(verbose_name="結束節次")
     classroom = models.CharField(max_length=50, verbose_name="上課地點")
+    room = models.ForeignKey(Classroom, on_delete=models.SET_NULL, null=True, blank=True, related_name='class_times', verbose_name="教室")
     
     # 進階功能
     weeks = models.TextField(blank=True, null=True, verbose_name="上課週次")  # 例如: "1-9,11-18"
@@ -247,6 +289,15 @@ class ClassTime(models.Model):
     def __str__(self):
         return f"{self.offering.course.course_name} - {self.get_weekday_display()} 第{self.start_period}-{self.end_period}節"
     
+    def save(self, *args, **kwargs):
+        # 上課地點仍是自由輸入的文字，儲存時對應到教室資料
+        room = Classroom.for_name(self.classroom)
+        if room != self.room:
+            self.room = room
+            if kwargs.get('update_fields') is not None and 'classroom' in kwargs['update_fields']:
+                kwargs['update_fields'] = list(kwargs['update_fields']) + ['room']
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = "上課時段"
         verbose_name_plural = "上課時段"
@@ -300,7 +351,24 @@ class Enrollment(models.Model):
     def __str__(self):
         student_name = self.student.profile.real_name if hasattr(self.student, 'profile') else self.student.username
         return f"{student_name} - {self.offering.course.course_name} ({self.get_status_display()})"
-    
+
+    @classmethod
+    def for_student(cls, student, offering):
+        """
+        取得學生這門開課的選課紀錄；沒有時回傳尚未存檔的新紀錄
+        每位學生每門開課只有一筆（unique_together），退選後再選要沿用原本那筆
+        """
+        enrollment = cls.objects.filter(student=student, offering=offering).first()
+        return enrollment or cls(student=student, offering=offering, status='dropped')
+
+    def activate(self):
+        """設為已選課並存檔（新紀錄或沿用退選過的紀錄）"""
+        self.status = 'enrolled'
+        self.grade = None
+        self.score = None
+        self.enrolled_at = timezone.now()
+        self.save()
+
     def check_time_conflict(self):
         """檢查時段衝突"""
         # 取得這次選課的所有時段
@@ -343,6 +411,97 @@ class FavoriteCourse(models.Model):
         return f"{student_name} - {self.offering.course.course_name}"
 
 
+class WaitlistEntry(models.Model):
+    """候補名單：課程額滿時排隊，有人退選時依加入順序（先到先遞補）自動選上"""
+
+    STATUS_CHOICES = [
+        ('waiting', '候補中'),
+        ('promoted', '已遞補'),
+        ('cancelled', '已取消'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries', verbose_name="學生")
+    offering = models.ForeignKey(CourseOffering, on_delete=models.CASCADE, related_name='waitlist_entries', verbose_name="開課")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting', verbose_name="狀態")
+    joined_at = models.DateTimeField(default=timezone.now, verbose_name="加入候補時間")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "候補名單"
+        verbose_name_plural = "候補名單"
+        unique_together = ['student', 'offering']
+        ordering = ['joined_at', 'id']
+        indexes = [
+            models.Index(fields=['offering', 'status', 'joined_at']),
+        ]
+
+    def __str__(self):
+        student_name = self.student.profile.real_name if hasattr(self.student, 'profile') else self.student.username
+        return f"{student_name} - {self.offering.course.course_name} ({self.get_status_display()})"
+
+
+class AllocationRound(models.Model):
+    """
+    志願分發：學期可選擇改用志願分發取代先搶先贏
+    填寫期間學生排定志願序，截止後批次分發名額（見 lottery.py）；分發完成前不開放一般選課
+    """
+
+    STATUS_CHOICES = [
+        ('open', '志願填寫中'),
+        ('allocated', '已分發'),
+    ]
+
+    academic_year = models.CharField(max_length=10, verbose_name="學年度")
+    semester = models.CharField(max_length=1, choices=CourseOffering.SEMESTER_CHOICES, verbose_name="學期")
+    opens_at = models.DateTimeField(verbose_name="開始填寫時間")
+    closes_at = models.DateTimeField(verbose_name="截止時間")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', verbose_name="狀態")
+    seed = models.BigIntegerField(blank=True, null=True, verbose_name="抽籤亂數種子")  # 分發時記錄，可重現結果
+    allocated_at = models.DateTimeField(blank=True, null=True, verbose_name="分發時間")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    class Meta:
+        verbose_name = "志願分發"
+        verbose_name_plural = "志願分發"
+        unique_together = ['academic_year', 'semester']
+
+    def __str__(self):
+        return f"{self.academic_year}-{self.get_semester_display()} 志願分發 ({self.get_status_display()})"
+
+    def is_accepting(self):
+        """目前是否可以填寫志願"""
+        return self.status == 'open' and self.opens_at <= timezone.now() < self.closes_at
+
+
+class CoursePreference(models.Model):
+    """志願分發的志願（rank 越小越優先）"""
+
+    RESULT_CHOICES = [
+        ('pending', '待分發'),
+        ('assigned', '已分發'),
+        ('rejected', '未分發'),
+    ]
+
+    allocation_round = models.ForeignKey(AllocationRound, on_delete=models.CASCADE, related_name='preferences', verbose_name="志願分發")
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_preferences', verbose_name="學生")
+    offering = models.ForeignKey(CourseOffering, on_delete=models.CASCADE, related_name='preferences', verbose_name="開課")
+    rank = models.PositiveSmallIntegerField(verbose_name="志願序")
+    result = models.CharField(max_length=10, choices=RESULT_CHOICES, default='pending', verbose_name="分發結果")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    class Meta:
+        verbose_name = "選課志願"
+        verbose_name_plural = "選課志願"
+        unique_together = ['allocation_round', 'student', 'offering']
+        ordering = ['student', 'rank']
+
+    def __str__(self):
+        student_name = self.student.profile.real_name if hasattr(self.student, 'profile') else self.student.username
+        return f"{student_name} 第{self.rank}志願 - {self.offering.course.course_name}"
+
+
 # ===== 學分統計 =====
 
 class CreditSummary(models.Model):
@@ -368,4 +527,245 @@ class CreditSummary(models.Model):
     
     def __str__(self):
         student_name = self.student.profile.real_name if hasattr(self.student, 'profile') else self.student.username
-        return f"{student_name} 的學分統計"
\ No newline at end of file
+        return f"{student_name} 的學分統計"
+
+# ===== 目錄同步 =====
+
+class CatalogChange(models.Model):
+    """
+    開課異動紀錄（供增量同步使用）
+    id 即為目錄版本號；只記錄開課 ID 與動作，內容在查詢時再取最新資料
+    """
+    ACTION_CHOICES = [
+        ('upsert', '新增/更新'),
+        ('delete', '刪除'),
+    ]
+
+    offering_id = models.BigIntegerField(verbose_name="開課 ID")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="動作")
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="異動時間")
+
+    class Meta:
+        verbose_name = "目錄異動紀錄"
+        verbose_name_plural = "目錄異動紀錄"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.get_action_display()} 開課 {self.offering_id}"
+
+
+class CacheVersion(models.Model):
+    """
+    快取版本號（目錄、名額、文字、各使用者的收藏，見 catalog_cache.py）
+    存在資料庫而不是各 process 的記憶體快取：任何一個 worker 遞增後，其他 worker 下一個請求就會看到
+    """
+    key = models.CharField(max_length=100, primary_key=True, verbose_name="名稱")
+    value = models.BigIntegerField(verbose_name="版本號")
+
+    class Meta:
+        verbose_name = "快取版本號"
+        verbose_name_plural = "快取版本號"
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+# ===== 選課事件 =====
+
+class EnrollmentEvent(models.Model):
+    """
+    選課事件（outbox，與選課紀錄在同一個交易寫入）
+    id 即為事件序號；只記錄學生、開課與事件種類，內容在處理時再取最新資料
+    """
+    KIND_CHOICES = [
+        ('enrolled', '選課'),
+        ('dropped', '退選'),
+        ('graded', '成績'),
+        ('deleted', '刪除'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="事件")
+    student_id = models.BigIntegerField(verbose_name="學生 ID")
+    offering_id = models.BigIntegerField(verbose_name="開課 ID")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="時間")
+
+    class Meta:
+        verbose_name = "選課事件"
+        verbose_name_plural = "選課事件"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.get_kind_display()} 學生 {self.student_id} 開課 {self.offering_id}"
+
+
+class EventCheckpoint(models.Model):
+    """選課事件處理進度（每個 consumer 一筆，position 為已處理的最後一個事件 id）"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="名稱")
+    position = models.BigIntegerField(default=0, verbose_name="已處理到")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "選課事件處理進度"
+        verbose_name_plural = "選課事件處理進度"
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+# ===== 教室與教師使用時段 =====
+
+class ClassroomOccupancy(models.Model):
+    """
+    教室每學期的使用時段（教室 × 星期 × 節次的位元遮罩，見 timeslots.py）
+    查詢空教室、檢查教室衝堂只需一筆資料的位元 AND；由訊號維護（見 room_occupancy.py）
+    """
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='occupancies', verbose_name="教室")
+    academic_year = models.CharField(max_length=10, verbose_name="學年度")
+    semester = models.CharField(max_length=1, verbose_name="學期")
+    slots_mon_thu = models.BigIntegerField(default=0, verbose_name="時段（星期一～四）")
+    slots_fri_sun = models.BigIntegerField(default=0, verbose_name="時段（星期五～日）")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "教室使用時段"
+        verbose_name_plural = "教室使用時段"
+        unique_together = ['classroom', 'academic_year', 'semester']
+        indexes = [
+            models.Index(fields=['academic_year', 'semester']),
+        ]
+
+    def __str__(self):
+        return f"{self.classroom.name} {self.academic_year}-{self.semester}"
+
+
+class TeacherOccupancy(models.Model):
+    """
+    教師每學期的授課時段（主開課與協同教師都算），檢查教師衝堂只需一筆資料的位元 AND
+    由訊號維護（見 teacher_occupancy.py）
+    """
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='teaching_occupancies', verbose_name="教師")
+    academic_year = models.CharField(max_length=10, verbose_name="學年度")
+    semester = models.CharField(max_length=1, verbose_name="學期")
+    slots_mon_thu = models.BigIntegerField(default=0, verbose_name="時段（星期一～四）")
+    slots_fri_sun = models.BigIntegerField(default=0, verbose_name="時段（星期五～日）")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "教師授課時段"
+        verbose_name_plural = "教師授課時段"
+        unique_together = ['teacher', 'academic_year', 'semester']
+        indexes = [
+            models.Index(fields=['academic_year', 'semester']),
+        ]
+
+    def __str__(self):
+        return f"{self.teacher.username} {self.academic_year}-{self.semester}"
+
+
+# ===== 搜尋文件 =====
+
+class OfferingSearchDocument(models.Model):
+    """
+    開課搜尋文件（每門開課一筆的反正規化資料）
+    搜尋篩選只查這張表，不必 JOIN 課程、系所、教師、時段；由訊號維護（見 search_documents.py）
+    """
+    offering = models.OneToOneField(CourseOffering, on_delete=models.CASCADE, primary_key=True, related_name='search_document', verbose_name="開課")
+
+    # 篩選條件
+    academic_year = models.CharField(max_length=10, verbose_name="學年度")
+    semester = models.CharField(max_length=1, verbose_name="學期")
+    department_id = models.BigIntegerField(verbose_name="開課系所 ID")
+    course_type = models.CharField(max_length=20, verbose_name="課程類別")
+    grade_level = models.IntegerField(verbose_name="建議修課年級")
+    credits = models.IntegerField(verbose_name="學分數")
+
+    # 上課時段位元遮罩（見 timeslots.py）
+    slots_mon_thu = models.BigIntegerField(default=0, verbose_name="時段（星期一～四）")
+    slots_fri_sun = models.BigIntegerField(default=0, verbose_name="時段（星期五～日）")
+
+    # 顯示與排序用
+    teacher_names = models.CharField(max_length=500, blank=True, verbose_name="授課教師")
+    max_students = models.IntegerField(default=0, verbose_name="人數上限")
+    current_students = models.IntegerField(default=0, verbose_name="目前人數")
+    status = models.CharField(max_length=10, verbose_name="開課狀態")
+
+    # 課程名稱（中英）、代碼、舊代碼、教師姓名、描述，全部轉小寫
+    search_text = models.TextField(blank=True, verbose_name="搜尋文字")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "開課搜尋文件"
+        verbose_name_plural = "開課搜尋文件"
+        indexes = [
+            models.Index(fields=['academic_year', 'semester', 'department_id']),
+            models.Index(fields=['academic_year', 'semester', 'course_type']),
+            models.Index(fields=['academic_year', 'semester', 'grade_level']),
+        ]
+
+    def __str__(self):
+        return f"搜尋文件: 開課 {self.offering_id}"
+
+
+# ===== 相似課程 =====
+
+class CourseSimilarity(models.Model):
+    """
+    相似課程（依課程名稱與描述的 TF-IDF 向量計算餘弦相似度）
+    由 compute_similar_courses 批次計算，每門課程保留最相似的前幾名
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='similar_courses', verbose_name="課程")
+    similar_course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+', verbose_name="相似課程")
+    score = models.FloatField(verbose_name="相似度")
+    computed_at = models.DateTimeField(auto_now_add=True, verbose_name="計算時間")
+
+    class Meta:
+        verbose_name = "相似課程"
+        verbose_name_plural = "相似課程"
+        unique_together = ['course', 'similar_course']
+        ordering = ['course', '-score']
+        indexes = [
+            models.Index(fields=['course', '-score']),
+        ]
+
+    def __str__(self):
+        return f"{self.course.course_name} ~ {self.similar_course.course_name} ({self.score:.3f})"
+
+
+# ===== 背景工作 =====
+
+class Job(models.Model):
+    """背景工作（匯入、大量建立帳號、重設密碼、重算學分、匯出），由 run_jobs 執行"""
+    STATUS_CHOICES = [
+        ('queued', '排隊中'),
+        ('running', '執行中'),
+        ('succeeded', '已完成'),
+        ('failed', '失敗'),
+    ]
+
+    kind = models.CharField(max_length=50, verbose_name="種類")
+    params = models.JSONField(default=dict, blank=True, verbose_name="參數")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="狀態")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="進度（%）")
+    message = models.CharField(max_length=200, blank=True, verbose_name="進度說明")
+    result = models.JSONField(null=True, blank=True, verbose_name="結果")
+    error = models.TextField(blank=True, verbose_name="錯誤訊息")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="已執行次數")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="最多執行次數")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="可執行時間")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs', verbose_name="建立者")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始時間")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="結束時間")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "背景工作"
+        verbose_name_plural = "背景工作"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.kind}（{self.get_status_display()}）"
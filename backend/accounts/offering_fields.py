@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+開課資料欄位定義（支援 ?fields= 稀疏欄位）
+每個輸出欄位記錄它需要的資料表欄位與 prefetch，
+查詢時只 SELECT 被要求的欄位、只 prefetch 需要的關聯
+例如 fields=id,course_name,current_students 時不會查 ClassTime 與 OfferingTeacher
+"""
+
+
+class InvalidFieldsRequest(Exception):
+    """fields 參數包含不存在的欄位（由 view 轉成 400 回應）"""
+
+
+class FieldSpec:
+    """輸出欄位：需要的模型欄位（only）、需要的 prefetch、取值函式"""
+
+    def __init__(self, getter, only=(), prefetch=()):
+        self.getter = getter
+        self.only = tuple(only)
+        self.prefetch = tuple(prefetch)
+
+
+def _teacher_name(ot):
+    return ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
+
+
+def _teachers(offering, context):
+    return [
+        {
+            'id': ot.teacher.id,
+            'name': _teacher_name(ot),
+            'role': ot.role,
+            'role_display': ot.get_role_display(),
+        }
+        for ot in offering.offering_teachers.all()
+    ]
+
+
+def _main_teacher_name(offering, context):
+    # 從已 prefetch 的教師中找主開課教師，不另外查詢
+    for ot in offering.offering_teachers.all():
+        if ot.role == 'main':
+            return ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else '未設定'
+    return '未設定'
+
+
+def _class_times(offering, context):
+    return [
+        {
+            'weekday': ct.weekday,
+            'weekday_display': ct.get_weekday_display(),
+            'start_period': ct.start_period,
+            'end_period': ct.end_period,
+            'classroom': ct.classroom,
+        }
+        for ct in offering.class_times.all()
+    ]
+
+
+TEACHERS_PREFETCH = 'offering_teachers__teacher__profile'
+CLASS_TIMES_PREFETCH = 'class_times'
+
+OFFERING_FIELDS = {
+    'id': FieldSpec(lambda o, ctx: o.id, only=['id']),
+    'course_code': FieldSpec(lambda o, ctx: o.course.course_code, only=['course__course_code']),
+    'course_name': FieldSpec(lambda o, ctx: o.course.course_name, only=['course__course_name']),
+    'course_name_en': FieldSpec(lambda o, ctx: o.course.course_name_en, only=['course__course_name_en']),
+    'course_type': FieldSpec(lambda o, ctx: o.course.course_type, only=['course__course_type']),
+    'course_type_display': FieldSpec(lambda o, ctx: o.course.get_course_type_display(), only=['course__course_type']),
+    'credits': FieldSpec(lambda o, ctx: o.course.credits, only=['course__credits']),
+    'description': FieldSpec(lambda o, ctx: o.course.description, only=['course__description']),
+    'academic_year': FieldSpec(lambda o, ctx: o.academic_year, only=['academic_year']),
+    'semester': FieldSpec(lambda o, ctx: o.semester, only=['semester']),
+    'semester_display': FieldSpec(lambda o, ctx: o.get_semester_display(), only=['semester']),
+    'department': FieldSpec(lambda o, ctx: o.department.name, only=['department__name']),
+    'grade_level': FieldSpec(lambda o, ctx: o.grade_level, only=['grade_level']),
+    'teacher_name': FieldSpec(_main_teacher_name, prefetch=[TEACHERS_PREFETCH]),
+    'teachers': FieldSpec(_teachers, prefetch=[TEACHERS_PREFETCH]),
+    'class_times': FieldSpec(_class_times, prefetch=[CLASS_TIMES_PREFETCH]),
+    'max_students': FieldSpec(lambda o, ctx: o.max_students, only=['max_students']),
+    'current_students': FieldSpec(lambda o, ctx: o.current_students, only=['current_students']),
+    'status': FieldSpec(lambda o, ctx: o.status, only=['status']),
+    'status_display': FieldSpec(lambda o, ctx: o.get_status_display(), only=['status']),
+    'is_favorited': FieldSpec(lambda o, ctx: o.id in ctx.get('favorite_ids', ())),
+}
+
+# 各端點未指定 fields 時的預設欄位（與原本的回傳格式相同）
+SEARCH_DEFAULT_FIELDS = [
+    'id', 'course_code', 'course_name', 'course_type', 'course_type_display',
+    'credits', 'description', 'academic_year', 'semester', 'semester_display',
+    'department', 'grade_level', 'teachers', 'class_times',
+    'max_students', 'current_students', 'status', 'status_display', 'is_favorited',
+]
+
+FAVORITE_DEFAULT_FIELDS = [
+    'id', 'course_code', 'course_name', 'course_type', 'course_type_display',
+    'credits', 'description', 'academic_year', 'semester', 'semester_display',
+    'department', 'grade_level', 'teacher_name', 'teachers', 'class_times',
+    'max_students', 'current_students', 'status', 'status_display', 'is_favorited',
+    'favorited_at',
+]
+
+SIMILAR_DEFAULT_FIELDS = [
+    'id', 'course_code', 'course_name', 'course_type', 'course_type_display',
+    'credits', 'department', 'teacher_name', 'class_times',
+    'max_students', 'current_students', 'status', 'similarity',
+]
+
+PLANNER_DEFAULT_FIELDS = [
+    'id', 'course_code', 'course_name', 'course_type', 'course_type_display',
+    'credits', 'department', 'teacher_name', 'class_times',
+    'max_students', 'current_students', 'status',
+]
+
+ENROLLED_DEFAULT_FIELDS = [
+    'id', 'course_code', 'course_name', 'course_type', 'course_type_display',
+    'credits', 'teacher_name', 'teachers', 'class_times', 'enrolled_at',
+]
+
+
+def parse_fields(raw, default_fields, extra_fields=()):
+    """
+    解析 fields 參數（逗號分隔字串或列表）
+    extra_fields: 該端點額外提供、不屬於開課本身的欄位（例如 favorited_at）
+    """
+    if not raw:
+        return list(default_fields)
+
+    if isinstance(raw, str):
+        raw = raw.split(',')
+
+    fields = []
+    for name in raw:
+        name = str(name).strip()
+        if name and name not in fields:
+            fields.append(name)
+
+    allowed = set(OFFERING_FIELDS) | set(extra_fields)
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise InvalidFieldsRequest(f"不支援的欄位: {', '.join(unknown)}")
+    if not fields:
+        return list(default_fields)
+    return fields
+
+
+def apply_field_projection(queryset, fields, prefix='', extra_only=()):
+    """
+    依欄位限制 SELECT 欄位與 prefetch
+    prefix: queryset 不是 CourseOffering 時，指向開課的關聯名稱（例如 'offering'）
+    extra_only: queryset 本身還需要的欄位（例如收藏時間）
+    """
+    only = set()
+    prefetch = set()
+
+    for name in fields:
+        spec = OFFERING_FIELDS.get(name)
+        if spec is None:
+            continue
+        only.update(spec.only)
+        prefetch.update(spec.prefetch)
+
+    if prefix:
+        only = {f'{prefix}__{path}' for path in only} | {prefix}
+        prefetch = {f'{prefix}__{path}' for path in prefetch}
+    only |= set(extra_only)
+
+    # select_related 的關聯本身也必須載入，不能被 defer
+    select = set()
+    for path in only:
+        parts = path.split('__')
+        for i in range(1, len(parts)):
+            select.add('__'.join(parts[:i]))
+    only |= select
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset.only(*sorted(only)) if only else queryset.only('id')
+
+
+def serialize_offering(offering, fields, context=None, extras=None):
+    """
+    依欄位輸出開課資料
+    extras: {欄位名稱: 無參數函式}，提供端點自己的欄位或覆寫預設值
+    """
+    context = context or {}
+    extras = extras or {}
+    data = {}
+    for name in fields:
+        if name in extras:
+            data[name] = extras[name]()
+        else:
+            data[name] = OFFERING_FIELDS[name].getter(offering, context)
+    return data
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+游標（keyset）分頁與伺服器端排序
+以「排序鍵 + id」做為游標，下一頁用 WHERE (排序鍵, id) > (上一頁最後一筆) 取得，
+不使用 OFFSET，因此不論翻到第幾頁查詢成本都相同
+
+只有在請求帶有 cursor 或 page_size 參數時才分頁，
+未帶參數時維持原本回傳完整列表的格式，前端不受影響
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import CharField, F, Func, Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidPageRequest(Exception):
+    """分頁或排序參數錯誤（由 view 轉成 400 回應）"""
+
+
+class BlankIfNull(Func):
+    """
+    COALESCE(欄位, '')：NULL 排在最前面且游標可以比較
+    空字串直接寫在 SQL 中而不是查詢參數，資料庫才能對應到 models.py 中相同運算式的索引
+    """
+    function = 'COALESCE'
+    template = "%(function)s(%(expressions)s, '')"
+    output_field = CharField()
+
+
+class SortKey:
+    """可排序欄位：查詢運算式與游標值的型別"""
+
+    def __init__(self, expression, kind='str'):
+        self.expression = expression if not isinstance(expression, str) else F(expression)
+        self.kind = kind
+
+    def dump(self, value):
+        if self.kind == 'datetime':
+            return value.isoformat()
+        return value
+
+    def load(self, value):
+        if self.kind == 'datetime':
+            parsed = parse_datetime(value) if isinstance(value, str) else None
+            if parsed is None:
+                raise InvalidPageRequest('無效的分頁游標')
+            return parsed
+        if self.kind == 'int' and not isinstance(value, int):
+            raise InvalidPageRequest('無效的分頁游標')
+        if self.kind == 'float' and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise InvalidPageRequest('無效的分頁游標')
+        if self.kind == 'str' and not isinstance(value, str):
+            raise InvalidPageRequest('無效的分頁游標')
+        return value
+
+
+def _is_false(value):
+    return str(value).lower() in ('0', 'false', 'no', 'off')
+
+
+class KeysetPagination:
+    """
+    用法：
+        paginator = KeysetPagination(request, SORT_KEYS, default_sort='course_code')
+        queryset = paginator.sort(queryset)
+        items = paginator.paginate(queryset)
+        ...把 items 組成 data...
+        return paginator.wrap(data)
+    """
+
+    sort_param = 'sort'
+    cursor_param = 'cursor'
+    page_size_param = 'page_size'
+    count_param = 'count'
+
+    def __init__(self, request, sort_keys, default_sort):
+        self.request = request
+        self.sort_keys = sort_keys
+        self.default_sort = default_sort
+
+        params = request.GET
+        self.enabled = self.cursor_param in params or self.page_size_param in params
+        self.sort_requested = bool(params.get(self.sort_param))
+
+        sort = params.get(self.sort_param) or default_sort
+        self.descending = sort.startswith('-')
+        self.sort_name = sort.lstrip('-')
+        if self.sort_name not in sort_keys:
+            raise InvalidPageRequest(
+                f"不支援的排序欄位: {self.sort_name}（可用: {', '.join(sort_keys)}）"
+            )
+        self.sort_key = sort_keys[self.sort_name]
+
+        self.page_size = self._parse_page_size(params.get(self.page_size_param))
+        self.include_count = not _is_false(params.get(self.count_param, 'true'))
+        self.cursor = self._decode_cursor(params.get(self.cursor_param))
+
+        self.count = None
+        self.next_cursor = None
+
+    def _parse_page_size(self, raw):
+        if raw in (None, ''):
+            return settings.API_PAGE_SIZE
+        try:
+            size = int(raw)
+        except (TypeError, ValueError):
+            raise InvalidPageRequest('page_size 必須是整數')
+        if size < 1:
+            raise InvalidPageRequest('page_size 必須大於 0')
+        return min(size, settings.API_MAX_PAGE_SIZE)
+
+    def _decode_cursor(self, raw):
+        if not raw:
+            return None
+        try:
+            padded = raw + '=' * (-len(raw) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            sort_name, value, last_id = payload
+        except (ValueError, TypeError):
+            raise InvalidPageRequest('無效的分頁游標')
+        if sort_name != self.sort_name or not isinstance(last_id, int):
+            raise InvalidPageRequest('分頁游標與排序方式不符')
+        return self.sort_key.load(value), last_id
+
+    def _encode_cursor(self, item):
+        payload = [self.sort_name, self.sort_key.dump(item.sort_value), item.pk]
+        raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def sort(self, queryset):
+        """套用排序；沒有要求排序或分頁時維持查詢原本的順序"""
+        if not (self.enabled or self.sort_requested):
+            return queryset
+        prefix = '-' if self.descending else ''
+        return queryset.annotate(
+            sort_value=self.sort_key.expression
+        ).order_by(f'{prefix}sort_value', f'{prefix}pk')
+
+    def paginate(self, queryset):
+        """回傳這一頁的資料；未啟用分頁時回傳整個 queryset"""
+        if not self.enabled:
+            return queryset
+
+        if self.include_count:
+            self.count = queryset.count()
+
+        return self._trim(list(self._page_queryset(queryset)))
+
+    async def apaginate(self, queryset):
+        """paginate 的非同步版本（async view 使用），一律回傳列表"""
+        if not self.enabled:
+            return [item async for item in queryset]
+
+        if self.include_count:
+            self.count = await queryset.acount()
+
+        return self._trim([item async for item in self._page_queryset(queryset)])
+
+    def _page_queryset(self, queryset):
+        if self.cursor is not None:
+            value, last_id = self.cursor
+            op = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'sort_value__{op}': value}) |
+                Q(sort_value=value, **{f'pk__{op}': last_id})
+            )
+        # 多取一筆判斷是否還有下一頁
+        return queryset[:self.page_size + 1]
+
+    def _trim(self, items):
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            self.next_cursor = self._encode_cursor(items[-1])
+        return items
+
+    def _next_link(self):
+        if self.next_cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params[self.cursor_param] = self.next_cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def wrap(self, results):
+        """未啟用分頁時直接回傳列表，啟用時包成分頁格式"""
+        if not self.enabled:
+            return results
+        data = {
+            'results': results,
+            'page_size': self.page_size,
+            'sort': ('-' if self.descending else '') + self.sort_name,
+            'next_cursor': self.next_cursor,
+            'next': self._next_link(),
+        }
+        if self.include_count:
+            data['count'] = self.count
+        return data
+
+
+# ===== 各列表可用的排序欄位 =====
+# remaining_seats：剩餘名額；popularity：目前選課人數
+# 運算式排序鍵在 models.py 有相同運算式的索引（修改時兩邊要一致，否則排序無法使用索引）
+
+OFFERING_SORT_KEYS = {
+    'course_code': SortKey('course__course_code'),
+    'created_at': SortKey('created_at', kind='datetime'),
+    'remaining_seats': SortKey(F('max_students') - F('current_students'), kind='int'),
+    'popularity': SortKey('current_students', kind='int'),
+}
+
+# 課程搜尋另外提供 relevance：依關鍵字的 BM25 相關度（由 bm25.apply_relevance 標上 relevance_rank）
+SEARCH_SORT_KEYS = {
+    **OFFERING_SORT_KEYS,
+    'relevance': SortKey('relevance_rank', kind='float'),
+}
+
+STUDENT_SORT_KEYS = {
+    'student_id': SortKey(BlankIfNull('student_id')),
+    'real_name': SortKey('real_name'),
+    'created_at': SortKey('created_at', kind='datetime'),
+}
+
+TEACHER_SORT_KEYS = {
+    'real_name': SortKey('real_name'),
+    'teacher_id': SortKey(BlankIfNull('teacher_id')),
+    'created_at': SortKey('created_at', kind='datetime'),
+}
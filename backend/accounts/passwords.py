@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+預設密碼（管理員重設密碼、大量建立帳號使用）
+預設密碼為學號或教師編號，都沒有時為帳號；設為預設密碼後下次登入須強制修改
+"""
+
+
+def default_password(user):
+    """使用者的預設密碼"""
+    profile = getattr(user, 'profile', None)
+    if profile is not None:
+        if profile.student_id:
+            return profile.student_id
+        if profile.teacher_id:
+            return profile.teacher_id
+    return user.username
+
+
+def reset_to_default(user):
+    """把密碼重設為預設密碼並要求下次登入修改，回傳新密碼"""
+    password = default_password(user)
+    user.set_password(password)
+    user.save()
+    if hasattr(user, 'profile'):
+        user.profile.force_password_change = True
+        user.profile.save()
+    return password
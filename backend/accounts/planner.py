@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+排課規劃：從收藏的開課與必選課程中，列出不衝堂、學分在範圍內的前幾個課表
+
+以回溯法逐門課程決定「選哪一個班」或「不選」：
+- 上課時段以位元遮罩表示（見 timeslots.py），衝堂判斷只需一次位元 AND
+- 剩餘課程全選也達不到學分下限、或不可能勝過目前第 N 名的分支直接剪掉
+- 超過時間預算時停止，回傳目前找到的最佳結果（complete 為 False）
+
+課表排序：學分多者優先，其次上課天數少、空堂少
+
+搜尋在獨立的 process pool 中執行，CPU 密集的運算不佔用 web worker；
+solve() 只接收、回傳基本型別，worker process 不需要載入 Django
+"""
+import heapq
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .timeslots import DAY_MASK, DAYS_PER_WEEK, PERIODS_PER_DAY
+
+CHECK_EVERY = 1024  # 每搜尋幾個節點檢查一次時間
+
+
+class _TimeUp(Exception):
+    pass
+
+
+def _day_masks(mask):
+    return [(mask >> (day * PERIODS_PER_DAY)) & DAY_MASK for day in range(DAYS_PER_WEEK)]
+
+
+def _days(mask):
+    return sum(1 for day in _day_masks(mask) if day)
+
+
+def _gaps(mask):
+    """每天第一節到最後一節之間的空堂數合計"""
+    gaps = 0
+    for day in _day_masks(mask):
+        if day:
+            first = (day & -day).bit_length()
+            gaps += day.bit_length() - first + 1 - bin(day).count('1')
+    return gaps
+
+
+def solve(groups, min_credits, max_credits, top_n=5, time_budget=2.0, fixed_mask=0, fixed_credits=0):
+    """
+    groups: [(course_id, credits, required, [(offering_id, mask), ...]), ...]
+            每門課程一組，同一門課程的不同班級擇一（選修課程也可以不選）
+    fixed_mask / fixed_credits: 已選課程佔用的時段與學分
+    回傳 {'timetables': [...], 'complete': bool, 'explored': 搜尋節點數}
+    """
+    deadline = time.monotonic() + time_budget
+
+    # 必選課程先排（班級少的先排，較早剪枝），選修課程學分高的先排
+    groups = sorted(groups, key=lambda group: (not group[2], len(group[3]) if group[2] else -group[1]))
+    remaining = [0] * (len(groups) + 1)
+    for i in range(len(groups) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + groups[i][1]
+
+    best = []  # 最小堆積：(分數, 序號, offering_ids)，堆頂為目前第 N 名
+    chosen = []
+    explored = 0
+
+    def visit(i, mask, credits):
+        nonlocal explored
+        explored += 1
+        if explored % CHECK_EVERY == 0 and time.monotonic() > deadline:
+            raise _TimeUp
+
+        if credits + remaining[i] < min_credits:
+            return
+        # 分數上限：學分最多加到上限、天數不會再減少、空堂最少為 0
+        if len(best) >= top_n and (min(max_credits, credits + remaining[i]), -_days(mask), 0) <= best[0][0]:
+            return
+
+        if i == len(groups):
+            item = ((credits, -_days(mask), -_gaps(mask)), explored, list(chosen))
+            if len(best) < top_n:
+                heapq.heappush(best, item)
+            elif item[0] > best[0][0]:
+                heapq.heapreplace(best, item)
+            return
+
+        course_id, course_credits, required, sections = groups[i]
+        if credits + course_credits <= max_credits:
+            for offering_id, section_mask in sections:
+                if mask & section_mask:
+                    continue
+                chosen.append(offering_id)
+                visit(i + 1, mask | section_mask, credits + course_credits)
+                chosen.pop()
+        if not required:
+            visit(i + 1, mask, credits)
+
+    complete = True
+    try:
+        visit(0, fixed_mask, fixed_credits)
+    except _TimeUp:
+        complete = False
+
+    timetables = [
+        {'offering_ids': sorted(offering_ids), 'credits': score[0], 'days': -score[1], 'gaps': -score[2]}
+        for score, _, offering_ids in sorted(best, reverse=True)
+    ]
+    return {'timetables': timetables, 'complete': complete, 'explored': explored}
+
+
+# ===== worker pool =====
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn：web worker 可能有多個執行緒，fork 會複製到鎖住的狀態
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PLANNER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def run(groups, min_credits, max_credits, top_n, time_budget, fixed_mask=0, fixed_credits=0):
+    """
+    在 process pool 中執行 solve 並等待結果
+    worker 都在忙時最多再等 PLANNER_POOL_TIMEOUT 秒，逾時拋出 concurrent.futures.TimeoutError
+    """
+    global _executor
+    try:
+        future = _get_executor().submit(
+            solve, groups, min_credits, max_credits, top_n, time_budget, fixed_mask, fixed_credits
+        )
+        return future.result(timeout=time_budget + settings.PLANNER_POOL_TIMEOUT)
+    except BrokenProcessPool:
+        # worker 異常結束（例如被 OOM killer 終止），下次重新建立
+        with _executor_lock:
+            _executor = None
+        raise
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+選課名額即時推播（發佈 / 訂閱）
+enroll_course / drop_course 發佈名額異動，SSE 串流端點訂閱指定的開課 ID
+
+後端可透過 settings.SEAT_PUBSUB_BACKEND 替換：
+- CatalogChangePollingBackend：輪詢 CatalogChange 異動紀錄（預設）
+  選課、退選多半由 WSGI worker 處理，SSE 串流則在 ASGI process，兩者只要共用同一個資料庫即可互通
+- InProcessBackend：只在同一個 process 內轉發，發佈與訂閱必須在同一個 process（例如只跑單一 ASGI 服務）
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+SEAT_FIELDS = ('id', 'current_students', 'max_students', 'status')
+
+
+def seat_event(offering):
+    """由開課資料組出名額事件"""
+    return {
+        'offering_id': offering.id,
+        'current_students': offering.current_students,
+        'max_students': offering.max_students,
+        'status': offering.status,
+    }
+
+
+class Subscription:
+    """
+    單一串流連線的訂閱
+    同一門開課在送出前又有新事件時只保留最新的一筆，
+    慢速的客戶端不會讓待送事件無限累積
+    """
+
+    def __init__(self, offering_ids, loop):
+        self.offering_ids = frozenset(offering_ids)
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+
+    def push(self, event):
+        """可在任何執行緒呼叫"""
+        with self._lock:
+            self._pending[event['offering_id']] = event
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def get(self, timeout):
+        """等待事件；逾時回傳空列表（呼叫端可送出 keep-alive）"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._wakeup.clear()
+        with self._lock:
+            events, self._pending = list(self._pending.values()), {}
+        return events
+
+
+class InProcessBackend:
+    """同一個 process 內的發佈 / 訂閱"""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._by_offering = {}
+
+    def subscribe(self, offering_ids, loop):
+        subscription = Subscription(offering_ids, loop)
+        with self._lock:
+            for offering_id in subscription.offering_ids:
+                self._by_offering.setdefault(offering_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for offering_id in subscription.offering_ids:
+                subscribers = self._by_offering.get(offering_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_offering[offering_id]
+
+    def subscribed_offering_ids(self):
+        with self._lock:
+            return set(self._by_offering)
+
+    def publish(self, event):
+        self._dispatch(event)
+
+    def _dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._by_offering.get(event['offering_id'], ()))
+        for subscription in subscribers:
+            subscription.push(event)
+
+
+class CatalogChangePollingBackend(InProcessBackend):
+    """
+    多 worker 共用的後端：每個 process 以背景執行緒輪詢 CatalogChange，
+    把有本地訂閱者的開課最新名額轉發出去
+    開課儲存時訊號已寫入異動紀錄，因此 publish 不需要額外動作
+    """
+
+    def __init__(self, interval=1.0, **options):
+        super().__init__(**options)
+        self.interval = interval
+        self._poller = None
+        self._last_version = None
+
+    def subscribe(self, offering_ids, loop):
+        subscription = super().subscribe(offering_ids, loop)
+        self._ensure_poller()
+        return subscription
+
+    def publish(self, event):
+        pass
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is not None and self._poller.is_alive():
+                return
+            self._poller = threading.Thread(target=self._poll_forever, name='seat-pubsub-poller', daemon=True)
+            self._poller.start()
+
+    def _poll_forever(self):
+        while True:
+            try:
+                close_old_connections()
+                self.poll_once()
+            except Exception as e:
+                print(f"名額推播輪詢錯誤: {str(e)}")
+            finally:
+                close_old_connections()
+            time.sleep(self.interval)
+
+    def poll_once(self):
+        """讀取上次之後的異動紀錄，轉發給本地訂閱者"""
+        from .models import CatalogChange, CourseOffering
+        from .catalog_sync import current_version
+
+        if self._last_version is None:
+            self._last_version = current_version()
+
+        changes = list(CatalogChange.objects.filter(
+            id__gt=self._last_version
+        ).order_by('id').values_list('id', 'offering_id')[:5000])
+
+        if not changes:
+            return
+        self._last_version = changes[-1][0]
+        watched = self.subscribed_offering_ids()
+        changed_ids = {offering_id for _, offering_id in changes if offering_id in watched}
+        if changed_ids:
+            for row in CourseOffering.objects.filter(id__in=changed_ids).values(*SEAT_FIELDS):
+                self._dispatch({
+                    'offering_id': row['id'],
+                    'current_students': row['current_students'],
+                    'max_students': row['max_students'],
+                    'status': row['status'],
+                })
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """取得設定中的推播後端（每個 process 一個）"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend_class = import_string(settings.SEAT_PUBSUB_BACKEND)
+                _broker = backend_class(**settings.SEAT_PUBSUB_OPTIONS)
+    return _broker
+
+
+def publish_seat_change(offering):
+    """發佈開課名額異動（交易提交後才送出）"""
+    event = seat_event(offering)
+    transaction.on_commit(lambda: get_broker().publish(event))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+教室使用時段（ClassroomOccupancy）的維護與查詢
+每間教室每學期一筆位元遮罩：
+- 查詢空教室：以 NOT EXISTS 排除遮罩重疊的教室，一次查詢
+- 檢查教室衝堂：讀出 (教室, 學期) 一筆資料做位元 AND；只有重疊時才查出是哪一門課
+
+上課時段或開課異動時由訊號呼叫 sync_rooms 重算受影響教室（所有學期）的資料
+首次部署或資料大量匯入後執行 python manage.py rebuild_room_occupancy
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import ClassTime, Classroom, ClassroomOccupancy
+from .timeslots import class_time_mask, join_mask, overlapping, split_mask
+
+
+def sync_rooms(room_ids):
+    """重算指定教室所有學期的使用時段"""
+    room_ids = {room_id for room_id in room_ids if room_id}
+    if not room_ids:
+        return
+
+    masks = defaultdict(int)
+    rows = ClassTime.objects.filter(room_id__in=room_ids).values_list(
+        'room_id', 'offering__academic_year', 'offering__semester', 'weekday', 'start_period', 'end_period'
+    )
+    for room_id, academic_year, semester, weekday, start_period, end_period in rows:
+        masks[(room_id, academic_year, semester)] |= class_time_mask(weekday, start_period, end_period)
+
+    occupancies = []
+    for (room_id, academic_year, semester), mask in masks.items():
+        slots_mon_thu, slots_fri_sun = split_mask(mask)
+        occupancies.append(ClassroomOccupancy(
+            classroom_id=room_id, academic_year=academic_year, semester=semester,
+            slots_mon_thu=slots_mon_thu, slots_fri_sun=slots_fri_sun,
+        ))
+
+    with transaction.atomic():
+        ClassroomOccupancy.objects.filter(classroom_id__in=room_ids).delete()
+        ClassroomOccupancy.objects.bulk_create(occupancies, batch_size=500)
+
+
+def rebuild():
+    """重建所有教室的使用時段，回傳教室數"""
+    room_ids = list(Classroom.objects.values_list('id', flat=True))
+    ClassroomOccupancy.objects.exclude(classroom_id__in=room_ids).delete()
+    sync_rooms(room_ids)
+    return len(room_ids)
+
+
+def find_conflict(room, academic_year, semester, mask, exclude_offering_id=None):
+    """
+    檢查教室在這學期的 mask 時段是否已有課，回傳衝突的 ClassTime 或 None
+    exclude_offering_id: 修改開課時排除它自己原本的時段
+    """
+    if room is None or not mask:
+        return None
+
+    occupancy = ClassroomOccupancy.objects.filter(
+        classroom=room, academic_year=academic_year, semester=semester
+    ).values_list('slots_mon_thu', 'slots_fri_sun').first()
+    if occupancy is None or not (join_mask(*occupancy) & mask):
+        return None
+
+    # 有重疊：找出是哪一門課（也可能只是和自己原本的時段重疊）
+    class_times = ClassTime.objects.filter(
+        room=room, offering__academic_year=academic_year, offering__semester=semester
+    ).exclude(offering_id=exclude_offering_id).select_related('offering__course')
+    for ct in class_times:
+        if class_time_mask(ct.weekday, ct.start_period, ct.end_period) & mask:
+            return ct
+    return None
+
+
+def available_rooms(academic_year, semester, mask, min_capacity=0):
+    """這學期 mask 時段都沒有課、可排課且容量足夠的教室"""
+    busy = overlapping(
+        ClassroomOccupancy.objects.filter(classroom=OuterRef('pk'), academic_year=academic_year, semester=semester),
+        mask
+    )
+    rooms = Classroom.objects.filter(is_active=True).exclude(Exists(busy))
+    if min_capacity:
+        rooms = rooms.filter(capacity__gte=min_capacity)
+    return rooms
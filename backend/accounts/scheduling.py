@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+學期排課：替一個學期的開課自動安排上課時段與教室，產生排課方案供管理員確認後一次套用
+
+每門開課排一個連續時段（與 create_course 相同：一個星期、一段節次、一間教室），
+節數沿用目前的上課時段，尚未排課的開課以學分數為節數；已有多個上課時段的開課不重排，視為固定
+
+硬性限制（違反就不能排）：
+- 教師不可同時段授兩門課（依 OfferingTeacher，主開課與協同教師都算）
+- 教室不可同時段排兩門課
+- 同系所、同年級的必修課不可同時段
+硬性限制以位元遮罩檢查（見 timeslots.py），每次只需幾次位元 AND
+
+軟性偏好（成本越低越好）：
+- 已排好的課盡量不要移動（換時段的成本高於只換教室）
+- 盡量排在 SCHEDULE_PREFERRED_PERIODS 的節次內
+- 同系所、同年級的課分散在不同天
+
+先依「限制多的先排」逐一放入成本最低的位置，再在時間限制內以模擬退火反覆把單一開課移到
+其他可行位置；排不進去的開課列在 unassigned
+"""
+import math
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .timeslots import DAYS_PER_WEEK, PERIODS_PER_DAY, class_time_mask
+
+MOVE_PENALTY = 3
+ROOM_CHANGE_PENALTY = 1
+EDGE_PERIOD_PENALTY = 1
+SAME_DAY_PENALTY = 1
+UNASSIGNED_PENALTY = 1000
+SAMPLE_SIZE = 30  # 每次移動隨機嘗試的位置數
+
+
+class ScheduleError(Exception):
+    """排課參數或方案不正確（由 view 轉成 400 回應）"""
+
+
+class Item:
+    """待排的開課"""
+    __slots__ = ('id', 'label', 'teachers', 'cohort', 'required', 'length', 'current')
+
+    def __init__(self, offering_id, label, teachers, cohort, required, length, current=None):
+        self.id = offering_id
+        self.label = label
+        self.teachers = teachers
+        self.cohort = cohort
+        self.required = required
+        self.length = length
+        self.current = current  # 目前的 (星期, 開始節次, 教室)，尚未排課為 None
+
+
+class Occupancy:
+    """各教師、教室、必修課群組（系所 + 年級）已佔用的時段，以及各群組每天的課數"""
+
+    def __init__(self):
+        self.teachers = defaultdict(int)
+        self.rooms = defaultdict(int)
+        self.cohorts = defaultdict(int)
+        self.cohort_days = defaultdict(lambda: defaultdict(int))
+
+    def conflict(self, teachers, cohort, required, mask, room):
+        """回傳衝突原因，沒有衝突時回傳 None"""
+        if room and self.rooms[room] & mask:
+            return 'room'
+        for teacher_id in teachers:
+            if self.teachers[teacher_id] & mask:
+                return 'teacher'
+        if required and self.cohorts[cohort] & mask:
+            return 'cohort'
+        return None
+
+    def add(self, teachers, cohort, required, mask, room, weekday, sign=1):
+        if sign > 0:
+            if room:
+                self.rooms[room] |= mask
+            for teacher_id in teachers:
+                self.teachers[teacher_id] |= mask
+            if required:
+                self.cohorts[cohort] |= mask
+        else:
+            if room:
+                self.rooms[room] &= ~mask
+            for teacher_id in teachers:
+                self.teachers[teacher_id] &= ~mask
+            if required:
+                self.cohorts[cohort] &= ~mask
+        self.cohort_days[cohort][weekday] += sign
+
+
+class ScheduleProblem:
+    """
+    items: 待排的開課
+    occupancy: 不重排的開課（固定）已佔用的時段
+    rooms: 可用的教室
+    fixed_ids: 不重排的開課 ID
+    """
+
+    def __init__(self, items, occupancy, rooms, fixed_ids=(), weekdays=None, last_period=None, preferred_periods=None):
+        self.items = items
+        self.occupancy = occupancy
+        self.rooms = list(rooms)
+        self.fixed_ids = list(fixed_ids)
+        self.weekdays = list(weekdays or settings.SCHEDULE_WEEKDAYS)
+        self.last_period = last_period or settings.SCHEDULE_LAST_PERIOD
+        self.preferred = set(preferred_periods or settings.SCHEDULE_PREFERRED_PERIODS)
+        self._placements = {}
+
+    def placements(self, item):
+        """所有 (星期, 開始節次, 教室) 組合（只與節數有關，依節數快取）"""
+        if item.length not in self._placements:
+            self._placements[item.length] = [
+                (weekday, start, room)
+                for weekday in self.weekdays
+                for start in range(1, self.last_period - item.length + 2)
+                for room in self.rooms
+            ]
+        return self._placements[item.length]
+
+    def mask(self, item, placement):
+        weekday, start, _ = placement
+        return class_time_mask(weekday, start, start + item.length - 1)
+
+    def conflict(self, item, placement):
+        return self.occupancy.conflict(item.teachers, item.cohort, item.required, self.mask(item, placement), placement[2])
+
+    def place(self, item, placement, sign=1):
+        self.occupancy.add(item.teachers, item.cohort, item.required, self.mask(item, placement), placement[2], placement[0], sign)
+
+    def cost(self, item, placement):
+        """把 item 放在 placement 的成本（item 本身不可在佔用表中）"""
+        weekday, start, room = placement
+        cost = 0
+        if item.current:
+            if (weekday, start) != item.current[:2]:
+                cost += MOVE_PENALTY
+            elif room != item.current[2]:
+                cost += ROOM_CHANGE_PENALTY
+        cost += EDGE_PERIOD_PENALTY * sum(
+            1 for period in range(start, start + item.length) if period not in self.preferred
+        )
+        cost += SAME_DAY_PENALTY * self.occupancy.cohort_days[item.cohort][weekday]
+        return cost
+
+
+def solve(problem, time_limit=5.0, seed=0):
+    """
+    回傳 {'assignments': {offering_id: (星期, 開始節次, 教室)}, 'unassigned': {offering_id: 原因},
+          'cost': 總成本, 'iterations': 移動次數}
+    """
+    rng = random.Random(seed)
+    deadline = time.monotonic() + time_limit
+    assignment = {}
+    unassigned = {}
+    total = 0
+
+    # 建構：限制多的先排（必修、教師多、節數長），各自放在成本最低的可行位置
+    order = sorted(problem.items, key=lambda item: (not item.required, -len(item.teachers), -item.length, item.id))
+    for item in order:
+        candidates = list(problem.placements(item))
+        if item.current in candidates:
+            candidates.remove(item.current)
+            candidates.insert(0, item.current)
+        best, best_cost, reason = None, None, 'no_slot'
+        for placement in candidates:
+            conflict = problem.conflict(item, placement)
+            if conflict:
+                reason = conflict
+                continue
+            cost = problem.cost(item, placement)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = placement, cost
+        if best is None:
+            unassigned[item.id] = reason
+            total += UNASSIGNED_PENALTY
+        else:
+            problem.place(item, best)
+            assignment[item.id] = best
+            total += best_cost
+
+    best_assignment, best_unassigned, best_total = dict(assignment), dict(unassigned), total
+    items = {item.id: item for item in problem.items}
+    item_ids = list(items)
+
+    # 改善：模擬退火，每次把一門開課移到隨機抽樣中成本最低的位置
+    iterations = 0
+    started = time.monotonic()
+    while problem.items and time.monotonic() < deadline:
+        iterations += 1
+        item = items[rng.choice(item_ids)]
+        current = assignment.get(item.id)
+        if current:
+            problem.place(item, current, sign=-1)
+            old_cost = problem.cost(item, current)
+        else:
+            old_cost = UNASSIGNED_PENALTY
+
+        choice, choice_cost = current, old_cost
+        placements = problem.placements(item)
+        for placement in rng.sample(placements, min(SAMPLE_SIZE, len(placements))):
+            if placement == current or problem.conflict(item, placement):
+                continue
+            cost = problem.cost(item, placement)
+            if cost < choice_cost or choice is current:
+                choice, choice_cost = placement, cost
+
+        delta = choice_cost - old_cost
+        progress = (time.monotonic() - started) / max(time_limit, 1e-6)
+        temperature = max(2.0 * (1 - progress), 0.01)
+        if choice is not current and (delta <= 0 or rng.random() < math.exp(-delta / temperature)):
+            if current is None:
+                del unassigned[item.id]
+            assignment[item.id] = choice
+            total += delta
+        else:
+            choice = current
+        if choice:
+            problem.place(item, choice)
+
+        if total < best_total:
+            best_assignment, best_unassigned, best_total = dict(assignment), dict(unassigned), total
+
+    return {
+        'assignments': best_assignment,
+        'unassigned': best_unassigned,
+        'cost': best_total,
+        'iterations': iterations,
+    }
+
+
+# ===== 讀取資料、套用方案 =====
+
+def _term_offerings(academic_year, semester):
+    from .models import CourseOffering
+    return CourseOffering.objects.filter(
+        academic_year=academic_year, semester=semester
+    ).select_related('course').prefetch_related('class_times', 'offering_teachers').order_by('id')
+
+
+def all_rooms():
+    from .models import Classroom
+    return list(Classroom.objects.filter(is_active=True).values_list('name', flat=True))
+
+
+def load_problem(academic_year, semester, offering_ids=None, rooms=None):
+    """
+    建立排課問題：offering_ids 為要重排的開課（預設為整個學期），其餘開課維持原時段
+    rooms 預設為所有可排課的教室
+    """
+    rooms = rooms or all_rooms()
+    if not rooms:
+        raise ScheduleError('沒有可用的教室')
+
+    occupancy = Occupancy()
+    items = []
+    fixed = []
+    targets = set(offering_ids) if offering_ids else None
+    for offering in _term_offerings(academic_year, semester):
+        teachers = [ot.teacher_id for ot in offering.offering_teachers.all()]
+        cohort = (offering.department_id, offering.grade_level)
+        required = offering.course.course_type == 'required'
+        class_times = list(offering.class_times.all())
+
+        if (targets is None or offering.id in targets) and len(class_times) <= 1:
+            current, length = None, offering.course.credits
+            if class_times:
+                ct = class_times[0]
+                current = (int(ct.weekday), ct.start_period, ct.classroom)
+                length = ct.end_period - ct.start_period + 1
+            label = f'{offering.course.course_code} {offering.course.course_name}'
+            items.append(Item(offering.id, label, teachers, cohort, required, max(int(length), 1), current))
+        else:
+            fixed.append(offering.id)
+            for ct in class_times:
+                mask = class_time_mask(ct.weekday, ct.start_period, ct.end_period)
+                occupancy.add(teachers, cohort, required, mask, ct.classroom, int(ct.weekday))
+
+    if targets:
+        unknown = targets - {item.id for item in items} - set(fixed)
+        if unknown:
+            raise ScheduleError(f'這學期沒有這些開課: {", ".join(map(str, sorted(unknown)))}')
+
+    return ScheduleProblem(items, occupancy, rooms, fixed)
+
+
+def plan_to_json(problem, result):
+    """把 solve 的結果轉成 API 回傳的方案"""
+    items = {item.id: item for item in problem.items}
+    assignments = []
+    for offering_id, (weekday, start, room) in sorted(result['assignments'].items()):
+        item = items[offering_id]
+        assignments.append({
+            'offering_id': offering_id,
+            'course': item.label,
+            'weekday': str(weekday),
+            'start_period': start,
+            'end_period': start + item.length - 1,
+            'classroom': room,
+            'changed': item.current != (weekday, start, room),
+        })
+    return {
+        'assignments': assignments,
+        'unassigned': [
+            {'offering_id': offering_id, 'course': items[offering_id].label, 'reason': reason}
+            for offering_id, reason in sorted(result['unassigned'].items())
+        ],
+        'fixed_offering_ids': problem.fixed_ids,
+        'cost': result['cost'],
+        'iterations': result['iterations'],
+    }
+
+
+def apply_plan(academic_year, semester, assignments):
+    """
+    重新檢查硬性限制後一次寫入上課時段：回傳 (更新的開課數, 衝突列表)
+    有任何衝突時不寫入；方案只需列出要變動的開課，其餘開課維持原時段
+    """
+    from .catalog_cache import bump_catalog_version
+    from .catalog_sync import record_offering_changes
+    from .models import ClassTime, Classroom, OfferingTeacher
+    from . import room_occupancy, search_documents, teacher_occupancy
+
+    try:
+        plan = {
+            int(entry['offering_id']): (
+                int(entry['weekday']), int(entry['start_period']), int(entry['end_period']), str(entry['classroom']).strip()
+            )
+            for entry in assignments
+        }
+    except (KeyError, TypeError, ValueError):
+        raise ScheduleError('方案格式錯誤：每筆需有 offering_id、weekday、start_period、end_period、classroom')
+
+    with transaction.atomic():
+        problem = load_problem(academic_year, semester, list(plan), rooms=[room for *_, room in plan.values()])
+        items = {item.id: item for item in problem.items}
+        conflicts = []
+        for offering_id, (weekday, start, end, room) in plan.items():
+            item = items.get(offering_id)
+            if item is None:
+                conflicts.append({'offering_id': offering_id, 'reason': 'multiple_class_times'})
+                continue
+            if not (1 <= weekday <= DAYS_PER_WEEK and 1 <= start <= end <= PERIODS_PER_DAY) or not room:
+                conflicts.append({'offering_id': offering_id, 'reason': 'invalid'})
+                continue
+            item.length = end - start + 1
+            reason = problem.conflict(item, (weekday, start, room))
+            if reason:
+                conflicts.append({'offering_id': offering_id, 'reason': reason})
+            else:
+                problem.place(item, (weekday, start, room))
+        if conflicts:
+            return 0, conflicts
+
+        # 一次更新：已有上課時段的直接改，沒有的新增（bulk 操作不觸發訊號，下面統一處理）
+        existing = {ct.offering_id: ct for ct in ClassTime.objects.filter(offering_id__in=plan)}
+        rooms = {name: Classroom.for_name(name) for name in {room for *_, room in plan.values()}}
+        affected_rooms = {ct.room_id for ct in existing.values()} | {room.id for room in rooms.values()}
+        to_update, to_create = [], []
+        for offering_id, (weekday, start, end, room) in plan.items():
+            ct = existing.get(offering_id) or ClassTime(offering_id=offering_id)
+            ct.weekday, ct.start_period, ct.end_period, ct.classroom = str(weekday), start, end, room
+            ct.room = rooms[room]
+            (to_update if ct.pk else to_create).append(ct)
+        ClassTime.objects.bulk_update(to_update, ['weekday', 'start_period', 'end_period', 'classroom', 'room'], batch_size=500)
+        ClassTime.objects.bulk_create(to_create, batch_size=500)
+
+        record_offering_changes(list(plan), 'upsert')
+        search_documents.sync_documents(list(plan))
+        room_occupancy.sync_rooms(affected_rooms)
+        teacher_occupancy.sync_teachers(
+            OfferingTeacher.objects.filter(offering_id__in=plan).values_list('teacher_id', flat=True)
+        )
+
+    bump_catalog_version()
+    return len(plan), []
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+開課搜尋文件（OfferingSearchDocument）的維護
+開課、課程、授課教師、教師姓名、上課時段異動時由訊號呼叫 sync_documents 重建受影響的文件；
+只有名額變動（選課、退選）時走 update_seat_counts，只更新人數欄位
+首次部署或資料大量匯入後執行 python manage.py rebuild_search_documents
+"""
+from .models import CourseOffering, OfferingSearchDocument
+from .timeslots import offering_mask, split_mask
+
+DOCUMENT_FIELDS = [
+    'academic_year', 'semester', 'department_id', 'course_type', 'grade_level', 'credits',
+    'slots_mon_thu', 'slots_fri_sun', 'teacher_names',
+    'max_students', 'current_students', 'status', 'search_text', 'updated_at',
+]
+
+# CourseOffering.save(update_fields=...) 只包含這些欄位時視為名額變動
+SEAT_UPDATE_FIELDS = frozenset(['current_students', 'status', 'updated_at'])
+
+
+def _teacher_name(ot):
+    return ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
+
+
+def build_document(offering):
+    """由開課資料組出搜尋文件（offering 需已 select_related course、prefetch 教師與時段）"""
+    course = offering.course
+    teacher_names = [_teacher_name(ot) for ot in offering.offering_teachers.all()]
+    slots_mon_thu, slots_fri_sun = split_mask(offering_mask(offering.class_times.all()))
+
+    search_text = ' '.join(filter(None, [
+        course.course_name, course.course_name_en, course.course_code, course.old_code,
+        ' '.join(teacher_names), course.description,
+    ])).lower()
+
+    return OfferingSearchDocument(
+        offering_id=offering.id,
+        academic_year=offering.academic_year,
+        semester=offering.semester,
+        department_id=offering.department_id,
+        course_type=course.course_type,
+        grade_level=offering.grade_level,
+        credits=course.credits,
+        slots_mon_thu=slots_mon_thu,
+        slots_fri_sun=slots_fri_sun,
+        teacher_names='、'.join(teacher_names)[:500],
+        max_students=offering.max_students,
+        current_students=offering.current_students,
+        status=offering.status,
+        search_text=search_text,
+    )
+
+
+def _offerings_for_documents():
+    return CourseOffering.objects.select_related('course').prefetch_related(
+        'offering_teachers__teacher__profile', 'class_times'
+    )
+
+
+def sync_documents(offering_ids):
+    """重建指定開課的搜尋文件（一次查詢 + 一次 upsert）"""
+    offering_ids = {offering_id for offering_id in offering_ids if offering_id}
+    if not offering_ids:
+        return
+
+    documents = [build_document(offering) for offering in _offerings_for_documents().filter(id__in=offering_ids)]
+    if documents:
+        OfferingSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['offering'],
+            update_fields=DOCUMENT_FIELDS,
+        )
+
+
+def update_seat_counts(offering):
+    """只有人數或開課狀態變動時，直接更新對應欄位；文件還不存在時整筆建立"""
+    updated = OfferingSearchDocument.objects.filter(offering_id=offering.id).update(
+        current_students=offering.current_students,
+        max_students=offering.max_students,
+        status=offering.status,
+    )
+    if not updated:
+        sync_documents([offering.id])
+
+
+def rebuild(batch_size=500):
+    """重建所有搜尋文件並刪除多餘的文件，回傳文件數"""
+    all_ids = list(CourseOffering.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(all_ids), batch_size):
+        sync_documents(all_ids[start:start + batch_size])
+    OfferingSearchDocument.objects.exclude(offering_id__in=CourseOffering.objects.values('id')).delete()
+    return len(all_ids)
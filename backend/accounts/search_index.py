@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+課程全文搜尋索引
+取代關鍵字搜尋原本的三欄 icontains（每次都全表掃描 + JOIN + distinct）
+
+- SQLite：FTS5 虛擬表，以 bm25 排序
+- PostgreSQL：tsvector 欄位 + GIN 索引，以 ts_rank 排序
+- 其他資料庫（例如 MySQL）或 SEARCH_INDEX_ENABLED=False：退回 icontains（比對開課搜尋文件的 search_text）
+
+中文沒有空白分詞，因此在 Python 端先切成「相鄰兩字」的 bigram 再寫入索引，
+查詢時同樣切 bigram 並要求依序相鄰（片語查詢），效果等同子字串比對；
+單一中文字無法組成 bigram，因此索引另外在欄位最後附上每個中文字（不影響 bigram 的相鄰位置），
+只輸入一個字時比對這些單字，出現在 bigram 後半的字（例如「數學」的「學」）也找得到；
+英數字以單字為單位並做前綴比對，輸入到一半的課程代碼也能找到
+
+索引在開課、課程、授課教師、教師姓名異動時由訊號逐筆更新（見 signals.py），
+首次部署、資料大量匯入或切詞方式變更後執行 python manage.py rebuild_search_index
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import CourseOffering
+
+SQLITE_TABLE = 'accounts_offering_fts'
+POSTGRES_TABLE = 'accounts_offering_search'
+
+# 索引欄位與排序權重（課程名稱 > 課程代碼 > 教師 > 課程描述）
+COLUMNS = ('name', 'code', 'teachers', 'description')
+SQLITE_WEIGHTS = (10.0, 8.0, 5.0, 1.0)
+POSTGRES_WEIGHTS = ('A', 'B', 'C', 'D')
+
+# 中日韓文字（含相容字、假名、韓文）逐字切 bigram，其餘只取英數字
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+
+def _runs(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _TOKEN_RE.findall(text)
+
+
+def _bigrams(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text):
+    """切詞：中文切 bigram，英數字以單字為單位（回傳以空白分隔的字串）"""
+    tokens = []
+    for run in _runs(text):
+        tokens.extend(_bigrams(run) if _CJK_RE.match(run) else [run])
+    return ' '.join(tokens)
+
+
+def index_tokens(text):
+    """寫入索引的詞：tokenize 的結果之後再附上每個中文字（單字查詢用）"""
+    chars = [char for run in _runs(text) if _CJK_RE.match(run) and len(run) > 1 for char in run]
+    return ' '.join([tokenize(text)] + chars).strip()
+
+
+def backend():
+    """目前使用的索引類型：'sqlite'、'postgresql'，不支援時為 None（不查資料庫）"""
+    if not getattr(settings, 'SEARCH_INDEX_ENABLED', True):
+        return None
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return connection.vendor
+    return None
+
+
+# ===== 查詢 =====
+
+def _sqlite_query(keyword):
+    """FTS5 查詢：中文連續字串為片語（bigram 依序相鄰），單一中文字比對索引中的單字，英數字做前綴比對"""
+    parts = []
+    for run in _runs(keyword):
+        if not _CJK_RE.match(run):
+            parts.append(f'"{run}"*')
+        elif len(run) > 1:
+            parts.append('"' + ' '.join(_bigrams(run)) + '"')
+        else:
+            parts.append(f'"{run}"')
+    return ' '.join(parts)
+
+
+def _postgres_query(keyword):
+    """tsquery：中文 bigram 以 <-> 要求相鄰，單一中文字比對索引中的單字，英數字做前綴比對"""
+    parts = []
+    for run in _runs(keyword):
+        if not _CJK_RE.match(run):
+            parts.append(f"'{run}':*")
+        elif len(run) > 1:
+            parts.append(' <-> '.join(f"'{token}'" for token in _bigrams(run)))
+        else:
+            parts.append(f"'{run}'")
+    return ' & '.join(f'({part})' for part in parts)
+
+
+def apply_keyword_search(queryset, keyword):
+    """
+    以全文索引篩選 CourseOffering queryset，並依相關度排序（search_rank 越小越相關）
+    之後若再呼叫 order_by（例如使用者指定排序）會覆蓋相關度排序
+    """
+    kind = backend()
+    if kind is None:
+        # 搜尋文件已把名稱、代碼、教師、描述合併成一欄，單表比對即可，不必 JOIN
+        return queryset.filter(search_document__search_text__icontains=keyword)
+
+    offering_table = CourseOffering._meta.db_table
+
+    if kind == 'sqlite':
+        query = _sqlite_query(keyword)
+        if not query:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        matched = RawSQL(f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s', [query])
+        rank = RawSQL(
+            f'(SELECT bm25({SQLITE_TABLE}, {weights}) FROM {SQLITE_TABLE} '
+            f'WHERE {SQLITE_TABLE} MATCH %s AND rowid = "{offering_table}"."id")',
+            [query]
+        )
+    else:
+        query = _postgres_query(keyword)
+        if not query:
+            return queryset.none()
+        matched = RawSQL(
+            f"SELECT offering_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+            [query]
+        )
+        rank = RawSQL(
+            f"(SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {POSTGRES_TABLE} "
+            f'WHERE offering_id = "{offering_table}"."id")',
+            [query]
+        )
+
+    return queryset.filter(id__in=matched).annotate(search_rank=rank).order_by('search_rank', 'pk')
+
+
+# ===== 索引維護 =====
+
+def _document_rows(offering_ids):
+    """讀取開課資料並切詞，回傳 [(offering_id, name, code, teachers, description), ...]"""
+    offerings = CourseOffering.objects.filter(id__in=offering_ids).select_related(
+        'course'
+    ).prefetch_related('offering_teachers__teacher__profile').only(
+        'id', 'course__course_name', 'course__course_name_en', 'course__course_code',
+        'course__old_code', 'course__description'
+    )
+
+    rows = []
+    for offering in offerings:
+        course = offering.course
+        teacher_names = [
+            ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
+            for ot in offering.offering_teachers.all()
+        ]
+        rows.append((
+            offering.id,
+            index_tokens(f'{course.course_name} {course.course_name_en or ""}'),
+            index_tokens(f'{course.course_code} {course.old_code or ""}'),
+            index_tokens(' '.join(teacher_names)),
+            index_tokens(course.description),
+        ))
+    return rows
+
+
+def _delete_sql(kind, count):
+    placeholders = ', '.join(['%s'] * count)
+    if kind == 'sqlite':
+        return f'DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})'
+    return f'DELETE FROM {POSTGRES_TABLE} WHERE offering_id IN ({placeholders})'
+
+
+def _insert_sql(kind):
+    if kind == 'sqlite':
+        return f'INSERT INTO {SQLITE_TABLE} (rowid, {", ".join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s)'
+    document = ' || '.join(
+        f"setweight(to_tsvector('simple', %s), '{weight}')" for weight in POSTGRES_WEIGHTS
+    )
+    return f'INSERT INTO {POSTGRES_TABLE} (offering_id, document) VALUES (%s, {document})'
+
+
+def index_offerings(offering_ids):
+    """重新建立指定開課的索引（不存在的開課會從索引移除）"""
+    kind = backend()
+    offering_ids = list({offering_id for offering_id in offering_ids if offering_id})
+    if kind is None or not offering_ids:
+        return
+
+    rows = _document_rows(offering_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(_delete_sql(kind, len(offering_ids)), offering_ids)
+        if rows:
+            cursor.executemany(_insert_sql(kind), rows)
+
+
+def remove_offerings(offering_ids):
+    kind = backend()
+    offering_ids = list({offering_id for offering_id in offering_ids if offering_id})
+    if kind is None or not offering_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(_delete_sql(kind, len(offering_ids)), offering_ids)
+
+
+def rebuild(batch_size=500):
+    """清空並重建整個索引，回傳寫入的開課數"""
+    kind = backend()
+    if kind is None:
+        return 0
+
+    table = SQLITE_TABLE if kind == 'sqlite' else POSTGRES_TABLE
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+
+    all_ids = list(CourseOffering.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(all_ids), batch_size):
+        rows = _document_rows(all_ids[start:start + batch_size])
+        with connection.cursor() as cursor:
+            cursor.executemany(_insert_sql(kind), rows)
+    return len(all_ids)
+
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+開課人數校正
+CourseOffering.current_students 是選課時手動加減的計數，同時選課的競爭、後台直接修改、刪除選課紀錄
+都可能讓它和實際的選課人數不一致，status（open / full）也跟著錯
+這裡以一次 GROUP BY 查詢重算整個學期的選課人數，有差異的一次 bulk_update 寫回並回報差異；
+校正後空出名額的開課先依候補順序遞補（waitlist.py），再一起寫回
+
+由 reconcile_seat_counts 指令或背景工作（reconcile_seats）定期執行
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import search_documents, waitlist
+from .catalog_cache import bump_seat_version
+from .catalog_sync import record_offering_changes
+from .models import CourseOffering, Enrollment
+from .pubsub import publish_seat_change
+
+
+def expected_status(offering, count):
+    """依人數判斷開課狀態（停開的維持停開）"""
+    if offering.status == 'closed':
+        return 'closed'
+    return 'full' if count >= offering.max_students else 'open'
+
+
+def reconcile(academic_year, semester, dry_run=False):
+    """
+    校正某學期所有開課的人數與狀態，回傳差異報告
+    dry_run 時只回報不寫入
+    """
+    with transaction.atomic():
+        # 鎖住這學期的開課，重算期間的選課、退選等校正完成後再進行
+        offerings = list(CourseOffering.objects.select_for_update(of=('self',)).filter(
+            academic_year=academic_year, semester=semester
+        ).select_related('course').only(
+            'id', 'current_students', 'max_students', 'status', 'course__course_name'
+        ).order_by('id'))
+        counts = dict(Enrollment.objects.filter(
+            offering__academic_year=academic_year, offering__semester=semester, status='enrolled'
+        ).values('offering_id').annotate(count=Count('id')).values_list('offering_id', 'count'))
+
+        now = timezone.now()
+        changes, changed = [], []
+        for offering in offerings:
+            count = counts.get(offering.id, 0)
+            status = expected_status(offering, count)
+            if count == offering.current_students and status == offering.status:
+                continue
+            changes.append({
+                'offering_id': offering.id,
+                'course_name': offering.course.course_name,
+                'current_students': offering.current_students,
+                'actual_students': count,
+                'drift': offering.current_students - count,
+                'status': offering.status,
+                'actual_status': status,
+                'promoted': 0,
+            })
+            freed = count < offering.current_students and status != 'closed'
+            offering.current_students = count
+            offering.status = status
+            offering.updated_at = now
+            changed.append(offering)
+            if freed and not dry_run:
+                changes[-1]['promoted'] = len(waitlist.promote(offering))
+
+        if changed and not dry_run:
+            CourseOffering.objects.bulk_update(changed, ['current_students', 'status', 'updated_at'], batch_size=500)
+            # bulk_update 不觸發訊號：統一更新目錄異動紀錄與搜尋文件，交易提交後推播名額
+            changed_ids = [offering.id for offering in changed]
+            record_offering_changes(changed_ids, 'upsert')
+            search_documents.sync_documents(changed_ids)
+            for offering in changed:
+                publish_seat_change(offering)
+
+    if changed and not dry_run:
+        bump_seat_version()
+
+    return {
+        'academic_year': academic_year,
+        'semester': semester,
+        'offerings': len(offerings),
+        'drifted': sum(1 for change in changes if change['drift']),
+        'status_changed': sum(1 for change in changes if change['status'] != change['actual_status']),
+        'total_drift': sum(abs(change['drift']) for change in changes),
+        'promoted': sum(change['promoted'] for change in changes),
+        'dry_run': dry_run,
+        'changes': changes,
+    }
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+模型訊號
+課程目錄相關資料異動時：
+1. 交易提交後遞增目錄版本號（只改變名額時遞增名額版本號），讓目錄快取失效
+2. 寫入開課異動紀錄（CatalogChange），供增量同步使用
+3. 更新課程全文搜尋索引與開課搜尋文件，交易提交後遞增文字版本號（BM25、自動完成索引依此重建）
+4. 更新教室使用時段與教師授課時段
+5. 選課紀錄異動時寫入選課事件（EnrollmentEvent）
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog_cache import bump_catalog_version, bump_favorites_version, bump_seat_version, bump_text_version
+from .catalog_sync import record_offering_changes
+from . import enrollment_events, room_occupancy, search_index, search_documents, teacher_occupancy
+from .models import Course, CourseOffering, OfferingTeacher, ClassTime, Department, Enrollment, FavoriteCourse, Profile
+
+CATALOG_MODELS = (Course, CourseOffering, OfferingTeacher, ClassTime, Department)
+
+
+def _catalog_changed(sender, update_fields=None, **kwargs):
+    # 提交前遞增的話，其他請求可能在提交前以新版本號快取到舊資料
+    if sender is CourseOffering and _seat_only_update(update_fields):
+        transaction.on_commit(bump_seat_version)
+    else:
+        transaction.on_commit(bump_catalog_version)
+
+
+for _model in CATALOG_MODELS:
+    post_save.connect(_catalog_changed, sender=_model, dispatch_uid=f'catalog_version_save_{_model.__name__}')
+    post_delete.connect(_catalog_changed, sender=_model, dispatch_uid=f'catalog_version_delete_{_model.__name__}')
+
+
+# 使用者版本號也涵蓋選課紀錄：搜尋的 free_slots_only 依學生已選的課程篩選
+@receiver([post_save, post_delete], sender=Enrollment, dispatch_uid='favorites_version_enrollment')
+@receiver([post_save, post_delete], sender=FavoriteCourse, dispatch_uid='favorites_version')
+def _favorites_changed(sender, instance, **kwargs):
+    bump_favorites_version(instance.student_id)
+
+
+# ===== 開課異動紀錄 =====
+
+@receiver(post_save, sender=CourseOffering, dispatch_uid='catalog_change_offering_save')
+def _offering_saved(sender, instance, **kwargs):
+    record_offering_changes([instance.id], 'upsert')
+
+
+@receiver(post_delete, sender=CourseOffering, dispatch_uid='catalog_change_offering_delete')
+def _offering_deleted(sender, instance, **kwargs):
+    record_offering_changes([instance.id], 'delete')
+
+
+@receiver([post_save, post_delete], sender=ClassTime, dispatch_uid='catalog_change_class_time')
+@receiver([post_save, post_delete], sender=OfferingTeacher, dispatch_uid='catalog_change_offering_teacher')
+def _offering_child_changed(sender, instance, **kwargs):
+    record_offering_changes([instance.offering_id], 'upsert')
+
+
+@receiver(post_save, sender=Course, dispatch_uid='catalog_change_course')
+def _course_saved(sender, instance, created, **kwargs):
+    if not created:
+        record_offering_changes(instance.offerings.values_list('id', flat=True), 'upsert')
+
+
+@receiver(post_save, sender=Department, dispatch_uid='catalog_change_department')
+def _department_saved(sender, instance, created, **kwargs):
+    if not created:
+        record_offering_changes(instance.offerings.values_list('id', flat=True), 'upsert')
+
+
+# ===== 全文搜尋索引 =====
+
+def _seat_only_update(update_fields):
+    """選課、退選只更新人數與狀態，不影響索引文字"""
+    return bool(update_fields) and set(update_fields) <= search_documents.SEAT_UPDATE_FIELDS
+
+
+def _index_text(offering_ids):
+    search_index.index_offerings(offering_ids)
+    transaction.on_commit(bump_text_version)
+
+
+@receiver(post_save, sender=CourseOffering, dispatch_uid='search_index_offering_save')
+def _index_offering(sender, instance, update_fields=None, **kwargs):
+    if not _seat_only_update(update_fields):
+        _index_text([instance.id])
+
+
+@receiver(post_delete, sender=CourseOffering, dispatch_uid='search_index_offering_delete')
+def _unindex_offering(sender, instance, **kwargs):
+    search_index.remove_offerings([instance.id])
+    transaction.on_commit(bump_text_version)
+
+
+@receiver([post_save, post_delete], sender=OfferingTeacher, dispatch_uid='search_index_offering_teacher')
+def _index_offering_teachers(sender, instance, **kwargs):
+    _index_text([instance.offering_id])
+
+
+@receiver(post_save, sender=Course, dispatch_uid='search_index_course')
+def _index_course(sender, instance, created, **kwargs):
+    if not created:
+        _index_text(instance.offerings.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Profile, dispatch_uid='search_index_teacher_name')
+def _index_teacher_name(sender, instance, created, **kwargs):
+    # 教師姓名變更時，更新他授課的所有開課
+    if not created:
+        _index_text(
+            OfferingTeacher.objects.filter(teacher_id=instance.user_id).values_list('offering_id', flat=True)
+        )
+
+
+# ===== 開課搜尋文件 =====
+
+def _deleted_directly(sender, origin):
+    """刪除是否由這個模型本身發起（而不是刪除開課時連帶刪除）"""
+    return isinstance(origin, sender) or (isinstance(origin, QuerySet) and origin.model is sender)
+
+
+@receiver(post_save, sender=CourseOffering, dispatch_uid='search_document_offering')
+def _document_offering_saved(sender, instance, update_fields=None, **kwargs):
+    if _seat_only_update(update_fields):
+        search_documents.update_seat_counts(instance)
+    else:
+        search_documents.sync_documents([instance.id])
+
+
+@receiver(post_save, sender=ClassTime, dispatch_uid='search_document_class_time_save')
+@receiver(post_save, sender=OfferingTeacher, dispatch_uid='search_document_offering_teacher_save')
+def _document_child_saved(sender, instance, **kwargs):
+    search_documents.sync_documents([instance.offering_id])
+
+
+@receiver(post_delete, sender=ClassTime, dispatch_uid='search_document_class_time_delete')
+@receiver(post_delete, sender=OfferingTeacher, dispatch_uid='search_document_offering_teacher_delete')
+def _document_child_deleted(sender, instance, origin=None, **kwargs):
+    # 開課被刪除時文件會跟著刪除，不要在過程中重新建立
+    if _deleted_directly(sender, origin):
+        search_documents.sync_documents([instance.offering_id])
+
+
+@receiver(post_save, sender=Course, dispatch_uid='search_document_course')
+def _document_course_saved(sender, instance, created, **kwargs):
+    if not created:
+        search_documents.sync_documents(instance.offerings.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Profile, dispatch_uid='search_document_teacher_name')
+def _document_teacher_name(sender, instance, created, **kwargs):
+    if not created:
+        search_documents.sync_documents(
+            OfferingTeacher.objects.filter(teacher_id=instance.user_id).values_list('offering_id', flat=True)
+        )
+
+
+# ===== 教室使用時段 =====
+
+@receiver(pre_save, sender=ClassTime, dispatch_uid='room_occupancy_class_time_pre_save')
+def _remember_previous_room(sender, instance, **kwargs):
+    # 換教室時原本的教室也要重算
+    instance._previous_room_id = None
+    if instance.pk:
+        instance._previous_room_id = ClassTime.objects.filter(pk=instance.pk).values_list('room_id', flat=True).first()
+
+
+@receiver(post_save, sender=ClassTime, dispatch_uid='room_occupancy_class_time_save')
+def _room_class_time_saved(sender, instance, **kwargs):
+    room_occupancy.sync_rooms([instance.room_id, getattr(instance, '_previous_room_id', None)])
+
+
+@receiver(post_delete, sender=ClassTime, dispatch_uid='room_occupancy_class_time_delete')
+def _room_class_time_deleted(sender, instance, **kwargs):
+    room_occupancy.sync_rooms([instance.room_id])
+
+
+@receiver(post_save, sender=CourseOffering, dispatch_uid='room_occupancy_offering')
+def _room_offering_saved(sender, instance, update_fields=None, **kwargs):
+    # 開課改學期時，它的教室要重算
+    if not _seat_only_update(update_fields):
+        room_occupancy.sync_rooms(instance.class_times.values_list('room_id', flat=True))
+
+
+# ===== 教師授課時段 =====
+
+def _sync_offering_teachers(offering_id):
+    teacher_occupancy.sync_teachers(
+        OfferingTeacher.objects.filter(offering_id=offering_id).values_list('teacher_id', flat=True)
+    )
+
+
+@receiver(pre_save, sender=OfferingTeacher, dispatch_uid='teacher_occupancy_offering_teacher_pre_save')
+def _remember_previous_teacher(sender, instance, **kwargs):
+    # 換教師時原本的教師也要重算
+    instance._previous_teacher_id = None
+    if instance.pk:
+        instance._previous_teacher_id = OfferingTeacher.objects.filter(pk=instance.pk).values_list('teacher_id', flat=True).first()
+
+
+@receiver(post_save, sender=OfferingTeacher, dispatch_uid='teacher_occupancy_offering_teacher_save')
+def _teacher_assigned(sender, instance, **kwargs):
+    teacher_occupancy.sync_teachers([instance.teacher_id, getattr(instance, '_previous_teacher_id', None)])
+
+
+@receiver(post_delete, sender=OfferingTeacher, dispatch_uid='teacher_occupancy_offering_teacher_delete')
+def _teacher_unassigned(sender, instance, **kwargs):
+    teacher_occupancy.sync_teachers([instance.teacher_id])
+
+
+@receiver([post_save, post_delete], sender=ClassTime, dispatch_uid='teacher_occupancy_class_time')
+def _teacher_class_time_changed(sender, instance, origin=None, **kwargs):
+    # 刪除開課時授課教師的資料由 OfferingTeacher 的刪除訊號處理
+    if origin is None or _deleted_directly(sender, origin):
+        _sync_offering_teachers(instance.offering_id)
+
+
+@receiver(post_save, sender=CourseOffering, dispatch_uid='teacher_occupancy_offering')
+def _teacher_offering_saved(sender, instance, update_fields=None, **kwargs):
+    if not _seat_only_update(update_fields):
+        _sync_offering_teachers(instance.id)
+
+
+# ===== 選課事件 =====
+
+@receiver(pre_save, sender=Enrollment, dispatch_uid='enrollment_event_pre_save')
+def _remember_previous_enrollment(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk and not raw:
+        instance._previous_state = Enrollment.objects.filter(pk=instance.pk).values_list('status', 'grade', 'score').first()
+
+
+@receiver(post_save, sender=Enrollment, dispatch_uid='enrollment_event_save')
+def _enrollment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    kind = enrollment_events.event_kind(getattr(instance, '_previous_state', None), instance)
+    if kind:
+        enrollment_events.record_events(kind, [(instance.student_id, instance.offering_id)])
+
+
+@receiver(post_delete, sender=Enrollment, dispatch_uid='enrollment_event_delete')
+def _enrollment_deleted(sender, instance, **kwargs):
+    if instance.status != 'dropped':
+        enrollment_events.record_events('deleted', [(instance.student_id, instance.offering_id)])
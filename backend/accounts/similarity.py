@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+相似課程批次計算（compute_similar_courses 使用）
+以課程名稱（中英）與描述（中英）建立 TF-IDF 稀疏矩陣，計算餘弦相似度，
+每門課程保留最相似的前 N 名寫入 CourseSimilarity；API 只查表，不在請求中計算
+
+只有批次工作會 import 這個模組，web worker 不需要載入 numpy / scipy
+"""
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .catalog_cache import bump_catalog_version
+from .models import Course, CourseSimilarity
+from .search_index import tokenize
+
+NAME_BOOST = 2  # 課程名稱的詞比描述中的詞重要
+BLOCK_SIZE = 512  # 每次計算多少門課程的相似度（控制記憶體用量）
+
+
+def _course_tokens(course):
+    names = tokenize(f'{course.course_name} {course.course_name_en or ""}').split()
+    descriptions = tokenize(f'{course.description} {course.description_en}').split()
+    return names * NAME_BOOST + descriptions
+
+
+def build_tfidf_matrix(documents):
+    """
+    documents: 每份文件的詞列表
+    回傳列已做 L2 正規化的 CSR 矩陣（列 = 文件，欄 = 詞彙），兩列內積即為餘弦相似度
+    """
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, tokens in enumerate(documents):
+        counts = {}
+        for token in tokens:
+            col = vocabulary.setdefault(token, len(vocabulary))
+            counts[col] = counts.get(col, 0) + 1
+        rows.extend([row] * len(counts))
+        cols.extend(counts.keys())
+        values.extend(counts.values())
+
+    shape = (len(documents), len(vocabulary))
+    tf = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float64), (np.asarray(rows), np.asarray(cols))),
+        shape=shape,
+    )
+    # 次線性詞頻：1 + log(tf)
+    tf.data = 1.0 + np.log(tf.data)
+
+    # 平滑 idf：log((1 + N) / (1 + df)) + 1
+    df = np.bincount(tf.indices, minlength=shape[1])
+    idf = np.log((1.0 + shape[0]) / (1.0 + df)) + 1.0
+    matrix = tf @ sparse.diags(idf)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+def top_neighbours(matrix, top_n, min_score=0.0):
+    """逐區塊計算 X·Xᵀ，回傳每一列 [(鄰居列, 分數), ...]（不含自己，由高到低）"""
+    count = matrix.shape[0]
+    neighbours = [[] for _ in range(count)]
+    if count < 2:
+        return neighbours
+
+    k = min(top_n, count - 1)
+    transposed = matrix.T.tocsc()
+    for start in range(0, count, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, count)
+        scores = (matrix[start:stop] @ transposed).toarray()
+        scores[np.arange(stop - start), np.arange(start, stop)] = -1.0  # 排除自己
+
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for offset, cols in enumerate(candidates):
+            row_scores = scores[offset, cols]
+            order = np.argsort(-row_scores)
+            neighbours[start + offset] = [
+                (int(cols[i]), float(row_scores[i]))
+                for i in order if row_scores[i] > min_score
+            ]
+    return neighbours
+
+
+def compute_similar_courses(top_n=20, min_score=0.05):
+    """重新計算所有有開課的課程的相似課程，回傳 (課程數, 寫入筆數)"""
+    courses = list(
+        Course.objects.filter(offerings__isnull=False).distinct().order_by('id').only(
+            'id', 'course_name', 'course_name_en', 'description', 'description_en'
+        )
+    )
+    matrix = build_tfidf_matrix([_course_tokens(course) for course in courses])
+    neighbours = top_neighbours(matrix, top_n, min_score)
+
+    rows = [
+        CourseSimilarity(course_id=courses[i].id, similar_course_id=courses[j].id, score=score)
+        for i, pairs in enumerate(neighbours)
+        for j, score in pairs
+    ]
+    with transaction.atomic():
+        CourseSimilarity.objects.all().delete()
+        CourseSimilarity.objects.bulk_create(rows, batch_size=1000)
+
+    # 相似課程 API 的回應走目錄快取，更新後讓舊快取失效
+    bump_catalog_version()
+    return len(courses), len(rows)
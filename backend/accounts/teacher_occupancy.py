@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+教師授課時段（TeacherOccupancy）的維護與查詢
+每位教師每學期一筆位元遮罩（主開課與協同教師都算）：
+- 建立、重建：OfferingTeacher JOIN ClassTime 一次查詢，在 Python 中合併成遮罩
+- 檢查衝堂：一次讀出所有相關教師這學期的遮罩逐一位元 AND；只有重疊時才查出是哪些課
+
+授課教師、上課時段或開課異動時由訊號呼叫 sync_teachers 重算受影響教師（所有學期）的資料
+首次部署或資料大量匯入後執行 python manage.py rebuild_teacher_occupancy
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import ClassTime, OfferingTeacher, TeacherOccupancy
+from .timeslots import class_time_mask, join_mask, split_mask
+
+
+def _teacher_name(teacher):
+    return teacher.profile.real_name if hasattr(teacher, 'profile') else teacher.username
+
+
+def _build(teacher_filter):
+    masks = defaultdict(int)
+    rows = OfferingTeacher.objects.filter(
+        **teacher_filter, offering__class_times__isnull=False
+    ).values_list(
+        'teacher_id', 'offering__academic_year', 'offering__semester',
+        'offering__class_times__weekday', 'offering__class_times__start_period', 'offering__class_times__end_period'
+    )
+    for teacher_id, academic_year, semester, weekday, start_period, end_period in rows:
+        masks[(teacher_id, academic_year, semester)] |= class_time_mask(weekday, start_period, end_period)
+
+    occupancies = []
+    for (teacher_id, academic_year, semester), mask in masks.items():
+        slots_mon_thu, slots_fri_sun = split_mask(mask)
+        occupancies.append(TeacherOccupancy(
+            teacher_id=teacher_id, academic_year=academic_year, semester=semester,
+            slots_mon_thu=slots_mon_thu, slots_fri_sun=slots_fri_sun,
+        ))
+    return occupancies
+
+
+def sync_teachers(teacher_ids):
+    """重算指定教師所有學期的授課時段"""
+    teacher_ids = {teacher_id for teacher_id in teacher_ids if teacher_id}
+    if not teacher_ids:
+        return
+
+    occupancies = _build({'teacher_id__in': teacher_ids})
+    with transaction.atomic():
+        TeacherOccupancy.objects.filter(teacher_id__in=teacher_ids).delete()
+        TeacherOccupancy.objects.bulk_create(occupancies, batch_size=500)
+
+
+def rebuild():
+    """重建所有教師的授課時段，回傳資料筆數"""
+    occupancies = _build({})
+    with transaction.atomic():
+        TeacherOccupancy.objects.all().delete()
+        TeacherOccupancy.objects.bulk_create(occupancies, batch_size=500)
+    return len(occupancies)
+
+
+def find_conflicts(teachers, academic_year, semester, mask, exclude_offering_id=None):
+    """
+    檢查多位教師在這學期的 mask 時段是否已有課，回傳所有衝突（沒有衝突時為空列表）：
+    [{'teacher_id', 'teacher_name', 'offering_id', 'course_name', 'weekday', 'start_period', 'end_period'}, ...]
+    exclude_offering_id: 修改開課時排除它自己原本的時段
+    """
+    teachers = {teacher.id: teacher for teacher in teachers if teacher is not None}
+    if not teachers or not mask:
+        return []
+
+    busy = [
+        teacher_id
+        for teacher_id, slots_mon_thu, slots_fri_sun in TeacherOccupancy.objects.filter(
+            teacher_id__in=teachers, academic_year=academic_year, semester=semester
+        ).values_list('teacher_id', 'slots_mon_thu', 'slots_fri_sun')
+        if join_mask(slots_mon_thu, slots_fri_sun) & mask
+    ]
+    if not busy:
+        return []
+
+    # 有重疊：找出是哪些課（也可能只是和這門課原本的時段重疊）
+    conflicts = []
+    class_times = ClassTime.objects.filter(
+        offering__offering_teachers__teacher_id__in=busy,
+        offering__academic_year=academic_year, offering__semester=semester
+    ).exclude(offering_id=exclude_offering_id).values_list(
+        'offering__offering_teachers__teacher_id', 'offering_id', 'offering__course__course_name',
+        'weekday', 'start_period', 'end_period'
+    ).order_by('offering__offering_teachers__teacher_id', 'weekday', 'start_period')
+    for teacher_id, offering_id, course_name, weekday, start_period, end_period in class_times:
+        if class_time_mask(weekday, start_period, end_period) & mask:
+            conflicts.append({
+                'teacher_id': teacher_id,
+                'teacher_name': _teacher_name(teachers[teacher_id]),
+                'offering_id': offering_id,
+                'course_name': course_name,
+                'weekday': weekday,
+                'start_period': start_period,
+                'end_period': end_period,
+            })
+    return conflicts
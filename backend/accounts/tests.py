@@ -1,3 +1,1514 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .models import ClassTime, Course, CourseOffering, Department, OfferingTeacher, Profile, Role, TeacherOccupancy
+
+
+# ===== 測試資料 =====
+
+def make_user(username, role='student', grade=None, **profile):
+    user = User.objects.create_user(username=username, password=username)
+    profile = Profile.objects.create(user=user, real_name=username, grade=grade, **profile)
+    profile.roles.add(Role.objects.get_or_create(name=role)[0])
+    return user
+
+
+def make_offering(code, max_students=50, teachers=(), times=(), course_type='elective', credits=3,
+                  academic_year='114', semester='1', department=None):
+    """times: [(星期, 開始節, 結束節, 教室)]"""
+    department = department or Department.objects.get_or_create(name='資訊工程學系')[0]
+    course = Course.objects.create(course_code=code, course_name=code, course_type=course_type, credits=credits)
+    offering = CourseOffering.objects.create(
+        course=course, department=department, academic_year=academic_year, semester=semester,
+        grade_level=1, max_students=max_students,
+    )
+    for i, teacher in enumerate(teachers):
+        OfferingTeacher.objects.create(offering=offering, teacher=teacher, role='main' if i == 0 else 'co')
+    for weekday, start_period, end_period, classroom in times:
+        ClassTime.objects.create(
+            offering=offering, weekday=str(weekday), start_period=start_period, end_period=end_period, classroom=classroom
+        )
+    return offering
+
+
+# ===== 排課與衝堂 =====
+
+class ApplyPlanTests(TestCase):
+    def test_apply_plan_updates_teacher_occupancy(self):
+        from .conflicts import check_class_time
+        from .scheduling import apply_plan
+
+        t1 = make_user('t1', role='teacher')
+        offering = make_offering('CS101', teachers=[t1], times=[(1, 1, 3, 'A101')])
+        self.assertEqual(check_class_time('X1', [t1], '114', '1', '5', 1, 3), [])
+
+        updated, conflicts = apply_plan('114', '1', [
+            {'offering_id': offering.id, 'weekday': 5, 'start_period': 1, 'end_period': 3, 'classroom': 'A101'},
+        ])
+
+        self.assertEqual((updated, conflicts), (1, []))
+        occupancy = TeacherOccupancy.objects.get(teacher=t1, academic_year='114', semester='1')
+        self.assertEqual(occupancy.slots_mon_thu, 0)
+        self.assertNotEqual(occupancy.slots_fri_sun, 0)
+        found = check_class_time('X1', [t1], '114', '1', '5', 1, 3)
+        self.assertEqual([c['type'] for c in found], ['teacher'])
+        self.assertEqual(check_class_time('X1', [t1], '114', '1', '1', 1, 3), [])
+
+
+
+class SolveTests(TestCase):
+    def make_problem(self, items, rooms, weekdays, last_period):
+        from .scheduling import Occupancy, ScheduleProblem
+        return ScheduleProblem(items, Occupancy(), rooms, weekdays=weekdays, last_period=last_period,
+                               preferred_periods=range(1, last_period + 1))
+
+    def assert_no_conflicts(self, problem, assignments):
+        from .timeslots import class_time_mask
+
+        items = {item.id: item for item in problem.items}
+        placed = [
+            (items[item_id], class_time_mask(weekday, start, start + items[item_id].length - 1), room)
+            for item_id, (weekday, start, room) in assignments.items()
+        ]
+        for i, (a, a_mask, a_room) in enumerate(placed):
+            for b, b_mask, b_room in placed[i + 1:]:
+                if not a_mask & b_mask:
+                    continue
+                self.assertNotEqual(a_room, b_room, (a.label, b.label))
+                self.assertFalse(set(a.teachers) & set(b.teachers), (a.label, b.label))
+                self.assertFalse(a.required and b.required and a.cohort == b.cohort, (a.label, b.label))
+
+    def test_solvable_instance_has_no_conflicts(self):
+        from .scheduling import Item, solve
+
+        # 兩天、每天 4 節、兩間教室：教師 1 教三門課，同系同年級的三門必修也不能同時段
+        items = [
+            Item(1, 'A', [1], ('CS', 1), True, 2),
+            Item(2, 'B', [1], ('CS', 1), True, 2),
+            Item(3, 'C', [1, 2], ('CS', 1), True, 2),
+            Item(4, 'D', [2], ('CS', 2), False, 2),
+            Item(5, 'E', [3], ('EE', 1), True, 2, current=(1, 1, 'R1')),
+            Item(6, 'F', [4], ('EE', 1), False, 4),
+        ]
+        problem = self.make_problem(items, ['R1', 'R2'], weekdays=[1, 2], last_period=4)
+        result = solve(problem, time_limit=0.2, seed=1)
+
+        self.assertEqual(result['unassigned'], {})
+        self.assertEqual(set(result['assignments']), {1, 2, 3, 4, 5, 6})
+        self.assert_no_conflicts(problem, result['assignments'])
+        self.assertEqual(result['assignments'][5], (1, 1, 'R1'))  # 已排好的課不必移動
+
+    def test_over_constrained_instance_reports_unassigned(self):
+        from .scheduling import UNASSIGNED_PENALTY, Item, solve
+
+        # 只有一個位置：三門課只能排進一門，其餘回報衝突原因
+        items = [
+            Item(1, 'A', [1], ('CS', 1), False, 2),
+            Item(2, 'B', [2], ('CS', 1), False, 2),
+            Item(3, 'C', [1], ('CS', 1), False, 2),
+        ]
+        problem = self.make_problem(items, ['R1'], weekdays=[1], last_period=2)
+        result = solve(problem, time_limit=0.1, seed=1)
+
+        self.assertEqual(len(result['assignments']), 1)
+        self.assertEqual(len(result['unassigned']), 2)
+        self.assertTrue(set(result['unassigned'].values()) <= {'room', 'teacher'})
+        self.assertGreaterEqual(result['cost'], 2 * UNASSIGNED_PENALTY)
+        self.assert_no_conflicts(problem, result['assignments'])
+
+
+# ===== 排課規劃 =====
+
+def _section(*times):
+    """times: [(星期, 開始節, 結束節)]"""
+    from .timeslots import class_time_mask
+    mask = 0
+    for weekday, start_period, end_period in times:
+        mask |= class_time_mask(weekday, start_period, end_period)
+    return mask
+
+
+class PlannerTests(TestCase):
+    def test_ranking_prefers_credits_then_days_then_gaps(self):
+        from .planner import solve
+
+        groups = [
+            (1, 3, False, [(11, _section((1, 1, 3))), (12, _section((2, 1, 3)))]),
+            (2, 3, False, [(21, _section((1, 5, 7))), (22, _section((1, 4, 6))), (23, _section((3, 1, 3)))]),
+            (3, 2, False, [(31, _section((4, 1, 2)))]),
+        ]
+        result = solve(groups, min_credits=0, max_credits=6, top_n=2)
+
+        self.assertTrue(result['complete'])
+        # 6 學分優先；同一天上完（1 天）優先於 2 天；同一天中沒有空堂的優先
+        self.assertEqual(result['timetables'], [
+            {'offering_ids': [11, 22], 'credits': 6, 'days': 1, 'gaps': 0},
+            {'offering_ids': [11, 21], 'credits': 6, 'days': 1, 'gaps': 1},
+        ])
+
+    def test_skips_time_conflicts(self):
+        from .planner import solve
+
+        groups = [
+            (1, 3, True, [(11, _section((1, 1, 3)))]),
+            (2, 3, False, [(21, _section((1, 3, 4))), (22, _section((2, 3, 4)))]),
+        ]
+        result = solve(groups, min_credits=0, max_credits=10, top_n=5)
+        self.assertEqual([t['offering_ids'] for t in result['timetables']], [[11, 22], [11]])
+
+        # 必選課程與已選課程衝堂：沒有可行的課表
+        result = solve(groups, min_credits=0, max_credits=10, fixed_mask=_section((1, 2, 2)), fixed_credits=2)
+        self.assertEqual(result['timetables'], [])
+
+    def test_prunes_unreachable_credit_minimum(self):
+        from .planner import solve
+
+        groups = [(i, 2, False, [(i * 10, _section((i % 5 + 1, 1, 2)))]) for i in range(1, 9)]
+        result = solve(groups, min_credits=17, max_credits=20)
+        # 全選也只有 16 學分：根節點就剪掉
+        self.assertEqual((result['timetables'], result['explored']), ([], 1))
+
+    def test_endpoint_runs_solver(self):
+        from unittest import mock
+        from . import planner
+        from .models import FavoriteCourse
+
+        student = make_user('planner')
+        morning = make_offering('PL101', times=[(1, 1, 3, 'A101')])
+        clash = make_offering('PL102', times=[(1, 2, 4, 'A102')])
+        friday = make_offering('PL103', times=[(5, 1, 3, 'A103')])
+        for offering in (morning, clash, friday):
+            FavoriteCourse.objects.create(student=student, offering=offering)
+
+        self.client.force_login(student)
+        # 在同一個 process 執行，不經過 spawn 的 process pool
+        with mock.patch.object(planner, 'run', side_effect=planner.solve):
+            response = self.client.post('/api/courses/planner/', {
+                'semester': '1', 'min_credits': 6, 'max_credits': 6,
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['complete'])
+        # 衝堂的 PL101 + PL102 只要 1 天，若沒有略過衝堂會排在最前面
+        self.assertCountEqual(
+            [t['offering_ids'] for t in data['timetables']],
+            [sorted([morning.id, friday.id]), sorted([clash.id, friday.id])],
+        )
+
+# ===== 志願分發 =====
+
+class SerialDictatorshipTests(TestCase):
+    def run_serial_dictatorship(self, prefs, priority, seats, offering_course, offering_slots, taken=()):
+        import numpy as np
+        from .lottery import serial_dictatorship
+
+        n_students = len(priority)
+        return serial_dictatorship(
+            np.array([s for s, _ in prefs], dtype=np.int64),
+            np.array([o for _, o in prefs], dtype=np.int64),
+            np.array(priority, dtype=np.int64),
+            np.array(seats, dtype=np.int64),
+            np.array(offering_course, dtype=np.int64),
+            (np.array(offering_slots, dtype=np.uint64), np.zeros(len(seats), dtype=np.uint64)),
+            (np.zeros(n_students, dtype=np.uint64), np.zeros(n_students, dtype=np.uint64)),
+            np.array(taken, dtype=np.int64).reshape(-1, 2),
+        ).tolist()
+
+    def test_hand_computed_allocation(self):
+        # 開課 0 額滿；開課 1、2 各 1 個名額且同一時段；開課 3 與開課 1 同一門課程
+        # 學生 0（最優先）：0 > 1 > 3；學生 1：1 > 2；學生 2：1 > 3 > 2
+        # 學生 0 的第一志願落空後仍拿到開課 1（輪流提出志願的分法會被學生 1 的第一志願搶走），
+        # 開課 3 與已分到的開課 1 同課程略過；學生 1 分到開課 2；學生 2 只剩開課 3
+        prefs = [(0, 0), (0, 1), (0, 3), (1, 1), (1, 2), (2, 1), (2, 3), (2, 2)]
+        assigned = self.run_serial_dictatorship(
+            prefs, priority=[0, 1, 2], seats=[0, 1, 1, 5], offering_course=[0, 1, 2, 1],
+            offering_slots=[0b1, 0b10, 0b10, 0b100],
+        )
+        self.assertEqual(assigned, [False, True, False, False, True, False, True, False])
+
+    def test_priority_order_not_index_order(self):
+        assigned = self.run_serial_dictatorship(
+            [(0, 0), (1, 0)], priority=[1, 0], seats=[1], offering_course=[0], offering_slots=[0b1],
+        )
+        self.assertEqual(assigned, [False, True])
+
+    def test_time_conflict_and_taken_course_skipped(self):
+        # 學生 0 已修過課程 0；開課 1、2 時段重疊
+        assigned = self.run_serial_dictatorship(
+            [(0, 0), (0, 1), (0, 2)], priority=[0], seats=[1, 1, 1], offering_course=[0, 1, 2],
+            offering_slots=[0b1, 0b110, 0b100], taken=[(0, 0)],
+        )
+        self.assertEqual(assigned, [False, True, False])
+
+
+class AllocateTests(TestCase):
+    def test_allocate_by_grade_priority(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .lottery import allocate
+        from .models import AllocationRound, CoursePreference, Enrollment
+
+        senior = make_user('s_senior', grade=4)
+        junior = make_user('s_junior', grade=1)
+        x = make_offering('X100', max_students=1, times=[(1, 1, 2, 'A101')])
+        y = make_offering('Y100', max_students=1, times=[(2, 1, 2, 'A101')])
+        now = timezone.now()
+        allocation_round = AllocationRound.objects.create(
+            academic_year='114', semester='1', opens_at=now - timedelta(days=1), closes_at=now - timedelta(hours=1)
+        )
+        for student, offerings in [(junior, [x, y]), (senior, [x])]:
+            for rank, offering in enumerate(offerings, start=1):
+                CoursePreference.objects.create(
+                    allocation_round=allocation_round, student=student, offering=offering, rank=rank
+                )
+
+        result = allocate(allocation_round, seed=1)
+
+        self.assertEqual(result['assigned'], 2)
+        enrolled = set(Enrollment.objects.filter(status='enrolled').values_list('student__username', 'offering_id'))
+        self.assertEqual(enrolled, {('s_senior', x.id), ('s_junior', y.id)})
+        x.refresh_from_db()
+        self.assertEqual((x.current_students, x.status), (1, 'full'))
+        self.assertEqual(
+            dict(CoursePreference.objects.filter(student=junior).values_list('offering_id', 'result')),
+            {x.id: 'rejected', y.id: 'assigned'},
+        )
+
+
+# ===== 選課排隊 =====
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_MAX_CONCURRENT=1)
+class AdmissionTests(TestCase):
+    def setUp(self):
+        from . import counters
+        counters._stores.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def call(self, user, token=None, view=None):
+        from django.contrib.auth.models import AnonymousUser
+        from django.http import JsonResponse
+        from django.test import RequestFactory
+        from .admission import admission_control
+
+        request = RequestFactory().post('/enroll/', HTTP_X_QUEUE_TOKEN=token or '')
+        request.user = user or AnonymousUser()
+        return admission_control('test')(view or (lambda request: JsonResponse({'ok': True})))(request)
+
+    def test_token_bound_to_user_and_single_use(self):
+        from .admission import WaitingRoom
+
+        room = WaitingRoom('test')
+        room._incr('active')  # 佔滿位置：第一次請求排隊並拿到號碼牌
+        response = self.call(self.alice)
+        self.assertEqual(response.status_code, 503)
+        token = response['X-Queue-Token']
+        room._incr('active', -1)
+
+        # 別人拿同一張號碼牌：重新領號碼牌（號碼較大）
+        self.assertIsNone(room.read_token(token, self.bob.pk))
+        self.assertEqual(room.read_token(token, self.alice.pk)[0], 1)
+
+        self.assertEqual(self.call(self.alice, token).status_code, 200)
+        # 用過的號碼牌失效
+        self.assertIsNone(room.read_token(token, self.alice.pk))
+
+    def test_concurrent_reuse_of_same_ticket(self):
+        from .admission import WaitingRoom
+
+        room = WaitingRoom('test')
+        ticket, _ = room.issue(self.alice.pk)
+        self.assertTrue(room.try_enter(ticket))
+        self.assertTrue(room.use(ticket))
+        self.assertFalse(room.use(ticket))
+
+    @override_settings(ADMISSION_MAX_CONCURRENT=3)
+    def test_concurrency_never_exceeds_limit(self):
+        import threading
+        import time
+        from django.http import JsonResponse
+
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0, 'ok': 0}
+
+        def view(request):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.005)
+            with lock:
+                state['active'] -= 1
+            return JsonResponse({'ok': True})
+
+        def client():
+            token = None
+            for _ in range(200):
+                response = self.call(None, token, view)
+                if response.status_code == 200:
+                    with lock:
+                        state['ok'] += 1
+                    return
+                token = response['X-Queue-Token']
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=client) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(state['ok'], 12)
+        self.assertLessEqual(state['peak'], 3)
+
+
+# ===== 流量限制 =====
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        from . import counters
+        counters._stores.clear()
+        self.addCleanup(counters._stores.clear)
+
+    def burst(self, key, rate, n, at):
+        from unittest import mock
+        from .throttling import consume
+
+        with mock.patch('accounts.throttling.time.time', return_value=at):
+            return [consume(key, rate) for _ in range(n)]
+
+    def test_burst_passes_exactly_count(self):
+        for rate in [(5, 60), (600, 1), (7, 60)]:
+            waits = self.burst(f'k{rate}', rate, rate[0] + 10, at=1000.0)
+            self.assertEqual(sum(1 for wait in waits if wait == 0), rate[0])
+
+    def test_idle_bucket_does_not_double_burst(self):
+        # 桶子閒置一段時間（key 尚未過期）後的連續請求，仍只放行容量個（TAT 不會落後現在）
+        self.burst('k', (5, 60), 1, at=1000.0)
+        waits = self.burst('k', (5, 60), 20, at=1050.0)
+        self.assertEqual(sum(1 for wait in waits if wait == 0), 5)
+
+    def test_refill_one_interval(self):
+        self.burst('k', (5, 60), 10, at=1000.0)
+        self.assertEqual(self.burst('k', (5, 60), 2, at=1012.0), [0, 12.0])
+
+    @override_settings(THROTTLE_COUNTER_STORE='accounts.counters.CacheCounterStore')
+    def test_concurrent_burst_with_cache_store(self):
+        import threading
+        from .throttling import consume
+
+        passed = []
+
+        def client():
+            for _ in range(10):
+                if consume('concurrent', (25, 60)) == 0:
+                    passed.append(1)
+
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(passed), 25)
+
+
+    def test_lock_timeout_throttles_instead_of_failing(self):
+        from unittest import mock
+        from . import counters
+        from .throttling import consume
+
+        with mock.patch.object(counters.LocalCounterStore, 'update', side_effect=TimeoutError('busy')):
+            self.assertGreater(consume('busy', (5, 60)), 0)
+            response = self.client.post('/api/login/', {'username': 'a', 'password': 'b'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+
+    def test_login_throttle_accepts_non_object_body(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        response = self.client.post('/api/login/', ['admin'], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+# ===== 回應壓縮 =====
+
+@override_settings(API_COMPRESSION_MIN_SIZE=200)
+class CompressionTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        for i in range(5):
+            make_offering(f'CP10{i}', times=[(1, 1, 2, 'A101')])
+
+    def test_choose_encoding(self):
+        from unittest import mock
+        from . import compression
+
+        with mock.patch.object(compression, 'supported_encodings', return_value=['br', 'gzip']):
+            self.assertEqual(compression.choose_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(compression.choose_encoding('br;q=0.5, gzip;q=0.8'), 'gzip')
+            self.assertEqual(compression.choose_encoding('br;q=0, *'), 'gzip')
+            self.assertIsNone(compression.choose_encoding('identity'))
+            self.assertIsNone(compression.choose_encoding(''))
+        # mtime 固定：相同內容得到相同的壓縮結果
+        self.assertEqual(compression.compress(b'x' * 100, 'gzip'), compression.compress(b'x' * 100, 'gzip'))
+
+    def test_cached_catalog_response_negotiates_encoding(self):
+        import gzip
+        import json
+
+        params = {'academic_year': '114', 'semester': '1'}
+        plain = self.client.get('/api/courses/search/', params)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(len(json.loads(plain.content)), 5)
+
+        # 同一份快取內容：接受 gzip 的客戶端拿到壓縮後的位元組
+        compressed = self.client.get('/api/courses/search/', params, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(int(compressed['Content-Length']), len(compressed.content))
+
+    def test_small_responses_not_compressed(self):
+        import gzip
+        from django.core.cache import cache
+
+        response = self.client.get('/api/courses/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        gzip.decompress(response.content)
+
+        cache.clear()
+        with override_settings(API_COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get('/api/courses/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+# ===== 目錄快取版本 =====
+
+class CatalogVersionTests(TestCase):
+    def test_version_bumped_after_commit(self):
+        from .catalog_cache import get_catalog_version
+
+        offering = make_offering('CV101')
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            offering.max_students = 60
+            offering.save()
+        self.assertEqual(get_catalog_version(), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_catalog_version(), before)
+
+    def test_seat_only_save_keeps_catalog_version(self):
+        from django.test import RequestFactory
+        from .catalog_cache import build_cache_key, get_catalog_version, get_seat_version
+
+        offering = make_offering('CV102')
+        request = RequestFactory().get('/api/courses/')
+        catalog_version, seat_version = get_catalog_version(), get_seat_version()
+        key = build_cache_key(request, 'courses')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            offering.current_students = 1
+            offering.save(update_fields=['current_students', 'status', 'updated_at'])
+
+        self.assertEqual(get_catalog_version(), catalog_version)
+        self.assertGreater(get_seat_version(), seat_version)
+        # 含名額的目錄回應仍然失效
+        self.assertNotEqual(build_cache_key(request, 'courses'), key)
+
+    def test_versions_shared_between_workers(self):
+        from django.core.cache import cache
+        from .catalog_cache import bump_catalog_version, get_catalog_version
+
+        version = get_catalog_version()
+        bump_catalog_version()
+        cache.clear()  # 另一個 worker：自己的快取是空的，仍看到新的版本號
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_async_search_with_facets(self):
+        # 版本號需查資料庫：async view 中不能以同步方式查詢
+        student = make_user('cv_student')
+        make_offering('CV103', times=[(1, 1, 2, 'A101')])
+        self.client.force_login(student)
+        for path in ('/api/async/courses/search/', '/api/courses/search/'):
+            response = self.client.get(path, {'facets': 1, 'free_slots_only': 1, 'keyword': 'CV103'})
+            self.assertEqual(response.status_code, 200, response.content)
+
+
+# ===== 目錄增量同步 =====
+
+class CatalogSyncTests(TestCase):
+    def test_current_version_skips_unsettled_changes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .catalog_sync import collect_changes, current_version, record_offering_changes
+        from .models import CatalogChange
+
+        record_offering_changes([101, 102])
+        self.assertEqual(current_version(), 0)
+
+        CatalogChange.objects.update(changed_at=timezone.now() - timedelta(seconds=60))
+        version = current_version()
+        self.assertEqual(version, CatalogChange.objects.order_by('id').last().id)
+
+        # 新的異動尚未超過等待時間：不算進版本號，下一次同步時取得
+        record_offering_changes([103])
+        self.assertEqual(current_version(), version)
+        self.assertEqual(collect_changes(0, up_to_version=current_version()), ({101, 102}, set()))
+        self.assertEqual(collect_changes(version), ({103}, set()))
+
+    def test_changes_endpoint_sees_changes_once_settled(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import CatalogChange
+
+        offering = make_offering('CS201')
+        CatalogChange.objects.update(changed_at=timezone.now() - timedelta(seconds=60))
+        version = self.client.get('/api/courses/changes/', {'since_version': 0}).json()['version']
+
+        offering.max_students = 10
+        offering.save()
+        params = {'since_version': version}
+        first = self.client.get('/api/courses/changes/', params).json()
+        self.assertEqual((first['version'], first['changed']), (version, []))
+
+        # 同樣的請求在異動超過等待時間後要拿到新的版本號（不能是快取的舊結果）
+        CatalogChange.objects.update(changed_at=timezone.now() - timedelta(seconds=60))
+        second = self.client.get('/api/courses/changes/', params).json()
+        self.assertGreater(second['version'], version)
+        self.assertEqual([item['id'] for item in second['changed']], [offering.id])
+
+
+# ===== 名額即時推播 =====
+
+class SeatPubSubTests(TestCase):
+    def test_default_backend_sees_changes_from_other_processes(self):
+        import asyncio
+        from unittest import mock
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+
+        offering = make_offering('CS301', max_students=30)
+        broker = import_string(settings.SEAT_PUBSUB_BACKEND)(**settings.SEAT_PUBSUB_OPTIONS)
+        broker._last_version = 0
+        loop = asyncio.new_event_loop()
+        try:
+            # 不啟動背景輪詢執行緒，改由測試呼叫 poll_once
+            with mock.patch.object(broker, '_ensure_poller'):
+                subscription = broker.subscribe([offering.id], loop)
+
+            # 選課在另一個 process 完成：這裡只有資料庫的異動紀錄，沒有呼叫 publish
+            offering.current_students = 5
+            offering.save()
+            broker.poll_once()
+            self.assertEqual(subscription._pending[offering.id]['current_students'], 5)
+        finally:
+            loop.close()
+
+    async def test_stream_unsubscribes_when_snapshot_fails(self):
+        from unittest import mock
+        from . import pubsub
+
+        broker = pubsub.InProcessBackend()
+        with mock.patch.object(pubsub, '_broker', broker), \
+                mock.patch('accounts.views_stream.CourseOffering.objects.filter', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                await self.async_client.get('/api/courses/seats/stream/', {'offering_ids': '1,2'})
+        self.assertEqual(broker.subscribed_offering_ids(), set())
+
+
+# ===== 全文搜尋 =====
+
+class SearchIndexTests(TestCase):
+    def test_query_building(self):
+        from .search_index import _postgres_query, _sqlite_query, index_tokens
+
+        self.assertEqual(_sqlite_query('資料結構 CS10'), '"資料 料結 結構" "cs10"*')
+        self.assertEqual(_sqlite_query('學'), '"學"')
+        self.assertEqual(_postgres_query('資料結構 cs10'), "('資料' <-> '料結' <-> '結構') & ('cs10':*)")
+        self.assertEqual(_postgres_query('學'), "('學')")
+        # 單字附在最後，bigram 的位置仍然相鄰
+        self.assertEqual(index_tokens('數學 AI 與'), '數學 ai 與 數 學')
+
+    def test_cjk_matching(self):
+        from .search_index import apply_keyword_search
+
+        def course_named(code, name):
+            offering = make_offering(code)
+            offering.course.course_name = name
+            offering.course.save()
+            return offering.id
+
+        algebra = course_named('MA101', '線性代數學')
+        structures = course_named('CS101', '資料結構')
+
+        def search(keyword):
+            return set(apply_keyword_search(CourseOffering.objects.all(), keyword).values_list('id', flat=True))
+
+        self.assertEqual(search('代數'), {algebra})
+        self.assertEqual(search('學'), {algebra})  # 只出現在 bigram 後半的字
+        self.assertEqual(search('構'), {structures})
+        self.assertEqual(search('料結'), {structures})
+        self.assertEqual(search('構資'), set())
+        self.assertEqual(search('cs1'), {structures})
+
+
+# ===== 開課搜尋文件 =====
+
+class SearchDocumentTests(TestCase):
+    def test_document_follows_catalog_changes(self):
+        from .models import ClassTime, OfferingSearchDocument
+        from .timeslots import class_time_mask, join_mask
+
+        teacher = make_user('doc_teacher', role='teacher')
+        offering = make_offering('SD101', teachers=[teacher], times=[(2, 3, 4, 'A101')])
+
+        def document():
+            return OfferingSearchDocument.objects.get(offering=offering)
+
+        self.assertEqual(document().teacher_names, 'doc_teacher')
+        self.assertEqual(join_mask(document().slots_mon_thu, document().slots_fri_sun), class_time_mask(2, 3, 4))
+        self.assertIn('sd101', document().search_text)
+
+        # 教師改名、只改名額、移除時段都要反映在文件上
+        teacher.profile.real_name = '王老師'
+        teacher.profile.save()
+        offering.current_students = 7
+        offering.save(update_fields=['current_students', 'status', 'updated_at'])
+        ClassTime.objects.filter(offering=offering).delete()
+
+        doc = document()
+        self.assertEqual((doc.teacher_names, doc.current_students), ('王老師', 7))
+        self.assertIn('王老師', doc.search_text)
+        self.assertEqual((doc.slots_mon_thu, doc.slots_fri_sun), (0, 0))
+
+    @override_settings(SEARCH_INDEX_ENABLED=False)
+    def test_search_filters_on_documents(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        teacher = make_user('doc_teacher2', role='teacher')
+        teacher.profile.real_name = '林老師'
+        teacher.profile.save()
+        required = make_offering('SD201', teachers=[teacher], course_type='required')
+        make_offering('SD202', course_type='elective')
+        make_offering('SD203', course_type='required', semester='2')
+
+        response = self.client.get('/api/courses/search/', {
+            'academic_year': '114', 'semester': '1', 'course_type': 'required', 'keyword': '林老師',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([course['id'] for course in response.json()], [required.id])
+
+
+# ===== 分面數量 =====
+
+class FacetTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        ee = Department.objects.create(name='電機工程學系')
+        make_offering('FC101', course_type='required', times=[(1, 1, 2, 'A101')])
+        make_offering('FC102', course_type='required', times=[(5, 1, 2, 'A102')])
+        make_offering('FC103', course_type='elective', times=[(1, 3, 4, 'A103')])
+        make_offering('FC104', course_type='required', times=[(1, 5, 6, 'A104')], department=ee)
+        make_offering('FC105', course_type='required', semester='2', times=[(1, 1, 2, 'A105')])
+
+    def facets(self, **params):
+        response = self.client.get('/api/courses/search/', {'academic_year': '114', 'semester': '1', 'facets': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['results'], {
+            facet: {str(item['value']): item['count'] for item in values} for facet, values in data['facets'].items()
+        }
+
+    def test_each_facet_ignores_its_own_selection(self):
+        results, facets = self.facets(course_type='required', department='資訊工程學系', weekdays='1')
+
+        self.assertEqual(len(results), 1)  # FC101
+        # 類別分面不套用類別條件：資工系、星期一的必修 1 門、選修 1 門
+        self.assertEqual(facets['course_type'], {'required': 1, 'elective': 1})
+        # 系所分面不套用系所條件：星期一的必修在資工、電機各 1 門
+        self.assertEqual(facets['department'], {'資訊工程學系': 1, '電機工程學系': 1})
+        # 星期分面不套用星期條件：資工系必修在星期一、星期五各 1 門
+        self.assertEqual(facets['weekdays'], {'1': 1, '5': 1})
+
+    def test_counts_follow_catalog_changes(self):
+        from .models import CourseOffering
+
+        _, before = self.facets()
+        self.assertEqual(before['course_type'], {'required': 3, 'elective': 1})
+
+        # 分面數量有快取，目錄異動後要重新計算
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseOffering.objects.get(course__course_code='FC103').delete()
+        _, after = self.facets()
+        self.assertEqual(after['course_type'], {'required': 3})
+
+
+# ===== 上課時段遮罩 =====
+
+class TimeslotTests(TestCase):
+    def test_masks_around_the_field_split(self):
+        from .timeslots import LOW_BITS, class_time_mask, join_mask, split_mask
+
+        thursday_last = class_time_mask(4, 14, 14)
+        friday_first = class_time_mask(5, 1, 1)
+        self.assertEqual(split_mask(thursday_last), (1 << (LOW_BITS - 1), 0))
+        self.assertEqual(split_mask(friday_first), (0, 1))
+        self.assertEqual(join_mask(*split_mask(thursday_last | friday_first)), thursday_last | friday_first)
+        self.assertFalse(thursday_last & friday_first)
+
+    def test_overlapping_across_the_split(self):
+        from .models import OfferingSearchDocument
+        from .timeslots import class_time_mask, overlapping
+
+        thursday = make_offering('TS101', times=[(4, 13, 14, 'A101')])
+        friday = make_offering('TS102', times=[(5, 1, 2, 'A102')])
+        both = make_offering('TS103', times=[(4, 14, 14, 'A103'), (5, 2, 2, 'A103')])
+
+        def matching(mask):
+            return set(overlapping(OfferingSearchDocument.objects.all(), mask).values_list('offering_id', flat=True))
+
+        self.assertEqual(matching(class_time_mask(4, 14, 14)), {thursday.id, both.id})
+        self.assertEqual(matching(class_time_mask(5, 1, 1)), {friday.id})
+        self.assertEqual(matching(class_time_mask(4, 12, 12) | class_time_mask(5, 2, 2)), {friday.id, both.id})
+        self.assertEqual(matching(0), set())
+
+    def test_free_slots_only_excludes_clashes_with_enrolled(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        student = make_user('ts_student')
+        enrolled = make_offering('TS201', times=[(5, 1, 2, 'B101')])
+        thursday = make_offering('TS202', times=[(4, 13, 14, 'B102')])
+        make_offering('TS203', times=[(5, 2, 3, 'B103')])
+
+        self.client.force_login(student)
+        self.assertEqual(self.client.post(f'/api/courses/{enrolled.id}/enroll/').status_code, 200)
+        response = self.client.get('/api/courses/search/', {'academic_year': '114', 'semester': '1', 'free_slots_only': 1})
+        self.assertEqual(response.status_code, 200)
+        # 與已選課程重疊的課（包括已選的課本身）都排除
+        self.assertEqual({course['id'] for course in response.json()}, {thursday.id})
+
+
+# ===== 教室使用時段 =====
+
+class RoomOccupancyTests(TestCase):
+    def test_conflict_detection_across_the_field_split(self):
+        from .models import ClassTime, Classroom
+        from .room_occupancy import find_conflict
+        from .timeslots import class_time_mask
+
+        offering = make_offering('RO101', times=[(4, 13, 14, 'R101')])
+        room = Classroom.objects.get(name='R101')
+
+        self.assertIsNone(find_conflict(room, '114', '1', class_time_mask(5, 1, 1)))
+        self.assertEqual(find_conflict(room, '114', '1', class_time_mask(4, 14, 14)).offering_id, offering.id)
+        self.assertIsNone(find_conflict(room, '114', '1', class_time_mask(4, 14, 14), exclude_offering_id=offering.id))
+        self.assertIsNone(find_conflict(room, '114', '2', class_time_mask(4, 14, 14)))
+
+        # 換教室後原本的教室空出來
+        class_time = ClassTime.objects.get(offering=offering)
+        class_time.classroom = 'R102'
+        class_time.save()
+        self.assertIsNone(find_conflict(room, '114', '1', class_time_mask(4, 14, 14)))
+        self.assertIsNotNone(find_conflict(Classroom.objects.get(name='R102'), '114', '1', class_time_mask(4, 14, 14)))
+
+    def test_available_classrooms_endpoint(self):
+        from .models import Classroom
+
+        make_offering('RO201', times=[(4, 14, 14, 'R201'), (5, 1, 2, 'R202')])
+        Classroom.objects.filter(name='R201').update(capacity=60)
+        Classroom.objects.filter(name='R202').update(capacity=60)
+        Classroom.objects.create(name='R203', capacity=20)
+        Classroom.objects.create(name='R204', capacity=80, is_active=False)
+
+        def available(**params):
+            response = self.client.get('/api/classrooms/available/', {'academic_year': '114', 'semester': '1', **params})
+            self.assertEqual(response.status_code, 200)
+            return {room['name'] for room in response.json()}
+
+        self.assertEqual(available(weekday=5, start_period=1), {'R201', 'R203'})
+        self.assertEqual(available(weekday=4, start_period=13, end_period=14), {'R202', 'R203'})
+        self.assertEqual(available(weekday=4, start_period=14, min_capacity=50), {'R202'})
+        self.assertEqual(self.client.get('/api/classrooms/available/', {'weekday': 1}).status_code, 400)
+
+
+# ===== 相似課程 =====
+
+class SimilarityTests(TestCase):
+    def test_tfidf_neighbours(self):
+        from .similarity import build_tfidf_matrix, top_neighbours
+
+        matrix = build_tfidf_matrix([['資料', '結構'], ['資料', '結構', '演算'], ['會計'], []])
+        self.assertAlmostEqual(float(matrix[0].multiply(matrix[0]).sum()), 1.0)
+
+        neighbours = top_neighbours(matrix, top_n=2, min_score=0.0)
+        self.assertEqual([j for j, _ in neighbours[0]], [1])
+        self.assertEqual([j for j, _ in neighbours[1]], [0])
+        self.assertEqual((neighbours[2], neighbours[3]), ([], []))  # 沒有共同的詞
+        self.assertGreater(neighbours[0][0][1], 0.5)
+
+    def test_similar_courses_endpoint(self):
+        from django.core.cache import cache
+        from .similarity import compute_similar_courses
+        cache.clear()
+
+        def offering_named(code, name, semester='1'):
+            offering = make_offering(code, semester=semester)
+            offering.course.course_name = name
+            offering.course.save()
+            return offering
+
+        target = offering_named('SM101', '資料結構')
+        practice = offering_named('SM102', '資料結構實習')
+        algorithms = offering_named('SM103', '資料結構與演算法')
+        offering_named('SM104', '資料結構實習二', semester='2')
+        offering_named('SM105', '會計學')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            courses, _ = compute_similar_courses(top_n=5)
+        self.assertEqual(courses, 5)
+
+        response = self.client.get(f'/api/courses/{target.id}/similar/', {'fields': 'id,similarity'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        # 只列同學期的開課，依相似度由高到低，不相關的課程不列出
+        self.assertEqual({item['id'] for item in results}, {practice.id, algorithms.id})
+        self.assertEqual(results, sorted(results, key=lambda item: -item['similarity']))
+
+
+# ===== 稀疏欄位 =====
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.offering = make_offering('SF101', teachers=[make_user('sf_teacher', role='teacher')],
+                                      times=[(1, 1, 2, 'A101')])
+
+    def test_only_requested_fields_are_queried(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import ClassTime, OfferingTeacher
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/courses/search/', {
+                'academic_year': '114', 'semester': '1', 'fields': 'id,course_name,current_students',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': self.offering.id, 'course_name': 'SF101', 'current_students': 0}])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn(ClassTime._meta.db_table, sql)
+        self.assertNotIn(OfferingTeacher._meta.db_table, sql)
+
+        # 預設欄位仍包含時段與教師
+        course = self.client.get('/api/courses/search/', {'academic_year': '114', 'semester': '1'}).json()[0]
+        self.assertEqual(course['class_times'][0]['classroom'], 'A101')
+
+    def test_unknown_fields_rejected(self):
+        from .offering_fields import InvalidFieldsRequest, parse_fields
+
+        response = self.client.get('/api/courses/search/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+        self.assertEqual(self.client.get(f'/api/courses/{self.offering.id}/similar/', {'fields': 'nope'}).status_code, 400)
+
+        self.assertEqual(parse_fields('id, id ,course_name,', ['status']), ['id', 'course_name'])
+        self.assertEqual(parse_fields('', ['status']), ['status'])
+        with self.assertRaises(InvalidFieldsRequest):
+            parse_fields(['favorited_at'], ['id'])
+        self.assertEqual(parse_fields(['favorited_at'], ['id'], extra_fields=['favorited_at']), ['favorited_at'])
+
+
+# ===== 非同步 API =====
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.student = make_user('async_student')
+        self.offering = make_offering('AV101', times=[(2, 1, 2, 'A101')])
+        make_offering('AV102', semester='2')
+
+    def get_both(self, path, params=None):
+        """同一個請求分別送到同步與 async 端點"""
+        from asgiref.sync import async_to_sync
+
+        sync_response = self.client.get(f'/api/{path}', params or {})
+        async_response = async_to_sync(self.async_client.get)(f'/api/async/{path}', params or {})
+        self.assertEqual((sync_response.status_code, async_response.status_code), (200, 200))
+        return sync_response.json(), async_response.json()
+
+    def test_responses_match_sync_views(self):
+        from .models import FavoriteCourse
+
+        self.client.force_login(self.student)
+        self.async_client.force_login(self.student)
+        self.assertEqual(self.client.post(f'/api/courses/{self.offering.id}/enroll/').status_code, 200)
+        FavoriteCourse.objects.create(student=self.student, offering=self.offering)
+
+        search_params = {'academic_year': '114', 'semester': '1', 'fields': 'id,course_code,is_favorited'}
+        sync_data, async_data = self.get_both('courses/search/', search_params)
+        self.assertEqual(async_data, sync_data)
+        self.assertEqual(async_data, [{'id': self.offering.id, 'course_code': 'AV101', 'is_favorited': True}])
+
+        for path in ('courses/filter-options/', 'courses/enrolled/', 'courses/favorites/'):
+            sync_data, async_data = self.get_both(path)
+            self.assertEqual(async_data, sync_data, path)
+        self.assertEqual([course['id'] for course in async_data], [self.offering.id])
+
+    def test_invalid_parameters_rejected(self):
+        from asgiref.sync import async_to_sync
+
+        response = async_to_sync(self.async_client.get)('/api/async/courses/search/', {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        response = async_to_sync(self.async_client.post)('/api/async/courses/search/')
+        self.assertEqual(response.status_code, 405)
+
+
+# ===== 自動完成 =====
+
+class AutocompleteTests(TestCase):
+    def make_index(self):
+        from .autocomplete import AutocompleteIndex, Entry
+
+        return AutocompleteIndex([
+            Entry('資料結構', 'course_name', 10, 'CS201'),
+            Entry('資料庫系統', 'course_name', 40, 'CS301'),
+            Entry('Data Structures', 'course_name_en', 10, 'CS201'),
+            Entry('CS201', 'course_code', 10, 'CS201'),
+            Entry('資料結構', 'course_name', 5, 'CS202'),  # 同名的另一門課只列一次
+            Entry('王資料', 'teacher', 1),
+        ])
+
+    def texts(self, index, query, limit=10):
+        return [item['text'] for item in index.search(query, limit)]
+
+    def test_prefix_ranked_by_popularity(self):
+        index = self.make_index()
+        # 短前綴走預先算好的前幾名：熱門的在前，同名只列一次
+        self.assertEqual(self.texts(index, '資料'), ['資料庫系統', '資料結構', '王資料'])
+        self.assertEqual(self.texts(index, '資料結'), ['資料結構'])
+        self.assertEqual(self.texts(index, 'cs2'), ['CS201'])
+        self.assertEqual(self.texts(index, '資料', limit=1), ['資料庫系統'])
+
+    def test_word_start_and_substring_matches(self):
+        index = self.make_index()
+        self.assertEqual(self.texts(index, 'struct'), ['Data Structures'])  # 英文單字開頭
+        self.assertEqual(self.texts(index, '結構'), ['資料結構'])  # 中間比對
+        self.assertEqual(self.texts(index, 'ＣＳ２０１'), ['CS201'])  # 全形轉半形
+        self.assertEqual(self.texts(index, 'xyz'), [])
+
+    def test_endpoint(self):
+        from unittest import mock
+        from . import autocomplete
+
+        with mock.patch.object(autocomplete, 'get_index', return_value=self.make_index()):
+            response = self.client.get('/api/courses/autocomplete/', {'q': '結構'})
+        self.assertEqual(response.json(), [{'text': '資料結構', 'type': 'course_name', 'course_code': 'CS201'}])
+        self.assertEqual(self.client.get('/api/courses/autocomplete/', {'q': ''}).json(), [])
+        self.assertEqual(self.client.get('/api/courses/autocomplete/', {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+
+# ===== 候補 =====
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()  # 流量限制與 Idempotency-Key 不跨測試
+        self.offering = make_offering('W101', max_students=1, times=[(1, 1, 2, 'A101')])
+        self.students = [make_user(f'w{i}') for i in range(4)]
+
+    def post(self, user, action, offering=None):
+        self.client.force_login(user)
+        return self.client.post(f'/api/courses/{(offering or self.offering).id}/{action}/')
+
+    def enrolled(self, offering=None):
+        from .models import Enrollment
+        return set(Enrollment.objects.filter(
+            offering=offering or self.offering, status='enrolled'
+        ).values_list('student__username', flat=True))
+
+    def test_join_and_position(self):
+        from . import waitlist
+        from .models import WaitlistEntry
+
+        self.assertEqual(self.post(self.students[0], 'enroll').status_code, 200)
+        for i in (1, 2):
+            response = self.post(self.students[i], 'enroll')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['position'], i)
+
+        # 重複加入維持原本的順位；取消後順位往前
+        entry = waitlist.join(self.students[2], self.offering)
+        self.assertEqual(waitlist.position(entry), 2)
+        self.assertTrue(waitlist.cancel(self.students[1], self.offering))
+        entry.refresh_from_db()
+        self.assertEqual(waitlist.position(entry), 1)
+        self.assertIsNone(waitlist.position(WaitlistEntry.objects.get(student=self.students[1])))
+
+    def test_drop_promotes_first_waiting(self):
+        for student in self.students[:3]:
+            self.post(student, 'enroll')
+        self.assertEqual(self.post(self.students[0], 'drop').status_code, 200)
+
+        self.assertEqual(self.enrolled(), {'w1'})
+        self.offering.refresh_from_db()
+        self.assertEqual((self.offering.current_students, self.offering.status), (1, 'full'))
+
+    def test_promote_skips_time_conflict(self):
+        from .models import WaitlistEntry
+
+        other = make_offering('W102', max_students=5, times=[(1, 2, 3, 'B101')])
+        for student in self.students[:3]:
+            self.post(student, 'enroll')
+        # w1 之後選了衝堂的課：遞補時略過但保留順位
+        self.assertEqual(self.post(self.students[1], 'enroll', other).status_code, 200)
+        self.post(self.students[0], 'drop')
+
+        self.assertEqual(self.enrolled(), {'w2'})
+        self.assertEqual(WaitlistEntry.objects.get(student=self.students[1]).status, 'waiting')
+
+    def test_enroll_does_not_jump_queue_after_capacity_grows(self):
+        from .models import WaitlistEntry
+
+        self.post(self.students[0], 'enroll')
+        self.post(self.students[1], 'enroll')
+        # 直接調高名額（不經過 API），下一個選課的人不能搶走候補者的名額
+        CourseOffering.objects.filter(id=self.offering.id).update(max_students=2, status='open')
+
+        response = self.post(self.students[2], 'enroll')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.enrolled(), {'w0', 'w1'})
+        self.assertEqual(WaitlistEntry.objects.get(student=self.students[1]).status, 'promoted')
+
+    def test_update_course_raising_capacity_promotes(self):
+        admin = make_user('admin', role='admin')
+        self.post(self.students[0], 'enroll')
+        self.post(self.students[1], 'enroll')
+
+        self.client.force_login(admin)
+        response = self.client.put(
+            f'/api/courses/{self.offering.id}/update/', {'max_students': 3}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.enrolled(), {'w0', 'w1'})
+        self.offering.refresh_from_db()
+        self.assertEqual((self.offering.current_students, self.offering.status), (2, 'open'))
+
+
+    def test_update_course_keeps_concurrent_enrollment(self):
+        from unittest import mock
+        from django.db.models import F
+        from .models import Course
+
+        admin = make_user('admin', role='admin')
+        self.post(self.students[0], 'enroll')
+        original_save = Course.save
+
+        def save_then_enroll(course, *args, **kwargs):
+            # 模擬管理員讀取開課之後、存檔之前，另一個請求完成了選課
+            original_save(course, *args, **kwargs)
+            CourseOffering.objects.filter(id=self.offering.id).update(current_students=F('current_students') + 1)
+
+        self.client.force_login(admin)
+        with mock.patch.object(Course, 'save', autospec=True, side_effect=save_then_enroll):
+            response = self.client.put(
+                f'/api/courses/{self.offering.id}/update/', {'max_students': 5}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.offering.refresh_from_db()
+        self.assertEqual((self.offering.current_students, self.offering.max_students), (2, 5))
+
+# ===== 人數校正 =====
+
+class ReconcileTests(TestCase):
+    def test_reconcile_fixes_drift_and_promotes_waitlist(self):
+        from . import seat_counts, waitlist
+        from .models import Enrollment, WaitlistEntry
+
+        offering = make_offering('R101', max_students=2)
+        enrolled, waiting = make_user('r0'), make_user('r1')
+        Enrollment.objects.create(student=enrolled, offering=offering, status='enrolled')
+        waitlist.join(waiting, offering)
+        # 計數多算一人、狀態誤為額滿
+        CourseOffering.objects.filter(id=offering.id).update(current_students=2, status='full')
+
+        report = seat_counts.reconcile('114', '1', dry_run=True)
+        self.assertEqual((report['drifted'], report['total_drift'], report['promoted']), (1, 1, 0))
+        offering.refresh_from_db()
+        self.assertEqual(offering.current_students, 2)
+
+        report = seat_counts.reconcile('114', '1')
+        self.assertEqual((report['drifted'], report['status_changed'], report['promoted']), (1, 1, 1))
+        offering.refresh_from_db()
+        self.assertEqual((offering.current_students, offering.status), (2, 'full'))
+        self.assertEqual(WaitlistEntry.objects.get(student=waiting).status, 'promoted')
+        self.assertTrue(Enrollment.objects.filter(student=waiting, offering=offering, status='enrolled').exists())
+
+        self.assertEqual(seat_counts.reconcile('114', '1')['changes'], [])
+
+    def test_repeating_job_is_not_duplicated(self):
+        from . import jobs
+        from .job_handlers import reconcile_seats
+        from .models import Job
+
+        params = {'academic_year': '114', 'semester': '1', 'repeat_every': 600}
+        first = reconcile_seats(params, lambda *args: None)
+        second = reconcile_seats(params, lambda *args: None)
+
+        self.assertEqual(first['next_job_id'], second['next_job_id'])
+        self.assertEqual(Job.objects.filter(kind='reconcile_seats', status='queued').count(), 1)
+        # 參數不同的排程各自存在
+        self.assertNotEqual(jobs.submit('reconcile_seats', dict(params, semester='2'), dedupe=True).id, first['next_job_id'])
+
+
+# ===== 搜尋索引重建 =====
+
+class TextVersionTests(TestCase):
+    def test_only_text_changes_bump_text_version(self):
+        from .catalog_cache import get_text_version
+
+        offering = make_offering('TV101')
+        version = get_text_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            offering.current_students = 1
+            offering.save(update_fields=['current_students', 'status', 'updated_at'])
+        self.assertEqual(get_text_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            offering.course.course_name = '資料結構'
+            offering.course.save()
+        self.assertGreater(get_text_version(), version)
+
+    def test_bm25_rebuild_follows_text_version(self):
+        from unittest import mock
+        from . import bm25
+        from .catalog_cache import bump_seat_version, bump_text_version, get_text_version
+
+        with mock.patch.object(bm25, '_index', mock.Mock(version=get_text_version())), \
+                mock.patch.object(bm25, '_load'), \
+                mock.patch.object(bm25, 'build_index_file', return_value=(0, 0)) as build:
+            bump_seat_version()
+            bm25._rebuild_in_background(check_version=True)
+            build.assert_not_called()
+            bump_text_version()
+            bm25._rebuild_in_background(check_version=True)
+            build.assert_called_once()
+
+        # 請求中不查資料庫（async view 也會呼叫）
+        with mock.patch.object(bm25, '_index', object()), mock.patch.object(bm25, '_last_checked', float('inf')):
+            with self.assertNumQueries(0):
+                bm25.get_index()
+
+    def test_bm25_stale_index_file_is_rebuilt(self):
+        import tempfile
+        from unittest import mock
+        from . import bm25
+        from .catalog_cache import bump_text_version, get_text_version
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(BM25_INDEX_PATH=f'{tmp}/bm25.idx'), \
+                mock.patch.object(bm25, '_index', None), mock.patch.object(bm25, '_index_mtime', None):
+            make_offering('TV201')
+            bm25.build_index_file()
+            self.assertEqual(bm25.BM25Index(f'{tmp}/bm25.idx').version, get_text_version())
+
+            # 索引檔是上次部署時建立的：process 啟動後第一次檢查就要依標頭的版本發現過期
+            bump_text_version()
+            bm25._load()
+            bm25._rebuild_in_background(check_version=True)
+            self.assertEqual(bm25._index.version, get_text_version())
+
+    def test_bm25_relevance_ranks_within_filters(self):
+        import tempfile
+        from unittest import mock
+        from . import bm25
+
+        low = make_offering('DB100', semester='2')
+        low.course.course_name = '資料庫'
+        low.course.save()
+        for i in range(3):
+            other = make_offering(f'DB20{i}', semester='1')
+            other.course.course_name = '資料庫 資料庫 資料庫'
+            other.course.save()
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(BM25_INDEX_PATH=f'{tmp}/bm25.idx'), \
+                mock.patch.object(bm25, '_index', None), mock.patch.object(bm25, '_index_mtime', None):
+            bm25.build_index_file()
+            bm25._load()
+            with mock.patch.object(bm25, 'get_index', return_value=bm25._index):
+                # 全域排名最後的課程在第二學期仍要找得到
+                offerings = bm25.apply_relevance(CourseOffering.objects.filter(semester='2'), '資料庫')
+                self.assertEqual(list(offerings.values_list('id', flat=True)), [low.id])
+
+    def test_autocomplete_rebuild_follows_text_version(self):
+        import time
+        from unittest import mock
+        from . import autocomplete
+        from .catalog_cache import bump_seat_version, bump_text_version, get_text_version
+
+        with mock.patch.object(autocomplete, '_index_version', get_text_version()), \
+                mock.patch.object(autocomplete, '_built_at', time.monotonic()), \
+                mock.patch.object(autocomplete, 'rebuild') as rebuild:
+            bump_seat_version()
+            autocomplete._refresh_in_background()
+            rebuild.assert_not_called()
+            bump_text_version()
+            autocomplete._refresh_in_background()
+            rebuild.assert_called_once()
+
+        with mock.patch.object(autocomplete, '_index', object()), \
+                mock.patch.object(autocomplete, '_checked_at', time.monotonic()):
+            with self.assertNumQueries(0):
+                autocomplete.get_index()
+
+
+# ===== 游標分頁 =====
+
+class KeysetPaginationTests(TestCase):
+    def paginate(self, queryset, sort_keys, params):
+        from django.test import RequestFactory
+        from .pagination import KeysetPagination
+
+        paginator = KeysetPagination(RequestFactory().get('/', params), sort_keys, default_sort=params.get('sort', 'id'))
+        items = paginator.paginate(paginator.sort(queryset))
+        return [item.pk for item in items], paginator
+
+    def walk(self, queryset, sort_keys, sort):
+        pages, cursor = [], None
+        while True:
+            params = {'sort': sort, 'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            ids, paginator = self.paginate(queryset, sort_keys, params)
+            pages.append(ids)
+            cursor = paginator.next_cursor
+            if cursor is None:
+                return pages
+
+    def test_ties_broken_by_id_across_pages(self):
+        from .pagination import OFFERING_SORT_KEYS
+
+        offerings = [make_offering(f'P{i}', max_students=10) for i in range(5)]
+        CourseOffering.objects.filter(id__in=[offerings[1].id, offerings[3].id]).update(current_students=4)
+        ids = [offering.id for offering in offerings]
+
+        pages = self.walk(CourseOffering.objects.all(), OFFERING_SORT_KEYS, 'remaining_seats')
+        self.assertEqual(pages, [[ids[1], ids[3]], [ids[0], ids[2]], [ids[4]]])
+        pages = self.walk(CourseOffering.objects.all(), OFFERING_SORT_KEYS, '-remaining_seats')
+        self.assertEqual(sum(pages, []), [ids[4], ids[2], ids[0], ids[3], ids[1]])
+
+    def test_null_student_id_sorts_first_and_pages(self):
+        from .pagination import STUDENT_SORT_KEYS
+
+        users = [make_user(f'p{i}', student_id=student_id) for i, student_id in enumerate(['B2', None, 'A1', None])]
+        profile_ids = [user.profile.id for user in users]
+
+        pages = self.walk(Profile.objects.all(), STUDENT_SORT_KEYS, 'student_id')
+        self.assertEqual(sum(pages, []), [profile_ids[1], profile_ids[3], profile_ids[2], profile_ids[0]])
+
+    def test_cursor_round_trip_and_validation(self):
+        from .pagination import InvalidPageRequest, OFFERING_SORT_KEYS
+
+        for i in range(3):
+            make_offering(f'C{i}')
+        _, paginator = self.paginate(CourseOffering.objects.all(), OFFERING_SORT_KEYS, {'sort': '-created_at', 'page_size': 1})
+        cursor = paginator.next_cursor
+        _, same = self.paginate(CourseOffering.objects.all(), OFFERING_SORT_KEYS, {'sort': '-created_at', 'cursor': cursor})
+        self.assertEqual(same.cursor[1], CourseOffering.objects.order_by('-created_at', '-id').first().id)
+
+        for params in [{'sort': 'popularity', 'cursor': cursor}, {'sort': '-created_at', 'cursor': 'not-base64!'}]:
+            with self.assertRaises(InvalidPageRequest):
+                self.paginate(CourseOffering.objects.all(), OFFERING_SORT_KEYS, params)
+
+    def test_sort_uses_expression_index(self):
+        from .pagination import OFFERING_SORT_KEYS, STUDENT_SORT_KEYS
+
+        plan = CourseOffering.objects.annotate(
+            sort_value=OFFERING_SORT_KEYS['remaining_seats'].expression
+        ).order_by('sort_value', 'pk').explain()
+        self.assertIn('accounts_co_remaining_sort_idx', plan)
+        plan = Profile.objects.annotate(
+            sort_value=STUDENT_SORT_KEYS['student_id'].expression
+        ).order_by('sort_value', 'pk').explain()
+        self.assertIn('accounts_pr_student_sort_idx', plan)
+
+
+# ===== Idempotency-Key =====
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        for alias in ('default', 'idempotency'):
+            caches[alias].clear()
+        self.student = make_user('i0')
+        self.offering = make_offering('I101')
+        self.client.force_login(self.student)
+
+    def enroll(self, key, offering=None):
+        return self.client.post(f'/api/courses/{(offering or self.offering).id}/enroll/', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_first_response(self):
+        from .models import Enrollment
+
+        first = self.enroll('k1')
+        replay = self.enroll('k1')
+        self.assertEqual((first.status_code, replay.status_code), (200, 200))
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.offering.refresh_from_db()
+        self.assertEqual(self.offering.current_students, 1)
+        self.assertEqual(Enrollment.objects.filter(student=self.student).count(), 1)
+
+        # 沒有帶 Key 時照常執行
+        self.assertEqual(self.client.post(f'/api/courses/{self.offering.id}/enroll/').status_code, 400)
+
+    def test_key_reused_for_other_request(self):
+        self.enroll('k2')
+        response = self.enroll('k2', make_offering('I102'))
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_scoped_per_user(self):
+        self.enroll('k3')
+        self.client.force_login(make_user('i1'))
+        response = self.enroll('k3')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+
+# ===== 選課事件 =====
+
+class EnrollmentEventTests(TestCase):
+    def settle(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import EnrollmentEvent
+        EnrollmentEvent.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+
+    def test_checkpoint_advances_and_failures_roll_back(self):
+        from .enrollment_events import run_consumer
+        from .models import Enrollment, EventCheckpoint
+
+        student = make_user('e0')
+        offering = make_offering('E101')
+        enrollment = Enrollment.objects.create(student=student, offering=offering)
+        enrollment.status = 'dropped'
+        enrollment.save()
+
+        seen = []
+        # 尚未超過等待時間的事件不處理
+        self.assertEqual(run_consumer('test', seen.extend), (0, 0))
+        self.settle()
+
+        def failing(events):
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            run_consumer('test', failing)
+        self.assertEqual(EventCheckpoint.objects.get(name='test').position, 0)
+
+        processed, position = run_consumer('test', seen.extend, batch_size=1)
+        self.assertEqual(processed, 2)
+        self.assertEqual([event.kind for event in seen], ['enrolled', 'dropped'])
+        self.assertEqual(EventCheckpoint.objects.get(name='test').position, position)
+
+        # 已處理的事件不會再收到
+        self.assertEqual(run_consumer('test', seen.extend), (0, position))
+        enrollment.status = 'enrolled'
+        enrollment.save()
+        self.settle()
+        self.assertEqual(run_consumer('test', seen.extend)[0], 1)
+        self.assertEqual(len(seen), 3)
+
+
+# ===== 背景工作 =====
+
+def _succeeding_job(params, progress):
+    progress(1, 2, 'half')
+    return {'echo': params}
+
+
+def _failing_job(params, progress):
+    raise RuntimeError('temporary')
+
+
+def _invalid_job(params, progress):
+    from .jobs import JobError
+    raise JobError('bad params')
+
+
+@override_settings(JOB_HANDLERS={
+    'ok': 'accounts.tests._succeeding_job',
+    'flaky': 'accounts.tests._failing_job',
+    'invalid': 'accounts.tests._invalid_job',
+}, JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=30)
+class JobTests(TestCase):
+    def test_claim_and_succeed(self):
+        from . import jobs
+
+        job = jobs.submit('ok', {'n': 1})
+        claimed = jobs.claim()
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, 'running', 1))
+        self.assertIsNone(jobs.claim())  # 已被搶走
+
+        jobs.execute(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.result), ('succeeded', 100, {'echo': {'n': 1}}))
+
+    def test_retry_with_backoff_then_fail(self):
+        from django.utils import timezone
+        from . import jobs
+        from .models import Job
+
+        job = jobs.submit('flaky')
+        jobs.execute(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('queued', 'temporary'))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(jobs.claim())  # 等待重試時間
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        jobs.execute(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_job_error_fails_without_retry(self):
+        from . import jobs
+
+        job = jobs.submit('invalid')
+        jobs.execute(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 1, 'bad params'))
+        with self.assertRaises(jobs.JobError):
+            jobs.submit('unknown')
+
+    def test_stale_running_job_requeued(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import jobs
+        from .models import Job
+
+        job = jobs.submit('ok')
+        jobs.claim()
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(jobs.claim().attempts, 2)
+
+    def test_heartbeat_keeps_silent_job_running(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import jobs
+        from .models import Job
+
+        # 處理函式不回報進度（例如 reconcile_seats）：由 worker 主迴圈的心跳證明仍在執行
+        job = jobs.submit('ok')
+        jobs.claim()
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.heartbeat([job.id]), 1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 1))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+API 流量限制（token bucket，每位使用者與每個 IP 各一個桶子）
+搜尋、選課退選、收藏、登入各有獨立的額度，設定在 REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']：
+'<scope>' 為每位使用者（登入時為帳號）、'<scope>_ip' 為每個 IP；'60/min' 表示容量 60、每分鐘補滿
+
+以 GCRA（與 token bucket 等價）實作，每個桶子只存一個數字「理論到達時間」TAT（毫秒）：
+放行時 TAT = max(TAT, 現在) + 間隔，TAT 超過現在一個容量時拒絕（不寫入）；
+讀取與寫回以 counters.py 的 update 完成，不會與其他請求交錯，存放位置由 settings.THROTTLE_COUNTER_STORE 指定；
+同一個桶子的請求多到搶不到計數鎖（update 拋出 TimeoutError）時視為超過額度，回應 429 而不是 500
+key 在每次寫入 period 秒後過期，此時 TAT 必定已經過去，過期不會多放行
+"""
+import math
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from . import counters
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'60/min' -> (60, 60)；None 表示不限制"""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def consume(key, rate):
+    """從桶子取一個 token：可以時回傳 0，否則回傳需要等待的秒數（被拒絕的請求不消耗額度）"""
+    count, period = rate
+    interval = max(1, period * 1000 // count)
+    capacity = interval * count  # 間隔取整數後的容量，連續請求恰好放行 count 個
+    now = int(time.time() * 1000)
+    store = counters.get_store(settings.THROTTLE_COUNTER_STORE, settings.THROTTLE_COUNTER_OPTIONS)
+
+    def advance(tat):
+        tat = max(tat or 0, now) + interval
+        if tat - now > capacity:
+            return None, (tat - now - capacity) / 1000
+        return tat, 0
+
+    try:
+        return store.update(key, advance, timeout=period)
+    except TimeoutError as e:
+        print(f"流量限制計數錯誤: {str(e)}")
+        return interval / 1000
+
+
+def check(scope, user_key, ip):
+    """依序檢查使用者與 IP 的桶子，回傳需要等待的秒數（0 表示放行）"""
+    if not settings.THROTTLE_ENABLED:
+        return 0
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    buckets = [(f'{scope}_ip', ip)]
+    if user_key is not None:
+        buckets.insert(0, (scope, user_key))
+    for bucket_scope, ident in buckets:
+        rate = parse_rate(rates.get(bucket_scope))
+        if rate is None:
+            continue
+        wait = consume(f'throttle:{bucket_scope}:{ident}', rate)
+        if wait:
+            return wait
+    return 0
+
+
+def client_ip(request):
+    """與 DRF throttle 相同的 IP 判斷（非 DRF 的 async view 使用）"""
+    return BaseThrottle().get_ident(request)
+
+
+def throttled_data(wait):
+    """被限流時的回應內容"""
+    wait = math.ceil(wait or 1)
+    return {'error': f'請求過於頻繁，請於 {wait} 秒後再試', 'retry_after': wait}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle：子類別設定 scope"""
+    scope = None
+
+    def get_user_key(self, request):
+        return request.user.pk if request.user.is_authenticated else None
+
+    def allow_request(self, request, view):
+        self.wait_seconds = check(self.scope, self.get_user_key(request), self.get_ident(request))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SearchThrottle(TokenBucketThrottle):
+    scope = 'search'
+
+
+class EnrollThrottle(TokenBucketThrottle):
+    scope = 'enroll'
+
+
+class FavoriteThrottle(TokenBucketThrottle):
+    scope = 'favorite'
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """登入尚未有使用者，以嘗試登入的帳號計算（防止針對單一帳號猜密碼）"""
+    scope = 'login'
+
+    def get_user_key(self, request):
+        # 內容不是物件（例如 JSON 陣列）時只以 IP 計算，由 view 回應 400
+        if not isinstance(request.data, dict):
+            return None
+        username = request.data.get('username')
+        return str(username).strip().lower() if username else None
+
+
+def exception_handler(exc, context):
+    """與 DRF 預設相同，被限流時改為本專案的 {'error': ...} 格式"""
+    response = drf_exception_handler(exc, context)
+    if isinstance(exc, Throttled) and response is not None:
+        response.data = throttled_data(exc.wait)
+    return response
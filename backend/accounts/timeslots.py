@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+上課時段位元遮罩
+一週 7 天 × 每天 14 節 = 98 個時段，第 (星期 - 1) * 14 + (節次 - 1) 個位元代表一個時段
+資料庫的 BigIntegerField 只有 63 個可用位元，因此拆成兩個欄位存放：
+- 星期一～四：56 個位元（slots_mon_thu）
+- 星期五～日：42 個位元（slots_fri_sun）
+兩個時段集合是否重疊只需要一次位元 AND，不必逐筆比對開始、結束節次
+"""
+from functools import reduce
+from operator import add
+
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Value, When
+from django.db.models.lookups import GreaterThan
+
+PERIODS_PER_DAY = 14
+DAYS_PER_WEEK = 7
+LOW_DAYS = 4
+LOW_BITS = LOW_DAYS * PERIODS_PER_DAY
+LOW_MASK = (1 << LOW_BITS) - 1
+DAY_MASK = (1 << PERIODS_PER_DAY) - 1
+
+
+def slot_bit(weekday, period):
+    """單一時段的位元；超出範圍的星期或節次回傳 0"""
+    weekday, period = int(weekday), int(period)
+    if not (1 <= weekday <= DAYS_PER_WEEK and 1 <= period <= PERIODS_PER_DAY):
+        return 0
+    return 1 << ((weekday - 1) * PERIODS_PER_DAY + (period - 1))
+
+
+def class_time_mask(weekday, start_period, end_period):
+    """一個上課時段（某天第 start～end 節）的遮罩"""
+    mask = 0
+    for period in range(int(start_period), int(end_period) + 1):
+        mask |= slot_bit(weekday, period)
+    return mask
+
+
+def offering_mask(class_times):
+    """多個上課時段（ClassTime 或具有 weekday / start_period / end_period 的物件）合併的遮罩"""
+    mask = 0
+    for ct in class_times:
+        mask |= class_time_mask(ct.weekday, ct.start_period, ct.end_period)
+    return mask
+
+
+def weekdays_mask(weekdays):
+    """指定星期的所有節次"""
+    mask = 0
+    for weekday in weekdays:
+        weekday = int(weekday)
+        if 1 <= weekday <= DAYS_PER_WEEK:
+            mask |= DAY_MASK << ((weekday - 1) * PERIODS_PER_DAY)
+    return mask
+
+
+def periods_mask(periods):
+    """指定節次在每一天的時段"""
+    mask = 0
+    for period in periods:
+        for weekday in range(1, DAYS_PER_WEEK + 1):
+            mask |= slot_bit(weekday, period)
+    return mask
+
+
+def split_mask(mask):
+    """拆成 (星期一～四, 星期五～日) 兩個欄位的值"""
+    return mask & LOW_MASK, mask >> LOW_BITS
+
+
+def join_mask(low, high):
+    return (low or 0) | ((high or 0) << LOW_BITS)
+
+
+def overlapping(queryset, mask, low_field='slots_mon_thu', high_field='slots_fri_sun'):
+    """篩選時段與 mask 有交集的資料"""
+    if not mask:
+        return queryset.none()
+    low, high = split_mask(mask)
+    return queryset.filter(
+        Q(GreaterThan(F(low_field).bitand(low), 0)) |
+        Q(GreaterThan(F(high_field).bitand(high), 0))
+    )
+
+
+def not_overlapping_any(queryset, others, low_field='slots_mon_thu', high_field='slots_fri_sun'):
+    """
+    排除與 others（同樣具有兩個時段欄位的 queryset）任一筆時段有交集的資料
+    以 NOT EXISTS 子查詢在資料庫中完成，others 可再以 OuterRef 加上其他對應條件
+    """
+    return queryset.exclude(Exists(others.filter(
+        Q(GreaterThan(F(low_field).bitand(OuterRef(low_field)), 0)) |
+        Q(GreaterThan(F(high_field).bitand(OuterRef(high_field)), 0))
+    )))
+
+
+def weekdays_expression(low_field='slots_mon_thu', high_field='slots_fri_sun'):
+    """
+    SQL 運算式：有上課的星期組成的 7 位元值（星期一為第 0 個位元），供分組統計使用
+    例如只有星期二、星期五有課時為 0b0010010
+    """
+    bits = []
+    for weekday in range(1, DAYS_PER_WEEK + 1):
+        low, high = split_mask(weekdays_mask([weekday]))
+        field, mask = (low_field, low) if low else (high_field, high)
+        bits.append(Case(
+            When(GreaterThan(F(field).bitand(mask), 0), then=Value(1 << (weekday - 1))),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+    return reduce(add, bits)
@@ -4,7 +4,7 @@ Django URL 配置
 整合所有分離的 views 模組
 """
 from django.urls import path
-from . import views_auth, views_student, views_admin, views_course, views_account, views_debug
+from . import views_auth, views_student, views_admin, views_course, views_account, views_debug, views_stream, views_async
 
 urlpatterns = [
     # ===== 認證相關 API =====
@@ -18,25 +18,46 @@ urlpatterns = [
     # ===== 管理員功能 API =====
     # path('teachers/', views_admin.get_teachers, name='get_teachers'),  # ← 註解掉，與下面衝突
     path('courses/create/', views_admin.create_course, name='create_course'),
+    path('courses/schedule/propose/', views_admin.propose_schedule, name='propose_schedule'),  # 學期自動排課
+    path('courses/schedule/apply/', views_admin.apply_schedule, name='apply_schedule'),
+    path('classrooms/available/', views_admin.get_available_classrooms, name='available_classrooms'),  # 查詢空教室
+    path('admission/metrics/', views_admin.get_admission_metrics, name='admission_metrics'),  # 選課排隊狀況
+    path('jobs/', views_admin.job_list, name='job_list'),  # 背景工作
+    path('jobs/<int:job_id>/', views_admin.get_job, name='get_job'),
+    path('jobs/<int:job_id>/download/', views_admin.download_job_file, name='download_job_file'),
     path('courses/<int:course_id>/delete/', views_admin.delete_course, name='delete_course'),
     
     # ===== 課程查詢與篩選 API（必須在 courses/ 之前）=====
     path('courses/search/', views_course.search_courses, name='search_courses'),
     path('courses/filter-options/', views_course.get_filter_options, name='filter_options'),
+    path('courses/autocomplete/', views_course.autocomplete_courses, name='autocomplete_courses'),  # 搜尋框自動完成
+    path('courses/changes/', views_course.get_catalog_changes, name='catalog_changes'),  # 增量同步
+    path('courses/seats/stream/', views_stream.seat_stream, name='seat_stream'),  # 名額即時推播（SSE，需 ASGI）
     path('courses/<int:course_id>/detail/', views_course.get_course_detail, name='get_course_detail'),
+    path('courses/<int:course_id>/similar/', views_course.get_similar_courses, name='get_similar_courses'),  # 相似課程
     path('courses/<int:course_id>/update/', views_course.update_course, name='update_course'),
     
     # ===== 課程收藏 API =====
     path('courses/<int:course_id>/favorite/', views_course.toggle_favorite, name='toggle_favorite'),
     path('courses/favorites/', views_course.get_favorite_courses, name='get_favorite_courses'),
+    path('courses/planner/', views_course.plan_timetables, name='plan_timetables'),  # 排課規劃
     path('courses/my-teaching/', views_course.my_teaching_courses, name='my_teaching_courses'), # 教師授課列表
     
     # ===== 學生選課 API =====
     path('courses/<int:course_id>/enroll/', views_course.enroll_course, name='enroll_course'),
     path('courses/<int:course_id>/drop/', views_course.drop_course, name='drop_course'),
+    path('courses/<int:course_id>/waitlist/', views_course.get_waitlist_position, name='get_waitlist_position'),  # 候補順位
+    path('courses/preferences/', views_course.course_preferences, name='course_preferences'),  # 志願分發
     path('courses/enrolled/', views_course.get_enrolled_courses, name='get_enrolled_courses'),
+    path('courses/enrollments/export/', views_course.export_enrollments, name='export_enrollments'),  # 匯出選課名單（背景工作）
     path('courses/<int:course_id>/', views_admin.get_course_detail, name='course-detail'),
 
+    # ===== 非同步（ASGI）唯讀 API，參數與回傳格式同上方對應的端點 =====
+    path('async/courses/search/', views_async.search_courses, name='async_search_courses'),
+    path('async/courses/filter-options/', views_async.get_filter_options, name='async_filter_options'),
+    path('async/courses/enrolled/', views_async.get_enrolled_courses, name='async_get_enrolled_courses'),
+    path('async/courses/favorites/', views_async.get_favorite_courses, name='async_get_favorite_courses'),
+
     # ===== 帳號相關 API =====
     path('students/', views_account.get_all_students, name='get_all_students'),
     path('teachers/', views_account.get_all_teachers, name='get_all_teachers'),  # ← 保留這個
@@ -45,6 +66,8 @@ urlpatterns = [
     path('students/<int:user_id>/delete/', views_account.delete_student, name='delete_student'),
     path('teachers/<int:user_id>/delete/', views_account.delete_teacher, name='delete_teacher'),
     path('accounts/<int:user_id>/reset-password/', views_account.reset_password, name='reset_password'), # 重設密碼
+    path('accounts/bulk-create/', views_account.bulk_create_accounts, name='bulk_create_accounts'),  # 大量建立帳號（背景工作）
+    path('accounts/reset-passwords/', views_account.bulk_reset_passwords, name='bulk_reset_passwords'),  # 大量重設密碼（背景工作）
     
     # 大頭貼相關
     path('user/profile/', views_account.get_profile_info, name='get_profile_info'),
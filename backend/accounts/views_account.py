@@ -6,6 +6,9 @@ from django.contrib.auth.models import User
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import Profile, Role
+from .pagination import KeysetPagination, InvalidPageRequest, STUDENT_SORT_KEYS, TEACHER_SORT_KEYS
+from . import jobs, passwords
+from .views_admin import _is_admin
 from PIL import Image
 import base64
 import io
@@ -15,14 +18,18 @@ import io
 def get_all_students(request):
     """獲取所有學生帳號"""
     try:
+        # 排序與分頁（帶 cursor / page_size 參數時才分頁）
+        paginator = KeysetPagination(request, STUDENT_SORT_KEYS, default_sort='student_id')
+        
         # 獲取所有學生角色的用戶
         student_role = Role.objects.get(name='student')
         students = Profile.objects.filter(
             roles=student_role
         ).select_related('user').order_by('student_id')
+        students = paginator.sort(students)
         
         students_data = []
-        for profile in students:
+        for profile in paginator.paginate(students):
             students_data.append({
                 'id': profile.user.id,
                 'username': profile.user.username,
@@ -32,8 +39,10 @@ def get_all_students(request):
                 'grade': profile.grade,
             })
         
-        return Response(students_data)
+        return Response(paginator.wrap(students_data))
         
+    except InvalidPageRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         print(f"獲取學生列表錯誤: {str(e)}")
         import traceback
@@ -45,14 +54,18 @@ def get_all_students(request):
 def get_all_teachers(request):
     """獲取所有教師帳號"""
     try:
+        # 排序與分頁（帶 cursor / page_size 參數時才分頁）
+        paginator = KeysetPagination(request, TEACHER_SORT_KEYS, default_sort='real_name')
+        
         # 獲取所有教師角色的用戶
         teacher_role = Role.objects.get(name='teacher')
         teachers = Profile.objects.filter(
             roles=teacher_role
         ).select_related('user').order_by('real_name')
+        teachers = paginator.sort(teachers)
         
         teachers_data = []
-        for profile in teachers:
+        for profile in paginator.paginate(teachers):
             teachers_data.append({
                 'id': profile.user.id,
                 'username': profile.user.username,
@@ -62,8 +75,10 @@ def get_all_teachers(request):
                 'title': profile.title,
             })
         
-        return Response(teachers_data)
+        return Response(paginator.wrap(teachers_data))
         
+    except InvalidPageRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         print(f"獲取教師列表錯誤: {str(e)}")
         import traceback
@@ -374,21 +389,8 @@ def reset_password(request, user_id):
         if target_user.is_superuser:
             return Response({'error': '無法重設超級管理員密碼'}, status=403)
             
-        # 3. 設定預設密碼
-        default_pwd = target_user.username
-        if hasattr(target_user, 'profile'):
-            if target_user.profile.student_id:
-                default_pwd = target_user.profile.student_id
-            elif target_user.profile.teacher_id:
-                default_pwd = target_user.profile.teacher_id
-                
-        target_user.set_password(default_pwd)
-        target_user.save()
-        
-        # 4. 強制下次登入修改密碼
-        if hasattr(target_user, 'profile'):
-            target_user.profile.force_password_change = True
-            target_user.profile.save()
+        # 3. 設定預設密碼，並強制下次登入修改密碼
+        default_pwd = passwords.reset_to_default(target_user)
             
         print(f"管理員 {request.user.username} 重設了 {target_user.username} 的密碼")
             
@@ -403,4 +405,58 @@ def reset_password(request, user_id):
         print(f"重設密碼錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def bulk_reset_passwords(request):
+    """管理員大量重設密碼（背景工作），參數 user_ids，回傳 202 與工作狀態"""
+    try:
+        if not _is_admin(request.user):
+            return Response({'error': '權限不足'}, status=403)
+        
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list) or not user_ids:
+            return Response({'error': '請提供要重設的使用者 user_ids'}, status=400)
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'user_ids 必須是數字'}, status=400)
+        
+        job = jobs.submit('reset_passwords', {'user_ids': user_ids}, user=request.user)
+        print(f"管理員 {request.user.username} 大量重設 {len(user_ids)} 位使用者的密碼（背景工作 #{job.id}）")
+        return jobs.accepted_response(job)
+        
+    except Exception as e:
+        print(f"大量重設密碼錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def bulk_create_accounts(request):
+    """
+    管理員大量建立學生、教師帳號（背景工作）
+    參數 accounts：[{role, real_name, student_id / teacher_id, department, grade, office, title, email}]
+    帳號為學號或教師編號，密碼為預設密碼；回傳 202 與工作狀態，結果包含略過的資料列
+    """
+    try:
+        if not _is_admin(request.user):
+            return Response({'error': '權限不足'}, status=403)
+        
+        accounts = request.data.get('accounts')
+        if not isinstance(accounts, list) or not accounts:
+            return Response({'error': '請提供要建立的帳號 accounts'}, status=400)
+        if not all(isinstance(row, dict) for row in accounts):
+            return Response({'error': 'accounts 的每一筆必須是物件'}, status=400)
+        
+        job = jobs.submit('create_accounts', {'accounts': accounts}, user=request.user)
+        print(f"管理員 {request.user.username} 大量建立 {len(accounts)} 個帳號（背景工作 #{job.id}）")
+        return jobs.accepted_response(job)
+        
+    except Exception as e:
+        print(f"大量建立帳號錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
         return Response({'error': str(e)}, status=500)
\ No newline at end of file
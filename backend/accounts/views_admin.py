@@ -4,11 +4,20 @@
 包含教師列表、課程建立、課程刪除等功能
 支援多位教師（主開課和協同）
 """
+import os
+
 from django.contrib.auth.models import User
+from django.http import FileResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import Profile, Role, Course, CourseOffering, OfferingTeacher, ClassTime, Department
+from django.conf import settings
+from .models import Profile, Role, Course, CourseOffering, OfferingTeacher, ClassTime, Department, Job
+from .catalog_cache import cached_catalog_response
+from .pagination import KeysetPagination, InvalidPageRequest, OFFERING_SORT_KEYS
+from . import jobs, room_occupancy, scheduling, search_index, timeslots
+from .conflicts import check_class_time, conflict_response_data
+from .admission import WaitingRoom
 
 
 @api_view(['GET'])
@@ -151,6 +160,13 @@ def create_course(request):
                 co_teachers.append(teacher)
                 print(f"協同教師: {teacher_name}")
         
+        # 檢查教室與所有授課教師在這個時段是否已有課（查使用時段索引，見 conflicts.py），一次回傳所有衝突
+        conflicts = check_class_time(
+            classroom, [main_teacher, *co_teachers], academic_year, semester, weekday, start_period, end_period
+        )
+        if conflicts:
+            return Response(conflict_response_data(conflicts), status=400)
+        
         # 取得或建立系所
         department, _ = Department.objects.get_or_create(name=department_name)
         
@@ -310,129 +326,10 @@ def get_course_detail(request, course_id):
 def get_all_courses(request):
     """獲取所有開課資料（包含所有教師資訊），支持篩選"""
     try:
-        # 獲取查詢參數
-        academic_year = request.GET.get('academic_year', '')
-        semester = request.GET.get('semester', '')
-        department = request.GET.get('department', '')
-        grade_level = request.GET.get('grade_level', '')
-        keyword = request.GET.get('keyword', '').strip()
-        
-        print(f"管理員查詢課程 - 學年:{academic_year}, 學期:{semester}, 系所:{department}, 年級:{grade_level}, 關鍵字:{keyword}")
-        
-        # 基本查詢
-        offerings = CourseOffering.objects.all().select_related(
-            'course', 'department'
-        ).prefetch_related(
-            'offering_teachers__teacher__profile',
-            'class_times'
-        )
-        
-        # 應用篩選條件
-        if academic_year:
-            offerings = offerings.filter(academic_year=academic_year)
-        
-        if semester:
-            offerings = offerings.filter(semester=semester)
-        
-        if department:
-            offerings = offerings.filter(department__name=department)
-        
-        if grade_level:
-            offerings = offerings.filter(grade_level=int(grade_level))
-        
-        # 關鍵字搜尋（課程代碼、課程名稱、教師姓名）
-        if keyword:
-            from django.db.models import Q
-            offerings = offerings.filter(
-                Q(course__course_name__icontains=keyword) |
-                Q(course__course_code__icontains=keyword) |
-                Q(offering_teachers__teacher__profile__real_name__icontains=keyword)
-            ).distinct()
-        
-        # 排序
-        offerings = offerings.order_by('-created_at')
-        
-        print(f"找到 {offerings.count()} 門開課")
-        
-        courses_data = []
-        for offering in offerings:
-            # 取得第一個上課時段
-            first_time = offering.class_times.first()
-            
-            # 取得主要教師
-            main_teacher = offering.offering_teachers.filter(role='main').first()
-            
-            # 取得所有協同教師
-            co_teachers = offering.offering_teachers.filter(role='co').select_related('teacher__profile')
-            co_teacher_ids = [t.teacher.id for t in co_teachers]
-            co_teacher_names = [
-                t.teacher.profile.real_name if hasattr(t.teacher, 'profile') else t.teacher.username
-                for t in co_teachers
-            ]
-            
-            # 組合教師顯示文字
-            teacher_display = ''
-            if main_teacher:
-                main_name = main_teacher.teacher.profile.real_name if hasattr(main_teacher.teacher, 'profile') else main_teacher.teacher.username
-                if co_teacher_names:
-                    teacher_display = f"{main_name}（主）、{' 、 '.join(co_teacher_names)}"
-                else:
-                    teacher_display = main_name
-            else:
-                teacher_display = '未設定'
-            
-            courses_data.append({
-                'id': offering.id,
-                'course_code': offering.course.course_code,
-                'course_name': offering.course.course_name,
-                'course_type': offering.course.course_type,
-                'description': offering.course.description,
-                'credits': offering.course.credits,
-                'hours': offering.course.credits,  # 假設時數等於學分
-                'academic_year': offering.academic_year,
-                'semester': offering.semester,
-                'department': offering.department.name,
-                'grade_level': offering.grade_level,
-                'teacher_id': main_teacher.teacher.id if main_teacher else None,
-                'teacher_name': main_teacher.teacher.profile.real_name if main_teacher and hasattr(main_teacher.teacher, 'profile') else '未設定',
-                'teacher_display': teacher_display,  # 完整的教師顯示文字
-                'co_teachers': co_teacher_ids,  # 協同教師 ID 列表
-                'co_teacher_names': co_teacher_names,  # 協同教師名稱列表
-                'classroom': first_time.classroom if first_time else '',
-                'weekday': first_time.weekday if first_time else '',
-                'start_period': first_time.start_period if first_time else 0,
-                'end_period': first_time.end_period if first_time else 0,
-                'max_students': offering.max_students,
-                'current_students': offering.current_students,
-                'status': offering.status,
-            })
-        
-        print(f"返回 {len(courses_data)} 門開課資料")
-        return Response(courses_data)
-        
-    except Exception as e:
-        print(f"錯誤: {str(e)}")
-        import traceback
-        traceback.print_exc()({
-                'department': offering.department.name,
-                'grade_level': offering.grade_level,
-                'teacher_id': main_teacher.teacher.id if main_teacher else None,
-                'teacher_name': main_teacher.teacher.profile.real_name if main_teacher and hasattr(main_teacher.teacher, 'profile') else '未設定',
-                'teacher_display': teacher_display,  # 完整的教師顯示文字
-                'co_teachers': co_teacher_ids,  # 協同教師 ID 列表
-                'co_teacher_names': co_teacher_names,  # 協同教師名稱列表
-                'classroom': first_time.classroom if first_time else '',
-                'weekday': first_time.weekday if first_time else '',
-                'start_period': first_time.start_period if first_time else 0,
-                'end_period': first_time.end_period if first_time else 0,
-                'max_students': offering.max_students,
-                'current_students': offering.current_students,
-                'status': offering.status,
-            })
-        
-        print(f"找到 {len(courses_data)} 門開課")
-        return Response(courses_data)
+        return cached_catalog_response(request, 'all_courses', lambda: _all_courses_payload(request))
         
+    except InvalidPageRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         print(f"錯誤: {str(e)}")
         import traceback
@@ -440,6 +337,107 @@ def get_all_courses(request):
         return Response({'error': str(e)}, status=500)
 
 
+def _all_courses_payload(request):
+    """依篩選條件組出管理員課程列表資料"""
+    # 獲取查詢參數
+    academic_year = request.GET.get('academic_year', '')
+    semester = request.GET.get('semester', '')
+    department = request.GET.get('department', '')
+    grade_level = request.GET.get('grade_level', '')
+    keyword = request.GET.get('keyword', '').strip()
+    
+    # 排序與分頁（帶 cursor / page_size 參數時才分頁）
+    paginator = KeysetPagination(request, OFFERING_SORT_KEYS, default_sort='-created_at')
+    
+    print(f"管理員查詢課程 - 學年:{academic_year}, 學期:{semester}, 系所:{department}, 年級:{grade_level}, 關鍵字:{keyword}")
+    
+    # 基本查詢
+    offerings = CourseOffering.objects.all().select_related(
+        'course', 'department'
+    ).prefetch_related(
+        'offering_teachers__teacher__profile',
+        'class_times'
+    )
+    
+    # 應用篩選條件
+    if academic_year:
+        offerings = offerings.filter(academic_year=academic_year)
+    
+    if semester:
+        offerings = offerings.filter(semester=semester)
+    
+    if department:
+        offerings = offerings.filter(department__name=department)
+    
+    if grade_level:
+        offerings = offerings.filter(grade_level=int(grade_level))
+    
+    # 關鍵字搜尋（全文索引：課程名稱、代碼、教師姓名、描述），依相關度排序
+    if keyword:
+        offerings = search_index.apply_keyword_search(offerings, keyword)
+    else:
+        # 排序（預設依建立時間由新到舊）
+        offerings = offerings.order_by('-created_at')
+    
+    offerings = paginator.sort(offerings)
+    
+    courses_data = []
+    for offering in paginator.paginate(offerings):
+        # 取得第一個上課時段
+        first_time = offering.class_times.first()
+        
+        # 取得主要教師
+        main_teacher = offering.offering_teachers.filter(role='main').first()
+        
+        # 取得所有協同教師
+        co_teachers = offering.offering_teachers.filter(role='co').select_related('teacher__profile')
+        co_teacher_ids = [t.teacher.id for t in co_teachers]
+        co_teacher_names = [
+            t.teacher.profile.real_name if hasattr(t.teacher, 'profile') else t.teacher.username
+            for t in co_teachers
+        ]
+        
+        # 組合教師顯示文字
+        teacher_display = ''
+        if main_teacher:
+            main_name = main_teacher.teacher.profile.real_name if hasattr(main_teacher.teacher, 'profile') else main_teacher.teacher.username
+            if co_teacher_names:
+                teacher_display = f"{main_name}（主）、{' 、 '.join(co_teacher_names)}"
+            else:
+                teacher_display = main_name
+        else:
+            teacher_display = '未設定'
+        
+        courses_data.append({
+            'id': offering.id,
+            'course_code': offering.course.course_code,
+            'course_name': offering.course.course_name,
+            'course_type': offering.course.course_type,
+            'description': offering.course.description,
+            'credits': offering.course.credits,
+            'hours': offering.course.credits,  # 假設時數等於學分
+            'academic_year': offering.academic_year,
+            'semester': offering.semester,
+            'department': offering.department.name,
+            'grade_level': offering.grade_level,
+            'teacher_id': main_teacher.teacher.id if main_teacher else None,
+            'teacher_name': main_teacher.teacher.profile.real_name if main_teacher and hasattr(main_teacher.teacher, 'profile') else '未設定',
+            'teacher_display': teacher_display,  # 完整的教師顯示文字
+            'co_teachers': co_teacher_ids,  # 協同教師 ID 列表
+            'co_teacher_names': co_teacher_names,  # 協同教師名稱列表
+            'classroom': first_time.classroom if first_time else '',
+            'weekday': first_time.weekday if first_time else '',
+            'start_period': first_time.start_period if first_time else 0,
+            'end_period': first_time.end_period if first_time else 0,
+            'max_students': offering.max_students,
+            'current_students': offering.current_students,
+            'status': offering.status,
+        })
+    
+    print(f"返回 {len(courses_data)} 門開課資料")
+    return paginator.wrap(courses_data)
+
+
 @csrf_exempt
 @api_view(['DELETE'])
 def delete_course(request, course_id):
@@ -456,4 +454,222 @@ def delete_course(request, course_id):
         return Response({'error': '找不到該開課資料'}, status=404)
     except Exception as e:
         print(f"刪除課程錯誤: {str(e)}")
-        return Response({'error': str(e)}, status=500)
\ No newline at end of file
+        return Response({'error': str(e)}, status=500)
+
+
+# ===== 教室 =====
+
+@api_view(['GET'])
+def get_available_classrooms(request):
+    """
+    查詢空教室：這學期指定時段沒有課的教室
+    參數：academic_year、semester、weekday、start_period、end_period（必填）、min_capacity
+    """
+    try:
+        academic_year = request.GET.get('academic_year', '').strip()
+        semester = request.GET.get('semester', '').strip()
+        try:
+            weekday = int(request.GET.get('weekday', ''))
+            start_period = int(request.GET.get('start_period', ''))
+            end_period = int(request.GET.get('end_period', start_period))
+            min_capacity = int(request.GET.get('min_capacity', 0))
+        except ValueError:
+            return Response({'error': 'weekday、start_period、end_period、min_capacity 必須是整數'}, status=400)
+        
+        mask = timeslots.class_time_mask(weekday, start_period, end_period)
+        if not academic_year or not semester or not mask:
+            return Response({'error': '缺少學年度、學期，或時段不正確'}, status=400)
+        
+        rooms = room_occupancy.available_rooms(academic_year, semester, mask, min_capacity)
+        return Response([
+            {'id': room.id, 'name': room.name, 'building': room.building, 'capacity': room.capacity}
+            for room in rooms
+        ])
+        
+    except Exception as e:
+        print(f"查詢空教室錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+# ===== 學期自動排課 =====
+
+def _is_admin(user):
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    return hasattr(user, 'profile') and user.profile.roles.filter(name='admin').exists()
+
+
+@api_view(['POST'])
+def propose_schedule(request):
+    """
+    產生學期排課方案（不寫入資料庫）
+    參數：academic_year、semester（必填）、offering_ids（要重排的開課，預設整個學期）、
+          rooms（可用教室，預設為所有可排課的教室）、time_limit（秒）、seed
+    """
+    try:
+        if not _is_admin(request.user):
+            return Response({'error': '權限不足'}, status=403)
+        
+        academic_year = request.data.get('academic_year')
+        semester = request.data.get('semester')
+        if not academic_year or not semester:
+            return Response({'error': '缺少學年度或學期'}, status=400)
+        
+        try:
+            offering_ids = [int(i) for i in request.data.get('offering_ids') or []]
+            time_limit = min(float(request.data.get('time_limit', settings.SCHEDULE_TIME_LIMIT)), settings.SCHEDULE_TIME_LIMIT)
+            seed = int(request.data.get('seed', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'offering_ids、time_limit、seed 必須是數字'}, status=400)
+        rooms = [str(room).strip() for room in request.data.get('rooms') or [] if str(room).strip()]
+        
+        problem = scheduling.load_problem(academic_year, semester, offering_ids, rooms)
+        result = scheduling.solve(problem, time_limit=time_limit, seed=seed)
+        plan = scheduling.plan_to_json(problem, result)
+        
+        print(f"排課方案: {len(plan['assignments'])} 門已排、{len(plan['unassigned'])} 門無法排入，成本 {plan['cost']}")
+        return Response(plan)
+        
+    except scheduling.ScheduleError as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"排課錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def apply_schedule(request):
+    """
+    套用排課方案（propose_schedule 回傳的 assignments，可只傳要變動的部分）
+    寫入前重新檢查教師、教室、必修課衝堂；有衝突時回傳 409，不寫入任何資料
+    """
+    try:
+        if not _is_admin(request.user):
+            return Response({'error': '權限不足'}, status=403)
+        
+        academic_year = request.data.get('academic_year')
+        semester = request.data.get('semester')
+        assignments = request.data.get('assignments')
+        if not academic_year or not semester or not isinstance(assignments, list):
+            return Response({'error': '缺少學年度、學期或 assignments'}, status=400)
+        
+        updated, conflicts = scheduling.apply_plan(academic_year, semester, assignments)
+        if conflicts:
+            return Response({'error': '方案與目前的課表衝突', 'conflicts': conflicts}, status=409)
+        
+        print(f"排課方案已套用: {updated} 門開課")
+        return Response({'message': '排課方案已套用', 'updated': updated})
+        
+    except scheduling.ScheduleError as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"套用排課方案錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_admission_metrics(request):
+    """選課排隊狀況（排隊人數、執行中請求數、平均等待與執行時間，見 admission.py）"""
+    try:
+        if not _is_admin(request.user):
+            return Response({'error': '權限不足'}, status=403)
+        
+        return Response(WaitingRoom('enrollment').metrics())
+        
+    except Exception as e:
+        print(f"取得排隊狀況錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+# ===== 背景工作 =====
+
+def _can_view_job(user, job):
+    return _is_admin(user) or (user.is_authenticated and job.created_by_id == user.id)
+
+
+@api_view(['GET', 'POST'])
+def job_list(request):
+    """
+    GET：最近的背景工作（管理員看全部，其他人只看自己建立的）
+    POST：建立背景工作，參數 kind（settings.JOB_HANDLERS 的種類）、params，回傳 202 與工作狀態
+    """
+    try:
+        if not request.user.is_authenticated:
+            return Response({'error': '請先登入'}, status=401)
+        
+        if request.method == 'POST':
+            if not _is_admin(request.user):
+                return Response({'error': '權限不足'}, status=403)
+            params = request.data.get('params') or {}
+            if not isinstance(params, dict):
+                return Response({'error': 'params 必須是物件'}, status=400)
+            job = jobs.submit(request.data.get('kind'), params, user=request.user)
+            print(f"建立背景工作 #{job.id} {job.kind}（{request.user.username}）")
+            return jobs.accepted_response(job)
+        
+        queryset = Job.objects.all() if _is_admin(request.user) else Job.objects.filter(created_by=request.user)
+        kind = request.GET.get('kind')
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        return Response([jobs.job_data(job) for job in queryset[:50]])
+        
+    except jobs.JobError as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"背景工作錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_job(request, job_id):
+    """查詢背景工作的狀態、進度與結果"""
+    try:
+        job = Job.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({'error': '找不到該工作'}, status=404)
+        if not _can_view_job(request.user, job):
+            return Response({'error': '權限不足'}, status=403)
+        
+        return Response(jobs.job_data(job))
+        
+    except Exception as e:
+        print(f"查詢背景工作錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def download_job_file(request, job_id):
+    """下載背景工作產生的檔案（例如匯出的 CSV）"""
+    try:
+        job = Job.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({'error': '找不到該工作'}, status=404)
+        if not _can_view_job(request.user, job):
+            return Response({'error': '權限不足'}, status=403)
+        
+        filename = (job.result or {}).get('file') if job.status == 'succeeded' else None
+        path = os.path.join(settings.JOB_EXPORT_DIR, os.path.basename(filename)) if filename else None
+        if not path or not os.path.exists(path):
+            return Response({'error': '這個工作沒有可下載的檔案'}, status=404)
+        
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
+        
+    except Exception as e:
+        print(f"下載背景工作檔案錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+課程目錄唯讀 API 的非同步版本（需透過 ASGI 執行，見 backend/asgi.py）
+使用 Django async ORM，等待資料庫時不佔用 worker，適合大量並行的查詢請求
+
+DRF 的 @api_view 不支援 async，因此這裡是一般的 Django async view；
+查詢條件、欄位、分頁與快取沿用同步版本，回傳格式與 /api/courses/... 完全相同
+"""
+import math
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.renderers import JSONRenderer
+
+from .models import CourseOffering, Department, Enrollment, FavoriteCourse
+from .catalog_cache import acached_catalog_response
+from . import throttling
+from .pagination import InvalidPageRequest
+from .offering_fields import (
+    InvalidFieldsRequest, parse_fields, apply_field_projection, serialize_offering,
+    FAVORITE_DEFAULT_FIELDS, ENROLLED_DEFAULT_FIELDS,
+)
+from .views_course import _search_courses_query, _filter_options_data, _with_facets
+
+
+def _json_response(data, status=200):
+    """與 DRF Response 相同的 JSON 輸出"""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+@require_GET
+async def search_courses(request):
+    """搜尋課程（參數同 /api/courses/search/ 的 GET）"""
+    try:
+        user = await request.auser()
+        wait = throttling.check('search', user.pk if user.is_authenticated else None, throttling.client_ip(request))
+        if wait:
+            response = _json_response(throttling.throttled_data(wait), status=429)
+            response['Retry-After'] = str(math.ceil(wait))
+            return response
+
+        return await acached_catalog_response(
+            request, 'search_courses',
+            lambda: _search_courses_payload(request, user),
+            user, per_user=True
+        )
+
+    except (InvalidPageRequest, InvalidFieldsRequest) as e:
+        return _json_response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"搜尋課程錯誤（async）: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return _json_response({'error': str(e)}, status=500)
+
+
+async def _search_courses_payload(request, user):
+    offerings, fields, paginator, facet_query = _search_courses_query(request, user)
+
+    context = {'favorite_ids': set()}
+    if 'is_favorited' in fields and user.is_authenticated:
+        context['favorite_ids'] = {
+            offering_id async for offering_id in FavoriteCourse.objects.filter(
+                student=user
+            ).values_list('offering_id', flat=True)
+        }
+
+    courses_data = [
+        serialize_offering(offering, fields, context)
+        for offering in await paginator.apaginate(offerings)
+    ]
+
+    print(f"找到 {len(courses_data)} 門課程（async）")
+    data = paginator.wrap(courses_data)
+    if facet_query is not None:
+        data = _with_facets(data, await facet_query.acounts())
+    return data
+
+
+@require_GET
+async def get_filter_options(request):
+    """取得篩選選項（系所、學期等）"""
+    try:
+        user = await request.auser()
+        return await acached_catalog_response(request, 'filter_options', _filter_options_payload, user)
+
+    except Exception as e:
+        print(f"取得篩選選項錯誤（async）: {str(e)}")
+        return _json_response({'error': str(e)}, status=500)
+
+
+async def _filter_options_payload():
+    departments = [
+        name async for name in Department.objects.all().values_list('name', flat=True).distinct()
+    ]
+    academic_years = [
+        year async for year in CourseOffering.objects.values_list(
+            'academic_year', flat=True
+        ).distinct().order_by('-academic_year')
+    ]
+    return _filter_options_data(departments, academic_years)
+
+
+@require_GET
+async def get_enrolled_courses(request):
+    """取得已選課程"""
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return _json_response([])
+
+        academic_year = request.GET.get('academic_year', '114')
+        semester = request.GET.get('semester', '1')
+
+        fields = parse_fields(request.GET.get('fields', ''), ENROLLED_DEFAULT_FIELDS, extra_fields=['enrolled_at'])
+
+        enrollments = apply_field_projection(
+            Enrollment.objects.filter(
+                student=user,
+                status='enrolled',
+                offering__academic_year=academic_year,
+                offering__semester=semester
+            ),
+            fields, prefix='offering', extra_only=['enrolled_at']
+        )
+
+        courses_data = []
+        async for enrollment in enrollments:
+            courses_data.append(serialize_offering(enrollment.offering, fields, extras={
+                'enrolled_at': lambda: enrollment.enrolled_at.strftime('%Y-%m-%d %H:%M:%S'),
+            }))
+
+        return _json_response(courses_data)
+
+    except InvalidFieldsRequest as e:
+        return _json_response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"錯誤（async）: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return _json_response({'error': str(e)}, status=500)
+
+
+@require_GET
+async def get_favorite_courses(request):
+    """取得收藏的課程"""
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return _json_response({'error': '請先登入'}, status=401)
+
+        fields = parse_fields(request.GET.get('fields', ''), FAVORITE_DEFAULT_FIELDS, extra_fields=['favorited_at'])
+
+        favorites = apply_field_projection(
+            FavoriteCourse.objects.filter(student=user),
+            fields, prefix='offering', extra_only=['created_at']
+        )
+
+        courses_data = []
+        async for favorite in favorites:
+            courses_data.append(serialize_offering(favorite.offering, fields, extras={
+                'is_favorited': lambda: True,
+                'favorited_at': lambda: favorite.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            }))
+
+        return _json_response(courses_data)
+
+    except InvalidFieldsRequest as e:
+        return _json_response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"錯誤（async）: {str(e)}")
+        return _json_response({'error': str(e)}, status=500)
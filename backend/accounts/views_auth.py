@@ -7,9 +7,10 @@ from django.contrib.auth import authenticate, login as django_login, logout as d
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.middleware.csrf import get_token
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
 from .models import Profile, Role
+from .throttling import LoginThrottle
 
 
 @csrf_exempt
@@ -80,8 +81,11 @@ def register(request):
 
 @csrf_exempt
 @api_view(['POST'])
+@throttle_classes([LoginThrottle])
 def login_view(request):
     """使用者登入"""
+    if not isinstance(request.data, dict):
+        return Response({'error': '請提供帳號與密碼'}, status=400)
     username = request.data.get('username')
     password = request.data.get('password')
 
@@ -5,160 +5,392 @@
 """
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q
-from rest_framework.decorators import api_view
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.db.models import OuterRef, Q
+from django.conf import settings
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
-from .models import CourseOffering, Enrollment, FavoriteCourse, Profile
+from .models import CourseOffering, CourseSimilarity, Department, Enrollment, FavoriteCourse, OfferingSearchDocument, Profile, WaitlistEntry, AllocationRound, CoursePreference
+from .catalog_cache import cached_catalog_response
+from .catalog_sync import current_version, needs_full_resync, collect_changes
+from .pubsub import publish_seat_change
+from .admission import admission_control
+from .throttling import EnrollThrottle, FavoriteThrottle, SearchThrottle
+from .idempotency import idempotent
+from .views_admin import _is_admin
+from . import allocation, autocomplete, bm25, facets, jobs, planner, search_index, timeslots, waitlist
+from .conflicts import check_class_time, conflict_response_data
+from .pagination import KeysetPagination, InvalidPageRequest, SEARCH_SORT_KEYS
+from .offering_fields import (
+    InvalidFieldsRequest, parse_fields, apply_field_projection, serialize_offering,
+    SEARCH_DEFAULT_FIELDS, FAVORITE_DEFAULT_FIELDS, ENROLLED_DEFAULT_FIELDS, SIMILAR_DEFAULT_FIELDS,
+    PLANNER_DEFAULT_FIELDS,
+)
 import openpyxl
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from io import BytesIO
 
 
 @api_view(['GET', 'POST'])
+@throttle_classes([SearchThrottle])
 def search_courses(request):
     """搜尋課程"""
     try:
-        # 支持 GET 和 POST 兩種方式取得參數
+        # GET 查詢走目錄快取（內容含 is_favorited，因此依使用者區分）
         if request.method == 'GET':
-            keyword = request.GET.get('keyword', '').strip()
-            department = request.GET.get('department', '').strip()
-            course_type = request.GET.get('course_type', '').strip()
-            semester = request.GET.get('semester', '').strip()
-            grade_level = request.GET.get('grade_level', '').strip()
-            academic_year = request.GET.get('academic_year', '114')
-            
-            # 取得複選參數（陣列）
-            weekdays = request.GET.getlist('weekdays')  # ← 改這裡
-            periods = request.GET.getlist('periods')    # ← 加這行
-        else:  # POST
-            keyword = request.data.get('keyword', '').strip()
-            department = request.data.get('department', '').strip()
-            course_type = request.data.get('course_type', '').strip()
-            semester = request.data.get('semester', '').strip()
-            grade_level = request.data.get('grade_level', '').strip()
-            academic_year = request.data.get('academic_year', '114')
-            
-            # 取得複選參數（陣列）
-            weekdays = request.data.get('weekdays', [])  # ← 改這裡
-            periods = request.data.get('periods', [])    # ← 加這行
+            return cached_catalog_response(
+                request, 'search_courses',
+                lambda: _search_courses_payload(request),
+                per_user=True
+            )
+        return Response(_search_courses_payload(request))
         
-        print(f"搜尋條件: keyword={keyword}, department={department}, course_type={course_type}, semester={semester}, weekdays={weekdays}, periods={periods}, grade_level={grade_level}, academic_year={academic_year}")
+    except (InvalidPageRequest, InvalidFieldsRequest) as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"搜尋課程錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+def _search_courses_payload(request):
+    """依搜尋條件組出課程列表資料"""
+    offerings, fields, paginator, facet_query = _search_courses_query(request, request.user)
+    
+    # 一次取出使用者收藏的開課 ID，避免每門課各查一次
+    context = {'favorite_ids': set()}
+    if 'is_favorited' in fields and request.user.is_authenticated:
+        context['favorite_ids'] = set(FavoriteCourse.objects.filter(
+            student=request.user
+        ).values_list('offering_id', flat=True))
+    
+    # 組裝回傳資料
+    courses_data = [
+        serialize_offering(offering, fields, context)
+        for offering in paginator.paginate(offerings)
+    ]
+    
+    print(f"找到 {len(courses_data)} 門課程")
+    data = paginator.wrap(courses_data)
+    if facet_query is not None:
+        data = _with_facets(data, facet_query.counts())
+    return data
+
+
+def _with_facets(data, facet_counts):
+    """facets=1 時附上分面數量；未分頁的列表改包成 {'results': [...], 'facets': {...}}"""
+    if isinstance(data, list):
+        data = {'results': data}
+    data['facets'] = facet_counts
+    return data
+
+
+def _search_courses_query(request, user):
+    """
+    解析搜尋參數並建立查詢（尚未執行），回傳 (queryset, fields, paginator, facet_query)
+    facet_query：帶 facets=1 參數時為 FacetQuery（見 facets.py），否則為 None
+    user：目前使用者（free_slots_only 使用；async view 需先以 await request.auser() 取得）
+    同步與非同步（views_async）版本共用
+    """
+    # 支持 GET 和 POST 兩種方式取得參數
+    if request.method == 'GET':
+        keyword = request.GET.get('keyword', '').strip()
+        department = request.GET.get('department', '').strip()
+        course_type = request.GET.get('course_type', '').strip()
+        semester = request.GET.get('semester', '').strip()
+        grade_level = request.GET.get('grade_level', '').strip()
+        academic_year = request.GET.get('academic_year', '114')
         
-        # 基本查詢：取得所有開課資料
-        offerings = CourseOffering.objects.select_related(
-            'course', 'department'
-        ).prefetch_related(
-            'offering_teachers__teacher__profile',
-            'class_times'
-        ).filter(
-            academic_year=academic_year
-        )
+        # 取得複選參數（陣列）
+        weekdays = request.GET.getlist('weekdays')  # ← 改這裡
+        periods = request.GET.getlist('periods')    # ← 加這行
+        
+        # 稀疏欄位（例如 fields=id,course_name,current_students）
+        raw_fields = request.GET.get('fields', '')
+        want_facets = request.GET.get('facets', '') in ('1', 'true')
+        free_slots_only = request.GET.get('free_slots_only', '') in ('1', 'true')
+    else:  # POST
+        keyword = request.data.get('keyword', '').strip()
+        department = request.data.get('department', '').strip()
+        course_type = request.data.get('course_type', '').strip()
+        semester = request.data.get('semester', '').strip()
+        grade_level = request.data.get('grade_level', '').strip()
+        academic_year = request.data.get('academic_year', '114')
+        
+        # 取得複選參數（陣列）
+        weekdays = request.data.get('weekdays', [])  # ← 改這裡
+        periods = request.data.get('periods', [])    # ← 加這行
+        
+        raw_fields = request.data.get('fields', '')
+        want_facets = request.data.get('facets', False) in (True, 1, '1', 'true')
+        free_slots_only = request.data.get('free_slots_only', False) in (True, 1, '1', 'true')
+    
+    fields = parse_fields(raw_fields, SEARCH_DEFAULT_FIELDS)
+    
+    # 排序與分頁（帶 cursor / page_size 參數時才分頁）
+    paginator = KeysetPagination(request, SEARCH_SORT_KEYS, default_sort='course_code')
+    
+    print(f"搜尋條件: keyword={keyword}, department={department}, course_type={course_type}, semester={semester}, weekdays={weekdays}, periods={periods}, grade_level={grade_level}, academic_year={academic_year}")
+    
+    # 篩選條件只查開課搜尋文件（每門開課一筆的反正規化資料表），
+    # 不必 JOIN 課程、系所、時段，也不需要 distinct
+    documents = OfferingSearchDocument.objects.filter(academic_year=academic_year)
+    
+    # 應用篩選條件
+    if semester:
+        documents = documents.filter(semester=semester)
+    
+    # 節次篩選（支援多選）：任一天的這些節次有課
+    if periods:
+        documents = timeslots.overlapping(documents, timeslots.periods_mask(periods))
+    
+    # 只顯示與已選課程不衝堂的開課：排除與同學年度、同學期任一門已選課程時段重疊的文件
+    # （未登入時沒有課表，不篩選）
+    if free_slots_only and user.is_authenticated:
+        documents = timeslots.not_overlapping_any(documents, OfferingSearchDocument.objects.filter(
+            offering__enrollments__student=user,
+            offering__enrollments__status='enrolled',
+            academic_year=OuterRef('academic_year'),
+            semester=OuterRef('semester'),
+        ))
+    
+    # 以下四個條件同時也是分面，分面數量以套用上面條件的文件為基礎（見 facets.py）
+    facet_documents = documents
+    selected = {}
+    
+    if department:
+        documents = documents.filter(department_id__in=Department.objects.filter(name=department).values('id'))
+        selected['department'] = department
+    
+    if course_type:
+        documents = documents.filter(course_type=course_type)
+        selected['course_type'] = course_type
+    
+    if grade_level:
+        documents = documents.filter(grade_level=int(grade_level))
+        selected['grade_level'] = int(grade_level)
+    
+    # 星期幾篩選（支援多選）：當天任一節有課
+    if weekdays:
+        documents = timeslots.overlapping(documents, timeslots.weekdays_mask(weekdays))
+        selected['weekdays'] = facets.weekday_bits(weekdays)
+    
+    offerings = _apply_keyword(
+        CourseOffering.objects.filter(id__in=documents.values('offering_id')), keyword, paginator
+    )
+    offerings = paginator.sort(apply_field_projection(offerings, fields))
+    
+    facet_query = None
+    if want_facets:
+        if keyword:
+            facet_documents = facet_documents.filter(
+                offering_id__in=_apply_keyword(CourseOffering.objects.all(), keyword, paginator).values('id')
+            )
+        # free_slots_only 的分面快取鍵要區分使用者與其選課紀錄版本（版本號在 FacetQuery 取得快取時才查詢）
+        facet_query = facets.FacetQuery(facet_documents, selected, key_parts=(
+            academic_year, semester, sorted(map(str, periods)), keyword,
+            paginator.sort_name == 'relevance', sorted(selected.items()),
+        ), user_id=user.id if free_slots_only and user.is_authenticated else None)
+    
+    return offerings, fields, paginator, facet_query
+
+
+def _apply_keyword(offerings, keyword, paginator):
+    """關鍵字搜尋"""
+    if paginator.sort_name == 'relevance':
+        # sort=relevance：依課程名稱與描述的 BM25 相關度排序
+        return bm25.apply_relevance(offerings, keyword)
+    if keyword:
+        # 全文索引，依相關度排序
+        return search_index.apply_keyword_search(offerings, keyword)
+    return offerings
+
+
+@api_view(['GET'])
+def autocomplete_courses(request):
+    """
+    搜尋框自動完成：課程名稱、課程代碼、英文名稱、教師姓名
+    參數：q（輸入中的文字）、limit（預設 10，最多 20）
+    由記憶體中的索引回應，不查資料庫（見 autocomplete.py）
+    """
+    try:
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = min(max(int(request.GET.get('limit', 10)), 1), autocomplete.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit 必須是整數'}, status=400)
         
-        # 應用篩選條件
-        if semester:
-            offerings = offerings.filter(semester=semester)
-        
-        if department:
-            offerings = offerings.filter(department__name=department)
-        
-        if course_type:
-            offerings = offerings.filter(course__course_type=course_type)
-        
-        if grade_level:
-            offerings = offerings.filter(grade_level=int(grade_level))
-        
-        # 星期幾篩選（支援多選）
-        if weekdays:
-            offerings = offerings.filter(class_times__weekday__in=weekdays).distinct()
-        
-        # 節次篩選（支援多選）- 新增這段
-        if periods:
-            # 建立 Q 查詢來檢查時段是否有交集
-            period_query = Q()
-            for period in periods:
-                period_int = int(period)
-                # 檢查該節次是否在 start_period 和 end_period 之間
-                period_query |= Q(
-                    class_times__start_period__lte=period_int,
-                    class_times__end_period__gte=period_int
-                )
-            offerings = offerings.filter(period_query).distinct()
+        if not query:
+            return Response([])
         
-        # 關鍵字搜尋
-        if keyword:
-            offerings = offerings.filter(
-                Q(course__course_name__icontains=keyword) |
-                Q(course__course_code__icontains=keyword) |
-                Q(offering_teachers__teacher__profile__real_name__icontains=keyword)
-            ).distinct()
+        return Response(autocomplete.search(query, limit))
         
-        # 組裝回傳資料
-        courses_data = []
-        for offering in offerings:
-            # 取得所有上課時段
-            class_times = offering.class_times.all()
-            times_data = []
-            for ct in class_times:
-                times_data.append({
-                    'weekday': ct.weekday,
-                    'weekday_display': ct.get_weekday_display(),
-                    'start_period': ct.start_period,
-                    'end_period': ct.end_period,
-                    'classroom': ct.classroom
-                })
-            
-            # 取得所有教師
-            teachers = offering.offering_teachers.all()
-            teachers_data = []
-            for ot in teachers:
-                teacher_name = ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
-                teachers_data.append({
-                    'id': ot.teacher.id,
-                    'name': teacher_name,
-                    'role': ot.role,
-                    'role_display': ot.get_role_display()
-                })
-            
-            # 檢查是否已收藏
-            is_favorited = False
-            if request.user.is_authenticated:
-                is_favorited = FavoriteCourse.objects.filter(
-                    student=request.user,
-                    offering=offering
-                ).exists()
-            
-            courses_data.append({
-                'id': offering.id,
-                'course_code': offering.course.course_code,
-                'course_name': offering.course.course_name,
-                'course_type': offering.course.course_type,
-                'course_type_display': offering.course.get_course_type_display(),
-                'credits': offering.course.credits,
-                'description': offering.course.description,
-                'academic_year': offering.academic_year,
-                'semester': offering.semester,
-                'semester_display': offering.get_semester_display(),
-                'department': offering.department.name,
-                'grade_level': offering.grade_level,
-                'teachers': teachers_data,
-                'class_times': times_data,
-                'max_students': offering.max_students,
-                'current_students': offering.current_students,
-                'status': offering.status,
-                'status_display': offering.get_status_display(),
-                'is_favorited': is_favorited,
-            })
+    except Exception as e:
+        print(f"自動完成錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_similar_courses(request, course_id):
+    """
+    相似課程：同學年度、同學期中與這門開課最相似的其他開課
+    參數：limit（預設 5，最多 20）、fields
+    相似度由 compute_similar_courses 批次計算，這裡只查表（並走目錄快取）
+    """
+    try:
+        try:
+            limit = min(max(int(request.GET.get('limit', 5)), 1), 20)
+        except ValueError:
+            return Response({'error': 'limit 必須是整數'}, status=400)
         
-        print(f"找到 {len(courses_data)} 門課程")
-        return Response(courses_data)
+        fields = parse_fields(request.GET.get('fields', ''), SIMILAR_DEFAULT_FIELDS, extra_fields=['similarity'])
+        
+        try:
+            offering = CourseOffering.objects.only('id', 'course', 'academic_year', 'semester').get(id=course_id)
+        except CourseOffering.DoesNotExist:
+            return Response({'error': '找不到該課程'}, status=404)
+        
+        # 同一門課程、同學期的各開課班級結果相同，快取以課程為單位
+        return cached_catalog_response(
+            request, f'similar_courses:{offering.course_id}:{offering.academic_year}:{offering.semester}',
+            lambda: _similar_courses_payload(request, offering, fields, limit),
+            per_user='is_favorited' in fields
+        )
         
+    except InvalidFieldsRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
-        print(f"搜尋課程錯誤: {str(e)}")
+        print(f"取得相似課程錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+def _similar_courses_payload(request, offering, fields, limit):
+    """依預先計算的相似度組出同學期的相似開課"""
+    scores = dict(CourseSimilarity.objects.filter(
+        course_id=offering.course_id
+    ).values_list('similar_course_id', 'score'))
+    if not scores:
+        return []
+    
+    similar = apply_field_projection(
+        CourseOffering.objects.filter(
+            course_id__in=list(scores),
+            academic_year=offering.academic_year,
+            semester=offering.semester
+        ),
+        fields, extra_only=['course']
+    )
+    similar = sorted(similar, key=lambda o: (-scores[o.course_id], o.id))[:limit]
+    
+    context = {'favorite_ids': set()}
+    if 'is_favorited' in fields and request.user.is_authenticated:
+        context['favorite_ids'] = set(FavoriteCourse.objects.filter(
+            student=request.user
+        ).values_list('offering_id', flat=True))
+    
+    return [
+        serialize_offering(o, fields, context, extras={
+            'similarity': lambda o=o: round(scores[o.course_id], 4),
+        })
+        for o in similar
+    ]
+
+
+@api_view(['GET'])
+def get_catalog_changes(request):
+    """
+    增量同步：取得某版本（或某時間）之後異動的開課
+    參數：since_version 或 since（ISO 時間），academic_year、semester、fields
+    兩者皆未提供時回傳完整目錄（full_resync=True），客戶端據此建立初始資料
+    不走目錄快取：回傳的版本號只算已超過等待時間的異動（見 catalog_sync.current_version），
+    等待時間過後沒有任何版本號遞增，快取會一直回傳舊的版本號與空的異動
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields', ''), SEARCH_DEFAULT_FIELDS)
+        return Response(_catalog_changes_payload(request, fields))
+        
+    except (InvalidFieldsRequest, ValueError) as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"取得目錄異動錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         return Response({'error': str(e)}, status=500)
 
 
+def _catalog_changes_payload(request, fields):
+    """組出增量同步資料"""
+    raw_version = request.GET.get('since_version', '').strip()
+    raw_since = request.GET.get('since', '').strip()
+    academic_year = request.GET.get('academic_year', '').strip()
+    semester = request.GET.get('semester', '').strip()
+    
+    since_version = None
+    since = None
+    if raw_version:
+        try:
+            since_version = int(raw_version)
+        except ValueError:
+            raise ValueError('since_version 必須是整數')
+    elif raw_since:
+        since = parse_datetime(raw_since)
+        if since is None:
+            raise ValueError('since 必須是 ISO 8601 時間格式')
+    
+    # 先記下版本號再讀資料，之後的異動會在下一次同步取得
+    version = current_version()
+    full_resync = (
+        (since_version is None and since is None) or
+        (since_version is not None and needs_full_resync(since_version))
+    )
+    
+    offerings = CourseOffering.objects.all()
+    if academic_year:
+        offerings = offerings.filter(academic_year=academic_year)
+    if semester:
+        offerings = offerings.filter(semester=semester)
+    
+    deleted_ids = set()
+    if not full_resync:
+        upsert_ids, deleted_ids = collect_changes(since_version, since, up_to_version=version)
+        offerings = offerings.filter(id__in=upsert_ids)
+    
+    offerings = apply_field_projection(offerings.order_by('id'), fields)
+    
+    context = {'favorite_ids': set()}
+    if 'is_favorited' in fields and request.user.is_authenticated:
+        context['favorite_ids'] = set(FavoriteCourse.objects.filter(
+            student=request.user
+        ).values_list('offering_id', flat=True))
+    
+    changed = [serialize_offering(offering, fields, context) for offering in offerings]
+    
+    if not full_resync:
+        # 異動紀錄中標記為更新、但已不存在的開課也當作刪除
+        missing_ids = upsert_ids - set(
+            CourseOffering.objects.filter(id__in=upsert_ids).values_list('id', flat=True)
+        )
+        deleted_ids |= missing_ids
+    
+    print(f"目錄同步: since_version={since_version}, since={since}, 版本={version}, 異動 {len(changed)} 筆, 刪除 {len(deleted_ids)} 筆")
+    return {
+        'version': version,
+        'full_resync': full_resync,
+        'changed': changed,
+        'deleted': sorted(deleted_ids),
+    }
+
+
+@admission_control('enrollment')
 @api_view(['POST'])
+@throttle_classes([EnrollThrottle])
+@idempotent
 def enroll_course(request, course_id):
     """選課"""
     try:
@@ -170,37 +402,64 @@ def enroll_course(request, course_id):
         if not offering_id:
             return Response({'error': '缺少開課 ID'}, status=400)
         
-        try:
-            offering = CourseOffering.objects.get(id=offering_id)
-        except CourseOffering.DoesNotExist:
-            return Response({'error': '找不到該課程'}, status=404)
-        
-        # 檢查是否已選課
-        if Enrollment.objects.filter(student=request.user, offering=offering, status='enrolled').exists():
-            return Response({'error': '已經選過這門課'}, status=400)
-        
-        # 檢查是否額滿
-        if offering.is_full():
-            return Response({'error': '課程已額滿'}, status=400)
-        
-        # 建立選課記錄
-        enrollment = Enrollment.objects.create(
-            student=request.user,
-            offering=offering,
-            status='enrolled'
-        )
-        
-        # 檢查時段衝突
-        has_conflict, conflict_msg = enrollment.check_time_conflict()
-        if has_conflict:
-            enrollment.delete()
-            return Response({'error': conflict_msg}, status=400)
-        
-        # 更新目前人數
-        offering.current_students += 1
-        if offering.current_students >= offering.max_students:
-            offering.status = 'full'
-        offering.save()
+        # 鎖住開課：名額的判斷與更新不會和其他選課、退選交錯
+        with transaction.atomic():
+            try:
+                offering = CourseOffering.objects.select_for_update().select_related('course').get(id=offering_id)
+            except CourseOffering.DoesNotExist:
+                return Response({'error': '找不到該課程'}, status=404)
+            
+            # 學期採志願分發時，分發完成前不開放一般選課
+            allocation_round = allocation.pending_round(offering.academic_year, offering.semester)
+            if allocation_round:
+                return Response({
+                    'error': f'本學期採志願分發，請於 {allocation.window_display(allocation_round)} 填寫志願'
+                }, status=400)
+            
+            # 有空位但仍有人在候補（調高名額、人數校正後）：先依順序遞補，後來的人不能插隊；
+            # 之後還在候補的都是衝堂而暫時略過的學生，空位可以開放給其他人
+            promoted = waitlist.promote(offering)
+            if promoted:
+                offering.save(update_fields=['current_students', 'status', 'updated_at'])
+                publish_seat_change(offering)
+                if any(promoted_enrollment.student_id == request.user.id for promoted_enrollment in promoted):
+                    print(f"{request.user.username} 候補遞補成功: {offering.course.course_name}")
+                    return Response({'message': '選課成功'})
+            
+            # 檢查是否已選課（退選過的紀錄沿用同一筆）
+            enrollment = Enrollment.for_student(request.user, offering)
+            if enrollment.status == 'enrolled':
+                return Response({'error': '已經選過這門課'}, status=400)
+            if enrollment.status != 'dropped':
+                return Response({'error': '已經修過這門課'}, status=400)
+            
+            # 檢查時段衝突
+            has_conflict, conflict_msg = enrollment.check_time_conflict()
+            if has_conflict:
+                return Response({'error': conflict_msg}, status=400)
+            
+            # 額滿時加入候補，有人退選時依順序自動遞補
+            if offering.is_full():
+                entry = waitlist.join(request.user, offering)
+                position = waitlist.position(entry)
+                print(f"{request.user.username} 候補: {offering.course.course_name} 第 {position} 位")
+                return Response({
+                    'message': f'課程已額滿，已加入候補（第 {position} 位）',
+                    'waitlisted': True,
+                    'position': position,
+                }, status=202)
+            
+            # 建立選課記錄
+            enrollment.activate()
+            waitlist.cancel(request.user, offering)
+            
+            # 更新目前人數
+            offering.current_students += 1
+            if offering.current_students >= offering.max_students:
+                offering.status = 'full'
+            # 只更新名額欄位（搜尋索引不必重建）
+            offering.save(update_fields=['current_students', 'status', 'updated_at'])
+            publish_seat_change(offering)
         
         print(f"{request.user.username} 選課成功: {offering.course.course_name}")
         return Response({'message': '選課成功'})
@@ -212,7 +471,10 @@ def enroll_course(request, course_id):
         return Response({'error': str(e)}, status=500)
 
 
+@admission_control('enrollment')
 @api_view(['POST'])
+@throttle_classes([EnrollThrottle])
+@idempotent
 def drop_course(request, course_id):
     """退選"""
     try:
@@ -224,27 +486,35 @@ def drop_course(request, course_id):
         if not offering_id:
             return Response({'error': '缺少開課 ID'}, status=400)
         
-        try:
-            enrollment = Enrollment.objects.get(
+        with transaction.atomic():
+            # 先鎖開課再讀選課紀錄（和選課相同的上鎖順序）
+            offering = CourseOffering.objects.select_for_update().select_related('course').filter(id=offering_id).first()
+            enrollment = Enrollment.objects.filter(
                 student=request.user,
-                offering_id=offering_id,
+                offering=offering,
                 status='enrolled'
-            )
-        except Enrollment.DoesNotExist:
-            return Response({'error': '找不到選課記錄'}, status=404)
-        
-        offering = enrollment.offering
-        
-        # 更新狀態
-        enrollment.status = 'dropped'
-        enrollment.save()
-        
-        # 更新目前人數
-        offering.current_students = max(0, offering.current_students - 1)
-        if offering.status == 'full':
-            offering.status = 'open'
-        offering.save()
-        
+            ).first() if offering else None
+            if enrollment is None:
+                # 還在候補中時改為取消候補
+                if offering and waitlist.cancel(request.user, offering):
+                    print(f"{request.user.username} 取消候補: {offering.course.course_name}")
+                    return Response({'message': '已取消候補'})
+                return Response({'error': '找不到選課記錄'}, status=404)
+            
+            # 更新狀態
+            enrollment.status = 'dropped'
+            enrollment.save()
+            
+            # 更新目前人數，空出的名額依候補順序遞補
+            offering.current_students = max(0, offering.current_students - 1)
+            if offering.status == 'full':
+                offering.status = 'open'
+            promoted = waitlist.promote(offering)
+            offering.save(update_fields=['current_students', 'status', 'updated_at'])
+            publish_seat_change(offering)
+        
+        for promoted_enrollment in promoted:
+            print(f"{promoted_enrollment.student.username} 候補遞補成功: {offering.course.course_name}")
         print(f"{request.user.username} 退選成功: {offering.course.course_name}")
         return Response({'message': '退選成功'})
         
@@ -255,6 +525,83 @@ def drop_course(request, course_id):
         return Response({'error': str(e)}, status=500)
 
 
+@api_view(['GET'])
+def get_waitlist_position(request, course_id):
+    """查詢自己在這門課的候補順位（額滿時選課會自動加入候補，退選即取消候補）"""
+    try:
+        if not request.user.is_authenticated:
+            return Response({'error': '請先登入'}, status=401)
+
+        entry = WaitlistEntry.objects.filter(student=request.user, offering_id=course_id).first()
+        if entry is None:
+            return Response({'error': '沒有這門課的候補紀錄'}, status=404)
+
+        return Response({
+            'offering_id': entry.offering_id,
+            'status': entry.status,
+            'position': waitlist.position(entry),
+            'waiting': WaitlistEntry.objects.filter(offering_id=entry.offering_id, status='waiting').count(),
+            'joined_at': entry.joined_at.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
+    except Exception as e:
+        print(f"查詢候補順位錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET', 'POST'])
+def course_preferences(request):
+    """
+    志願分發的志願序
+    GET: 查詢自己這學期的志願與分發結果
+    POST: {academic_year, semester, offering_ids: [依優先順序]}，整份取代原本的志願
+    """
+    try:
+        if not request.user.is_authenticated:
+            return Response({'error': '請先登入'}, status=401)
+
+        params = request.data if request.method == 'POST' else request.GET
+        academic_year = params.get('academic_year', '114')
+        semester = params.get('semester', '1')
+
+        allocation_round = AllocationRound.objects.filter(academic_year=academic_year, semester=semester).first()
+        if allocation_round is None:
+            return Response({'error': '本學期沒有志願分發'}, status=404)
+
+        if request.method == 'POST':
+            count = allocation.submit_preferences(allocation_round, request.user, params.get('offering_ids') or [])
+            print(f"{request.user.username} 送出志願: {count} 個")
+
+        preferences = CoursePreference.objects.filter(
+            allocation_round=allocation_round, student=request.user
+        ).select_related('offering__course')
+        return Response({
+            'status': allocation_round.status,
+            'opens_at': allocation_round.opens_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'closes_at': allocation_round.closes_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'accepting': allocation_round.is_accepting(),
+            'preferences': [
+                {
+                    'rank': preference.rank,
+                    'offering_id': preference.offering_id,
+                    'course_name': preference.offering.course.course_name,
+                    'result': preference.result,
+                }
+                for preference in preferences
+            ],
+        })
+
+    except allocation.AllocationError as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"志願分發錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
 @api_view(['GET'])
 def get_enrolled_courses(request):
     """取得已選課程"""
@@ -270,66 +617,29 @@ def get_enrolled_courses(request):
         
         print(f"取得 {request.user.username} 的選課記錄 (學年度: {academic_year}, 學期: {semester})")
         
-        enrollments = Enrollment.objects.filter(
-            student=request.user,
-            status='enrolled',
-            offering__academic_year=academic_year,
-            offering__semester=semester
-        ).select_related(
-            'offering__course',
-            'offering__department'
-        ).prefetch_related(
-            'offering__offering_teachers__teacher__profile',
-            'offering__class_times'
+        fields = parse_fields(request.GET.get('fields', ''), ENROLLED_DEFAULT_FIELDS, extra_fields=['enrolled_at'])
+        
+        enrollments = apply_field_projection(
+            Enrollment.objects.filter(
+                student=request.user,
+                status='enrolled',
+                offering__academic_year=academic_year,
+                offering__semester=semester
+            ),
+            fields, prefix='offering', extra_only=['enrolled_at']
         )
         
         courses_data = []
         for enrollment in enrollments:
-            offering = enrollment.offering
-            
-            # 取得上課時段
-            class_times = offering.class_times.all()
-            times_data = []
-            for ct in class_times:
-                times_data.append({
-                    'weekday': ct.weekday,
-                    'weekday_display': ct.get_weekday_display(),
-                    'start_period': ct.start_period,
-                    'end_period': ct.end_period,
-                    'classroom': ct.classroom
-                })
-            
-            # 取得所有教師
-            teachers = offering.offering_teachers.all()
-            teachers_data = []
-            for ot in teachers:
-                teacher_name = ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
-                teachers_data.append({
-                    'id': ot.teacher.id,
-                    'name': teacher_name,
-                    'role': ot.role,
-                })
-            
-            # 取得主教師
-            main_teacher = offering.offering_teachers.filter(role='main').first()
-            teacher_name = main_teacher.teacher.profile.real_name if main_teacher and hasattr(main_teacher.teacher, 'profile') else '未設定'
-            
-            courses_data.append({
-                'id': offering.id,
-                'course_code': offering.course.course_code,
-                'course_name': offering.course.course_name,
-                'course_type': offering.course.course_type,
-                'course_type_display': offering.course.get_course_type_display(),
-                'credits': offering.course.credits,
-                'teacher_name': teacher_name,
-                'teachers': teachers_data,
-                'class_times': times_data,
-                'enrolled_at': enrollment.enrolled_at.strftime('%Y-%m-%d %H:%M:%S'),
-            })
+            courses_data.append(serialize_offering(enrollment.offering, fields, extras={
+                'enrolled_at': lambda: enrollment.enrolled_at.strftime('%Y-%m-%d %H:%M:%S'),
+            }))
         
         print(f"找到 {len(courses_data)} 門已選課程")
         return Response(courses_data)
         
+    except InvalidFieldsRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         print(f"錯誤: {str(e)}")
         import traceback
@@ -338,6 +648,8 @@ def get_enrolled_courses(request):
 
 
 @api_view(['POST'])
+@throttle_classes([FavoriteThrottle])
+@idempotent
 def toggle_favorite(request, course_id):
     """收藏/取消收藏課程"""
     try:
@@ -386,79 +698,134 @@ def get_favorite_courses(request):
         if not request.user.is_authenticated:
             return Response({'error': '請先登入'}, status=401)
         
-        favorites = FavoriteCourse.objects.filter(
-            student=request.user
-        ).select_related(
-            'offering__course',
-            'offering__department'
-        ).prefetch_related(
-            'offering__offering_teachers__teacher__profile',
-            'offering__class_times'
+        fields = parse_fields(request.GET.get('fields', ''), FAVORITE_DEFAULT_FIELDS, extra_fields=['favorited_at'])
+        
+        favorites = apply_field_projection(
+            FavoriteCourse.objects.filter(student=request.user),
+            fields, prefix='offering', extra_only=['created_at']
         )
         
         courses_data = []
         for favorite in favorites:
-            offering = favorite.offering
-            
-            # 取得上課時段
-            class_times = offering.class_times.all()
-            times_data = []
-            for ct in class_times:
-                times_data.append({
-                    'weekday': ct.weekday,
-                    'weekday_display': ct.get_weekday_display(),
-                    'start_period': ct.start_period,
-                    'end_period': ct.end_period,
-                    'classroom': ct.classroom
-                })
-            
-            # 取得所有教師
-            teachers = offering.offering_teachers.all()
-            teachers_data = []
-            for ot in teachers:
-                teacher_name = ot.teacher.profile.real_name if hasattr(ot.teacher, 'profile') else ot.teacher.username
-                teachers_data.append({
-                    'id': ot.teacher.id,
-                    'name': teacher_name,
-                    'role': ot.role,
-                    'role_display': ot.get_role_display()
-                })
-            
-            # 取得主教師
-            main_teacher = offering.offering_teachers.filter(role='main').first()
-            teacher_name = main_teacher.teacher.profile.real_name if main_teacher and hasattr(main_teacher.teacher, 'profile') else '未設定'
-            
-            courses_data.append({
-                'id': offering.id,
-                'course_code': offering.course.course_code,
-                'course_name': offering.course.course_name,
-                'course_type': offering.course.course_type,
-                'course_type_display': offering.course.get_course_type_display(),
-                'credits': offering.course.credits,
-                'description': offering.course.description,
-                'academic_year': offering.academic_year,
-                'semester': offering.semester,
-                'semester_display': offering.get_semester_display(),
-                'department': offering.department.name,
-                'grade_level': offering.grade_level,
-                'teacher_name': teacher_name,
-                'teachers': teachers_data,
-                'class_times': times_data,
-                'max_students': offering.max_students,
-                'current_students': offering.current_students,
-                'status': offering.status,
-                'status_display': offering.get_status_display(),
-                'is_favorited': True,  # 收藏列表中的課程當然都是已收藏
-                'favorited_at': favorite.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            })
+            courses_data.append(serialize_offering(favorite.offering, fields, extras={
+                'is_favorited': lambda: True,  # 收藏列表中的課程當然都是已收藏
+                'favorited_at': lambda: favorite.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            }))
         
         return Response(courses_data)
         
+    except InvalidFieldsRequest as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         print(f"錯誤: {str(e)}")
         return Response({'error': str(e)}, status=500)
 
 
+@api_view(['POST'])
+def plan_timetables(request):
+    """
+    排課規劃：列出不衝堂、學分在範圍內的前幾個課表
+    參數（JSON）：
+      academic_year、semester：學年度、學期（semester 必填）
+      offering_ids：候選開課（預設為這學期收藏的開課）
+      required_courses：必選課程代碼（各班級擇一，不必先收藏）
+      min_credits、max_credits：學分範圍（含已選課程）
+      limit：最多幾個課表（預設 5，最多 20）
+      time_budget：搜尋時間上限（秒，不超過 PLANNER_TIME_BUDGET）
+    這學期已選的課程固定排入；搜尋在 worker pool 中執行（見 planner.py）
+    """
+    try:
+        if not request.user.is_authenticated:
+            return Response({'error': '請先登入'}, status=401)
+        
+        academic_year = str(request.data.get('academic_year', '114'))
+        semester = str(request.data.get('semester', '')).strip()
+        if not semester:
+            return Response({'error': '缺少學期'}, status=400)
+        
+        try:
+            min_credits = int(request.data.get('min_credits', 0))
+            max_credits = int(request.data.get('max_credits', settings.PLANNER_MAX_CREDITS))
+            limit = min(max(int(request.data.get('limit', 5)), 1), 20)
+            time_budget = min(float(request.data.get('time_budget', settings.PLANNER_TIME_BUDGET)),
+                              settings.PLANNER_TIME_BUDGET)
+            offering_ids = [int(i) for i in request.data.get('offering_ids') or []]
+        except (TypeError, ValueError):
+            return Response({'error': '學分、limit、time_budget、offering_ids 必須是數字'}, status=400)
+        if min_credits > max_credits:
+            return Response({'error': '學分下限不可大於上限'}, status=400)
+        
+        required_codes = {str(code).strip() for code in request.data.get('required_courses') or [] if str(code).strip()}
+        fields = parse_fields(request.data.get('fields', ''), PLANNER_DEFAULT_FIELDS)
+        
+        if not offering_ids:
+            offering_ids = list(FavoriteCourse.objects.filter(student=request.user).values_list('offering_id', flat=True))
+        enrolled_ids = set(Enrollment.objects.filter(
+            student=request.user, status='enrolled',
+            offering__academic_year=academic_year, offering__semester=semester
+        ).values_list('offering_id', flat=True))
+        
+        # 候選開課的時段與學分直接取自搜尋文件，不必再查 ClassTime
+        rows = OfferingSearchDocument.objects.filter(
+            academic_year=academic_year, semester=semester
+        ).filter(
+            Q(offering_id__in=enrolled_ids) |
+            (Q(offering_id__in=offering_ids) | Q(offering__course__course_code__in=required_codes)) & Q(status='open')
+        ).values_list(
+            'offering_id', 'offering__course_id', 'offering__course__course_code',
+            'credits', 'slots_mon_thu', 'slots_fri_sun'
+        )
+        
+        fixed_mask = fixed_credits = 0
+        enrolled_courses = set()
+        sections = {}
+        for offering_id, course_id, course_code, credits, low, high in rows:
+            mask = timeslots.join_mask(low, high)
+            if offering_id in enrolled_ids:
+                fixed_mask |= mask
+                fixed_credits += credits
+                enrolled_courses.add(course_code)
+            else:
+                sections.setdefault((course_id, course_code, credits), []).append((offering_id, mask))
+        
+        missing = required_codes - enrolled_courses - {code for _, code, _ in sections}
+        if missing:
+            return Response({'error': f'這學期沒有可選的班級: {", ".join(sorted(missing))}'}, status=400)
+        
+        groups = [
+            (course_id, credits, course_code in required_codes, course_sections)
+            for (course_id, course_code, credits), course_sections in sections.items()
+            if course_code not in enrolled_courses
+        ]
+        if sum(len(group[3]) for group in groups) > settings.PLANNER_MAX_CANDIDATES:
+            return Response({'error': f'候選開課最多 {settings.PLANNER_MAX_CANDIDATES} 個'}, status=400)
+        
+        try:
+            result = planner.run(groups, min_credits, max_credits, limit, time_budget, fixed_mask, fixed_credits)
+        except FuturesTimeoutError:
+            return Response({'error': '排課系統忙碌中，請稍後再試'}, status=503)
+        
+        # 課表只列開課 ID，開課資料統一放在 offerings（已選課程也一併列出）
+        used_ids = enrolled_ids.union(*(timetable['offering_ids'] for timetable in result['timetables']))
+        offerings = apply_field_projection(CourseOffering.objects.filter(id__in=used_ids), fields)
+        
+        return Response({
+            'timetables': result['timetables'],
+            'enrolled_offering_ids': sorted(enrolled_ids),
+            'offerings': [serialize_offering(offering, fields) for offering in offerings],
+            'complete': result['complete'],
+            'explored': result['explored'],
+        })
+        
+    except InvalidFieldsRequest as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"排課規劃錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+
 @api_view(['POST'])
 def import_courses_excel(request):
     """從 Excel 匯入課程"""
@@ -536,61 +903,71 @@ def import_courses_excel(request):
 def get_filter_options(request):
     """取得篩選選項（系所、學期等）"""
     try:
-        from .models import Department
-        
-        # 取得所有系所
-        departments = Department.objects.all().values_list('name', flat=True).distinct()
-        
-        # 取得所有學年度
-        academic_years = CourseOffering.objects.values_list('academic_year', flat=True).distinct().order_by('-academic_year')
-        
-        # 學期選項
-        semesters = [
-            {'value': '1', 'label': '上學期'},
-            {'value': '2', 'label': '下學期'},
-        ]
-        
-        # 課程類別選項
-        course_types = [
-            {'value': 'required', 'label': '必修'},
-            {'value': 'elective', 'label': '選修'},
-            {'value': 'general_required', 'label': '通識(必修)'},
-            {'value': 'general_elective', 'label': '通識(選修)'},
-        ]
-        
-        # 星期選項
-        weekdays = [
-            {'value': '1', 'label': '星期一'},
-            {'value': '2', 'label': '星期二'},
-            {'value': '3', 'label': '星期三'},
-            {'value': '4', 'label': '星期四'},
-            {'value': '5', 'label': '星期五'},
-            {'value': '6', 'label': '星期六'},
-            {'value': '7', 'label': '星期日'},
-        ]
-        
-        # 年級選項
-        grades = [
-            {'value': '1', 'label': '一年級'},
-            {'value': '2', 'label': '二年級'},
-            {'value': '3', 'label': '三年級'},
-            {'value': '4', 'label': '四年級'},
-        ]
-        
-        return Response({
-            'departments': list(departments),
-            'academic_years': list(academic_years),
-            'semesters': semesters,
-            'course_types': course_types,
-            'weekdays': weekdays,
-            'grades': grades,
-        })
+        return cached_catalog_response(request, 'filter_options', _filter_options_payload)
         
     except Exception as e:
         print(f"取得篩選選項錯誤: {str(e)}")
         return Response({'error': str(e)}, status=500)
 
 
+def _filter_options_payload():
+    """組出篩選選項資料"""
+    from .models import Department
+    
+    # 取得所有系所
+    departments = Department.objects.all().values_list('name', flat=True).distinct()
+    
+    # 取得所有學年度
+    academic_years = CourseOffering.objects.values_list('academic_year', flat=True).distinct().order_by('-academic_year')
+    
+    return _filter_options_data(list(departments), list(academic_years))
+
+
+def _filter_options_data(departments, academic_years):
+    """組合查得的系所、學年度與固定的選項（同步與非同步版本共用）"""
+    # 學期選項
+    semesters = [
+        {'value': '1', 'label': '上學期'},
+        {'value': '2', 'label': '下學期'},
+    ]
+    
+    # 課程類別選項
+    course_types = [
+        {'value': 'required', 'label': '必修'},
+        {'value': 'elective', 'label': '選修'},
+        {'value': 'general_required', 'label': '通識(必修)'},
+        {'value': 'general_elective', 'label': '通識(選修)'},
+    ]
+    
+    # 星期選項
+    weekdays = [
+        {'value': '1', 'label': '星期一'},
+        {'value': '2', 'label': '星期二'},
+        {'value': '3', 'label': '星期三'},
+        {'value': '4', 'label': '星期四'},
+        {'value': '5', 'label': '星期五'},
+        {'value': '6', 'label': '星期六'},
+        {'value': '7', 'label': '星期日'},
+    ]
+    
+    # 年級選項
+    grades = [
+        {'value': '1', 'label': '一年級'},
+        {'value': '2', 'label': '二年級'},
+        {'value': '3', 'label': '三年級'},
+        {'value': '4', 'label': '四年級'},
+    ]
+    
+    return {
+        'departments': departments,
+        'academic_years': academic_years,
+        'semesters': semesters,
+        'course_types': course_types,
+        'weekdays': weekdays,
+        'grades': grades,
+    }
+
+
 @api_view(['GET'])
 def get_course_detail(request, course_id):
     """取得單一課程詳細資料（用於編輯）"""
@@ -647,6 +1024,35 @@ def update_course(request, course_id):
         offering = CourseOffering.objects.select_related('course').get(id=course_id)
         course = offering.course
         
+        # 上課時段
+        classroom = request.data.get('classroom')
+        weekday = request.data.get('weekday')
+        start_period = request.data.get('start_period')
+        end_period = request.data.get('end_period')
+        
+        # 修改上課時段或授課教師時，檢查教室與教師在這些時段是否已有課（排除這門課原本的時段），一次回傳所有衝突
+        teacher_id = request.data.get('teacher_id')
+        time_changed = all([classroom, weekday, start_period, end_period])
+        if time_changed or teacher_id:
+            academic_year = request.data.get('academic_year', offering.academic_year)
+            semester = request.data.get('semester', offering.semester)
+            if teacher_id:
+                teachers = [User.objects.filter(id=teacher_id).select_related('profile').first()]
+            else:
+                teachers = [ot.teacher for ot in offering.offering_teachers.select_related('teacher__profile')]
+            if time_changed:
+                slots = [(classroom, weekday, start_period, end_period)]
+            else:
+                slots = offering.class_times.values_list('classroom', 'weekday', 'start_period', 'end_period')
+            conflicts = []
+            for slot_classroom, slot_weekday, slot_start, slot_end in slots:
+                conflicts += check_class_time(
+                    slot_classroom, teachers, academic_year, semester, slot_weekday, slot_start, slot_end,
+                    exclude_offering_id=offering.id
+                )
+            if conflicts:
+                return Response(conflict_response_data(conflicts), status=400)
+        
         # 更新課程基本資料
         course.course_code = request.data.get('course_code', course.course_code)
         course.course_name = request.data.get('course_name', course.course_name)
@@ -655,23 +1061,33 @@ def update_course(request, course_id):
         course.credits = request.data.get('credits', course.credits)
         course.save()
         
-        # 更新開課資料
-        offering.academic_year = request.data.get('academic_year', offering.academic_year)
-        offering.semester = request.data.get('semester', offering.semester)
-        offering.grade_level = request.data.get('grade_level', offering.grade_level)
-        offering.max_students = request.data.get('max_students', offering.max_students)
-        
         # 更新系所
         from .models import Department
         department_name = request.data.get('department')
+        department = None
         if department_name:
             department, _ = Department.objects.get_or_create(name=department_name)
-            offering.department = department
         
-        offering.save()
+        # 更新開課資料並依候補順序遞補（調高名額時），兩者在同一個交易中、鎖定這筆開課：
+        # 存檔不會以鎖定前讀到的人數蓋掉同時進行的選課，也不會存了新名額卻沒有遞補
+        with transaction.atomic():
+            offering = CourseOffering.objects.select_for_update().select_related('course').get(id=offering.id)
+            seats = (offering.current_students, offering.max_students, offering.status)
+            offering.academic_year = request.data.get('academic_year', offering.academic_year)
+            offering.semester = request.data.get('semester', offering.semester)
+            offering.grade_level = request.data.get('grade_level', offering.grade_level)
+            offering.max_students = int(request.data.get('max_students', offering.max_students))
+            if department is not None:
+                offering.department = department
+            
+            if offering.status == 'full' and not offering.is_full():
+                offering.status = 'open'
+            waitlist.promote(offering)
+            offering.save()
+            if (offering.current_students, offering.max_students, offering.status) != seats:
+                publish_seat_change(offering)
         
         # 更新教師
-        teacher_id = request.data.get('teacher_id')
         if teacher_id:
             from .models import OfferingTeacher
             # 刪除舊的教師關係
@@ -685,11 +1101,6 @@ def update_course(request, course_id):
             )
         
         # 更新上課時段
-        classroom = request.data.get('classroom')
-        weekday = request.data.get('weekday')
-        start_period = request.data.get('start_period')
-        end_period = request.data.get('end_period')
-        
         if all([classroom, weekday, start_period, end_period]):
             from .models import ClassTime
             # 刪除舊的時段
@@ -784,4 +1195,43 @@ def my_teaching_courses(request):
         print(f"取得授課列表失敗: {str(e)}")
         import traceback
         traceback.print_exc()
-        return Response({'error': str(e)}, status=500)
\ No newline at end of file
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def export_enrollments(request):
+    """
+    匯出選課名單（背景工作，完成後由 jobs/<id>/download/ 下載 CSV）
+    參數：academic_year、semester、offering_id（選填）；管理員可匯出整個學期，教師只能匯出自己授課的開課
+    """
+    try:
+        if not request.user.is_authenticated:
+            return Response({'error': '請先登入'}, status=401)
+        
+        offering_id = request.data.get('offering_id')
+        if offering_id:
+            offering = CourseOffering.objects.filter(id=offering_id).first()
+            if offering is None:
+                return Response({'error': '找不到該課程'}, status=404)
+            academic_year, semester = offering.academic_year, offering.semester
+            if not _is_admin(request.user) and not offering.offering_teachers.filter(teacher=request.user).exists():
+                return Response({'error': '權限不足'}, status=403)
+            params = {'academic_year': academic_year, 'semester': semester, 'offering_id': offering.id}
+        else:
+            if not _is_admin(request.user):
+                return Response({'error': '權限不足'}, status=403)
+            academic_year = request.data.get('academic_year')
+            semester = request.data.get('semester')
+            if not academic_year or not semester:
+                return Response({'error': '缺少學年度或學期'}, status=400)
+            params = {'academic_year': str(academic_year), 'semester': str(semester)}
+        
+        job = jobs.submit('export_enrollments', params, user=request.user)
+        print(f"{request.user.username} 匯出選課名單（背景工作 #{job.id}）")
+        return jobs.accepted_response(job)
+        
+    except Exception as e:
+        print(f"匯出選課名單錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+即時推播相關的 views（需透過 ASGI 執行，見 backend/asgi.py）
+以 Server-Sent Events 串流訂閱開課的目前人數與開課狀態
+"""
+import asyncio
+import json
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .models import CourseOffering
+from .pubsub import get_broker, SEAT_FIELDS
+
+
+def _format_event(event):
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f"event: seat\ndata: {data}\n\n"
+
+
+async def _seat_event_stream(broker, subscription, snapshot):
+    try:
+        # 斷線後瀏覽器 3 秒後自動重連
+        yield "retry: 3000\n\n"
+
+        # 先送出目前狀態，之後只送異動
+        for event in snapshot:
+            yield _format_event(event)
+
+        while True:
+            events = await subscription.get(timeout=settings.SEAT_STREAM_HEARTBEAT)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield _format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def seat_stream(request):
+    """
+    訂閱開課名額異動（SSE）
+    參數：offering_ids=1,2,3（亦可重複 offering_ids 參數）
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': '只支援 GET'}, status=405)
+
+    raw_ids = []
+    for value in request.GET.getlist('offering_ids'):
+        raw_ids.extend(value.split(','))
+
+    try:
+        offering_ids = {int(value) for value in raw_ids if value.strip()}
+    except ValueError:
+        return JsonResponse({'error': 'offering_ids 必須是整數'}, status=400)
+
+    if not offering_ids:
+        return JsonResponse({'error': '請提供 offering_ids'}, status=400)
+
+    if len(offering_ids) > settings.SEAT_STREAM_MAX_OFFERINGS:
+        return JsonResponse({'error': f'一次最多訂閱 {settings.SEAT_STREAM_MAX_OFFERINGS} 門課程'}, status=400)
+
+    # 先訂閱再讀目前狀態，避免漏掉中間的異動
+    broker = get_broker()
+    subscription = broker.subscribe(offering_ids, asyncio.get_running_loop())
+
+    # 串流開始前出錯時產生器不會執行，必須在這裡取消訂閱
+    try:
+        snapshot = []
+        async for row in CourseOffering.objects.filter(id__in=offering_ids).values(*SEAT_FIELDS):
+            snapshot.append({
+                'offering_id': row['id'],
+                'current_students': row['current_students'],
+                'max_students': row['max_students'],
+                'status': row['status'],
+            })
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+
+    response = StreamingHttpResponse(
+        _seat_event_stream(broker, subscription, snapshot),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 避免反向代理緩衝串流
+    return response
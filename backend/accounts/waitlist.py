@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+候補名單（WaitlistEntry）
+課程額滿時選課改為加入候補，名額空出時（退選、調高名額、人數校正）在同一個交易中依加入順序遞補；
+有空位時的選課也先遞補候補中的學生，後來的人不能插隊：
+- 跳過已選上、或和已選課程衝堂的學生（衝堂的保留順位，之後退掉衝堂課程仍可遞補）
+- 呼叫端需先以 select_for_update 鎖住開課，名額的判斷與更新才不會和其他選課、退選交錯
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Enrollment, WaitlistEntry
+
+
+def join(student, offering):
+    """加入候補（已在候補中則維持原本的順位），回傳候補紀錄"""
+    entry, created = WaitlistEntry.objects.get_or_create(student=student, offering=offering)
+    if not created and entry.status != 'waiting':
+        entry.status = 'waiting'
+        entry.joined_at = timezone.now()
+        entry.save(update_fields=['status', 'joined_at', 'updated_at'])
+    return entry
+
+
+def cancel(student, offering):
+    """取消候補，回傳是否有取消"""
+    return WaitlistEntry.objects.filter(
+        student=student, offering=offering, status='waiting'
+    ).update(status='cancelled', updated_at=timezone.now()) > 0
+
+
+def position(entry):
+    """候補順位（從 1 開始）；不在候補中時回傳 None"""
+    if entry.status != 'waiting':
+        return None
+    ahead = WaitlistEntry.objects.filter(offering_id=entry.offering_id, status='waiting').filter(
+        Q(joined_at__lt=entry.joined_at) | Q(joined_at=entry.joined_at, id__lt=entry.id)
+    )
+    return ahead.count() + 1
+
+
+def promote(offering):
+    """
+    依候補順序補滿空出的名額，回傳遞補成功的選課紀錄
+    只更新記憶體中 offering 的 current_students、status，由呼叫端存檔並發佈名額異動
+    """
+    promoted = []
+    if offering.is_full():
+        return promoted
+
+    entries = WaitlistEntry.objects.select_for_update(of=('self',)).filter(
+        offering=offering, status='waiting'
+    ).select_related('student').order_by('joined_at', 'id')
+    for entry in entries:
+        if offering.is_full():
+            break
+
+        enrollment = Enrollment.for_student(entry.student, offering)
+        if enrollment.status != 'dropped':
+            # 已經選上（或修過）這門課，不需要再候補
+            entry.status = 'cancelled'
+            entry.save(update_fields=['status', 'updated_at'])
+            continue
+
+        enrollment.offering = offering
+        has_conflict, _ = enrollment.check_time_conflict()
+        if has_conflict:
+            continue
+
+        enrollment.activate()
+        entry.status = 'promoted'
+        entry.save(update_fields=['status', 'updated_at'])
+        offering.current_students += 1
+        promoted.append(enrollment)
+
+    if offering.is_full():
+        offering.status = 'full'
+    return promoted
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+名額即時推播（/api/courses/seats/stream/）等串流端點需透過 ASGI 伺服器執行，例如：
+    uvicorn backend.asgi:application
 """
 
 import os
@@ -14,3 +17,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# 啟動時先建立搜尋框自動完成索引、載入 BM25 索引檔（見 accounts/autocomplete.py、bm25.py）
+from accounts import autocomplete, bm25  # noqa: E402
+
+autocomplete.warm_up()
+bm25.warm_up()
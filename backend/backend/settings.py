@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 # ===== 修改 4: 添加 WhiteNoise 中間件 =====
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'accounts.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,10 +84,12 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'X-CSRFToken',
     'x-requested-with',
+    'x-queue-token',
+    'idempotency-key',
 ]
 
 # ✅ 新增：暴露給前端的 headers
-CORS_EXPOSE_HEADERS = ['X-CSRFToken']
+CORS_EXPOSE_HEADERS = ['X-CSRFToken', 'Retry-After', 'X-Queue-Token', 'Idempotent-Replayed']
 
 # ===== Session 設定（根據環境自動調整）=====
 if IS_PRODUCTION:
@@ -140,8 +143,140 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny', 
-    ]
+    ],
+    # 流量限制額度（accounts/throttling.py）：'<scope>' 每位使用者、'<scope>_ip' 每個 IP
+    'DEFAULT_THROTTLE_RATES': {
+        'search': '120/min',
+        'search_ip': '600/min',
+        'enroll': '30/min',
+        'enroll_ip': '300/min',
+        'favorite': '60/min',
+        'favorite_ip': '300/min',
+        'login': '10/min',
+        'login_ip': '30/min',
+    },
+    'EXCEPTION_HANDLER': 'accounts.throttling.exception_handler',
+}
+
+# ===== 流量限制（accounts/throttling.py）=====
+# 多個 worker 時改用 accounts.counters.CacheCounterStore 並設定共用的快取（Redis、Memcached）
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_COUNTER_STORE = os.environ.get('THROTTLE_COUNTER_STORE', 'accounts.counters.LocalCounterStore')
+THROTTLE_COUNTER_OPTIONS = {}
+
+# ===== Idempotency-Key（accounts/idempotency.py）=====
+# 選課、退選、收藏切換帶相同 Key 重送時，在 TTL 秒內重播第一次的結果
+# 多個 worker 時 CACHES['idempotency'] 需改用共用的快取（Redis、Memcached）
+IDEMPOTENCY_CACHE = 'idempotency'
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 3600))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# ===== 選課事件（accounts/enrollment_events.py）=====
+# consumer 名稱 -> 處理函式（收到一批依 id 排序的 EnrollmentEvent），由 consume_enrollment_events 執行
+ENROLLMENT_EVENT_CONSUMERS = {
+    'credit_summary': 'accounts.credits.consume_events',
+}
+ENROLLMENT_EVENT_BATCH_SIZE = int(os.environ.get('ENROLLMENT_EVENT_BATCH_SIZE', 500))
+ENROLLMENT_EVENT_SETTLE_SECONDS = 5  # 只處理建立超過幾秒的事件（等較早取號的交易提交）
+
+# ===== 背景工作（accounts/jobs.py）=====
+# 工作種類 -> 處理函式 handler(params, progress)，由 run_jobs 執行
+JOB_HANDLERS = {
+    'create_accounts': 'accounts.job_handlers.create_accounts',
+    'reset_passwords': 'accounts.job_handlers.reset_passwords',
+    'recompute_credits': 'accounts.job_handlers.recompute_credits',
+    'export_enrollments': 'accounts.job_handlers.export_enrollments',
+    'reconcile_seats': 'accounts.job_handlers.reconcile_seats',
+}
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # 每個 run_jobs 同時執行的工作數
+JOB_MAX_ATTEMPTS = 3  # 失敗時最多執行幾次
+JOB_RETRY_DELAY = 30  # 秒，第 n 次重試前等待 JOB_RETRY_DELAY * 2^(n-1) 秒
+JOB_HEARTBEAT_INTERVAL = 10  # 秒，worker 為執行中的工作寫入心跳的間隔（進度沒有變動時也至少這麼久寫入一次）
+JOB_STALE_SECONDS = 300  # 秒，執行中的工作超過這麼久沒有心跳或進度，視為 worker 中斷
+JOB_EXPORT_DIR = os.environ.get('JOB_EXPORT_DIR', str(BASE_DIR / 'var' / 'exports'))
+
+# ===== 列表分頁 =====
+# 帶 cursor 或 page_size 參數時才分頁，未指定 page_size 時使用預設值
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
+
+# ===== API 回應壓縮與目錄快取 =====
+# 超過此大小（bytes）的 API JSON 回應才壓縮；有安裝 brotli 時優先使用 br
+API_COMPRESSION_MIN_SIZE = int(os.environ.get('API_COMPRESSION_MIN_SIZE', 1024))
+API_COMPRESSION_PATH_PREFIX = '/api/'
+
+# 目錄快取以版本號失效，逾時只是保底；快取內容各 process 各自保存，
+# 版本號存在資料庫（accounts.CacheVersion），多個 worker 不需共用的快取也會一起失效
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 600))
+
+# 增量同步（accounts/catalog_sync.py）只交出建立超過幾秒的異動版本號（等較早取號的交易提交）
+CATALOG_CHANGE_SETTLE_SECONDS = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'course-system',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 2000)),
+        },
+    },
+    # Idempotency-Key 的結果（accounts/idempotency.py），與目錄快取分開，不會互相擠掉
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'course-system-idempotency',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 20000)),
+        },
+    },
+}
+
+# ===== 課程全文搜尋 =====
+# SQLite 使用 FTS5、PostgreSQL 使用 tsvector；設為 False 時關鍵字搜尋改回 icontains
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'True') == 'True'
+
+# sort=relevance 使用的 BM25 索引檔（各 worker 以 mmap 開啟）
+BM25_INDEX_PATH = os.environ.get('BM25_INDEX_PATH', str(BASE_DIR / 'var' / 'bm25.idx'))
+BM25_RELOAD_INTERVAL = 30  # 秒，檢查索引檔是否被其他 worker 更新
+BM25_REBUILD_INTERVAL = 60  # 秒，課程文字異動後重建索引檔的最短間隔
+
+# 自動完成索引（accounts/autocomplete.py，各 process 記憶體中）
+AUTOCOMPLETE_REBUILD_INTERVAL = 30  # 秒，多久在背景檢查一次課程文字是否異動
+AUTOCOMPLETE_MAX_AGE = 600  # 秒，沒有文字異動時也定期重建，更新依選課人數排序的熱門程度
+
+# ===== 排課規劃（accounts/planner.py）=====
+PLANNER_WORKERS = int(os.environ.get('PLANNER_WORKERS', 2))  # 搜尋課表的 worker process 數
+PLANNER_TIME_BUDGET = 2.0  # 秒，單次搜尋的時間上限
+PLANNER_POOL_TIMEOUT = 5  # 秒，worker 都在忙時額外等待的時間
+PLANNER_MAX_CANDIDATES = 80  # 最多幾個候選開課
+PLANNER_MAX_CREDITS = 25  # 學分上限預設值
+
+# ===== 學期自動排課（accounts/scheduling.py）=====
+SCHEDULE_WEEKDAYS = [1, 2, 3, 4, 5]  # 可排課的星期
+SCHEDULE_LAST_PERIOD = 10  # 可排課的最後一節
+SCHEDULE_PREFERRED_PERIODS = range(2, 9)  # 偏好的節次，排在其他節次會增加成本
+SCHEDULE_TIME_LIMIT = 5.0  # 秒，API 單次排課的時間上限（管理指令可指定更長）
+
+# ===== 志願分發（accounts/allocation.py、accounts/lottery.py）=====
+ALLOCATION_MAX_PREFERENCES = 30  # 每位學生最多填寫幾個志願
+
+# ===== 選課排隊（accounts/admission.py）=====
+# 多個 worker 時改用 accounts.counters.CacheCounterStore 並設定共用的快取（Redis、Memcached）
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True') == 'True'
+ADMISSION_COUNTER_STORE = os.environ.get('ADMISSION_COUNTER_STORE', 'accounts.counters.LocalCounterStore')
+ADMISSION_COUNTER_OPTIONS = {}
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 20))  # 同時執行的選課、退選請求數
+ADMISSION_TOKEN_TTL = 600  # 秒，號碼牌有效時間
+ADMISSION_MAX_RETRY_AFTER = 30  # 秒，建議重試時間的上限
+
+# ===== 名額即時推播（SSE，需透過 ASGI 執行）=====
+# 預設輪詢 CatalogChange：選課由 WSGI worker 處理、串流在 ASGI process，也能互通
+# InProcessBackend 只在同一個 process 內轉發，僅適用發佈與訂閱都在同一個 process 的部署
+SEAT_PUBSUB_BACKEND = os.environ.get('SEAT_PUBSUB_BACKEND', 'accounts.pubsub.CatalogChangePollingBackend')
+SEAT_PUBSUB_OPTIONS = {
+    'interval': float(os.environ.get('SEAT_PUBSUB_POLL_INTERVAL', '1.0')),  # 秒，輪詢間隔
 }
+SEAT_STREAM_HEARTBEAT = 15  # 秒
+SEAT_STREAM_MAX_OFFERINGS = 200
 
 TEMPLATES = [
     {
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# 啟動時先建立搜尋框自動完成索引、載入 BM25 索引檔（見 accounts/autocomplete.py、bm25.py）
+from accounts import autocomplete, bm25  # noqa: E402
+
+autocomplete.warm_up()
+bm25.warm_up()
@@ -3,4 +3,11 @@ set -o errexit
 
 pip install -r requirements.txt
 python manage.py collectstatic --no-input
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py rebuild_search_index
+python manage.py rebuild_search_documents
+python manage.py rebuild_room_occupancy
+python manage.py rebuild_teacher_occupancy
+python manage.py rebuild_credit_summaries
+python manage.py build_bm25_index
+python manage.py compute_similar_courses